@@ -0,0 +1,315 @@
+# py2deb: Python to Debian package converter.
+#
+# Author: Peter Odding <peter.odding@paylogic.com>
+# Last Change: August 6, 2020
+# URL: https://py2deb.readthedocs.io
+
+"""
+The :mod:`py2deb.cache` module implements persistent caching of conversion results.
+
+The :class:`BuildCache` class stores converted package archives under a
+fingerprint of everything that affects the contents of the archive (refer to
+:attr:`.PackageToConvert.fingerprint`) so that unchanged packages don't need
+to be converted again, even when the repository directory is empty.
+
+The :class:`DependencyCache` class stores the system dependencies of object
+files (as reported by :man:`dpkg-shlibdeps`) under the SHA-256 digest of the
+object file, so that unchanged binaries don't need to be analyzed again.
+
+The :class:`LintianCache` class stores the reports of Lintian_ under the
+SHA-256 digest of the checked archive, so that unchanged archives don't need
+to be checked again.
+
+.. _Lintian: http://lintian.debian.org/
+"""
+
+# Standard library modules.
+import codecs
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# External dependencies.
+from property_manager import PropertyManager, clear_property, lazy_property, mutable_property, required_property
+
+# Modules included in our package.
+from py2deb.utils import link_or_copy
+
+# Initialize a logger.
+logger = logging.getLogger(__name__)
+
+
+class BuildCache(PropertyManager):
+
+    """
+    Content addressable cache of converted ``*.deb`` archives.
+
+    The cache directory contains a subdirectory for each fingerprint (nested
+    below a directory named after the first two characters of the fingerprint
+    to keep directory listings small) that contains a single ``*.deb`` archive.
+    Archives are hard linked into and out of the cache where possible, so cache
+    hits are almost free.
+    """
+
+    def __init__(self, directory):
+        """
+        Initialize a :class:`BuildCache` object.
+
+        :param directory: The pathname of the cache directory (a string).
+        """
+        super(BuildCache, self).__init__(directory=directory)
+
+    @required_property
+    def directory(self):
+        """The pathname of the directory where archives are cached (a string)."""
+
+    def get(self, fingerprint):
+        """
+        Look up the cached archive for a fingerprint.
+
+        :param fingerprint: The fingerprint of the converted package (a string).
+        :returns: The pathname of the cached ``*.deb`` archive (a string) or
+                  :data:`None` when the cache doesn't contain an archive with
+                  the given fingerprint.
+        """
+        entry_directory = self.get_entry_directory(fingerprint)
+        if os.path.isdir(entry_directory):
+            for filename in os.listdir(entry_directory):
+                if filename.endswith('.deb'):
+                    return os.path.join(entry_directory, filename)
+
+    def put(self, fingerprint, archive):
+        """
+        Add an archive to the cache.
+
+        :param fingerprint: The fingerprint of the converted package (a string).
+        :param archive: The pathname of a ``*.deb`` archive (a string).
+        :returns: The pathname of the cached archive (a string).
+        """
+        entry_directory = self.get_entry_directory(fingerprint)
+        if not os.path.isdir(entry_directory):
+            os.makedirs(entry_directory)
+        logger.debug("Adding %s to build cache (fingerprint %s) ..", archive, fingerprint)
+        return link_or_copy(archive, os.path.join(entry_directory, os.path.basename(archive)))
+
+    def get_entry_directory(self, fingerprint):
+        """
+        Get the directory where an archive with the given fingerprint is stored.
+
+        :param fingerprint: The fingerprint of the converted package (a string).
+        :returns: The pathname of a directory (a string).
+        """
+        return os.path.join(self.directory, fingerprint[:2], fingerprint)
+
+
+class DependencyCache(PropertyManager):
+
+    """
+    Persistent cache of the system dependencies of object files.
+
+    The cache is an SQLite_ database that maps the SHA-256 digest of an object
+    file and the target architecture to the Debian package relationships
+    reported by :man:`dpkg-shlibdeps`. The number of entries is bounded by
+    :attr:`max_entries`; the least recently used entries are evicted first.
+
+    The relationships reported by :man:`dpkg-shlibdeps` depend on the
+    packages installed on the build system (which provide the shared
+    libraries and their ``shlibs`` and ``symbols`` files), so the cache is
+    cleared when the dpkg status database changes (see :attr:`system_state`).
+
+    .. _SQLite: https://sqlite.org/
+    """
+
+    def __init__(self, filename, **options):
+        """
+        Initialize a :class:`DependencyCache` object.
+
+        :param filename: The pathname of the SQLite_ database (a string).
+        :param options: Any keyword arguments are used to set the value of
+                        :attr:`max_entries`.
+        """
+        super(DependencyCache, self).__init__(filename=filename, **options)
+
+    @lazy_property
+    def connection(self):
+        """
+        The connection to the SQLite_ database (a :class:`sqlite3.Connection` object).
+
+        The database (and the directory that contains it) is created when it
+        doesn't exist yet. When :attr:`system_state` differs from the value
+        recorded in the database all entries are removed.
+        """
+        directory = os.path.dirname(self.filename)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        connection = sqlite3.connect(self.filename, timeout=60, check_same_thread=False)
+        with connection:
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS dependencies (
+                    checksum TEXT NOT NULL,
+                    architecture TEXT NOT NULL,
+                    relationships TEXT NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (checksum, architecture)
+                )
+            ''')
+            connection.execute('CREATE TABLE IF NOT EXISTS properties (name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            row = connection.execute("SELECT value FROM properties WHERE name = 'system_state'").fetchone()
+            if not row or row[0] != self.system_state:
+                if row:
+                    logger.debug("Clearing dependency cache because the installed system packages changed: %s",
+                                 self.filename)
+                connection.execute('DELETE FROM dependencies')
+                connection.execute("INSERT OR REPLACE INTO properties (name, value) VALUES ('system_state', ?)",
+                                   (self.system_state,))
+        return connection
+
+    @required_property
+    def filename(self):
+        """The pathname of the SQLite_ database that contains the cache (a string)."""
+
+    @lazy_property
+    def lock(self):
+        """A lock that serializes access to :attr:`connection` (a :class:`threading.Lock` object)."""
+        return threading.Lock()
+
+    @mutable_property
+    def max_entries(self):
+        """The maximum number of cached object files (a positive integer, defaults to 10000)."""
+        return 10000
+
+    @lazy_property
+    def system_state(self):
+        """
+        A signature of the packages installed on the build system (a string).
+
+        This is based on the size and last modified time of the dpkg status
+        database (``/var/lib/dpkg/status``).
+        """
+        try:
+            stat = os.stat('/var/lib/dpkg/status')
+            return '%i:%r' % (stat.st_size, stat.st_mtime)
+        except EnvironmentError:
+            return ''
+
+    def get(self, checksum, architecture):
+        """
+        Get the cached system dependencies of an object file.
+
+        :param checksum: The SHA-256 digest of the object file (a string).
+        :param architecture: The Debian architecture of the package (a string).
+        :returns: A list of strings with Debian package relationships or
+                  :data:`None` when the object file isn't cached.
+        """
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                'SELECT relationships FROM dependencies WHERE checksum = ? AND architecture = ?',
+                (checksum, architecture),
+            ).fetchone()
+            if row:
+                self.connection.execute(
+                    'UPDATE dependencies SET last_used = ? WHERE checksum = ? AND architecture = ?',
+                    (time.time(), checksum, architecture),
+                )
+                return json.loads(row[0])
+
+    def put(self, checksum, architecture, relationships):
+        """
+        Add the system dependencies of an object file to the cache.
+
+        :param checksum: The SHA-256 digest of the object file (a string).
+        :param architecture: The Debian architecture of the package (a string).
+        :param relationships: A list of strings with Debian package relationships.
+
+        When the cache contains more than :attr:`max_entries` entries the least
+        recently used entries are removed.
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO dependencies (checksum, architecture, relationships, last_used) '
+                'VALUES (?, ?, ?, ?)',
+                (checksum, architecture, json.dumps(relationships), time.time()),
+            )
+            self.connection.execute(
+                'DELETE FROM dependencies WHERE rowid NOT IN '
+                '(SELECT rowid FROM dependencies ORDER BY last_used DESC LIMIT ?)',
+                (self.max_entries,),
+            )
+
+    def reset(self):
+        """
+        Forget the connection to the database.
+
+        Forked worker processes call this method because they mustn't use the
+        connection of the parent process. A new connection is opened the next
+        time the cache is used.
+        """
+        clear_property(self, 'connection')
+        clear_property(self, 'lock')
+
+
+class LintianCache(PropertyManager):
+
+    """
+    Content addressable cache of Lintian_ reports.
+
+    The cache directory contains a text file for each key (nested below a
+    directory named after the first two characters of the key, like
+    :class:`BuildCache`). Refer to :func:`.run_lintian_batch()` for how keys
+    are computed.
+    """
+
+    def __init__(self, directory):
+        """
+        Initialize a :class:`LintianCache` object.
+
+        :param directory: The pathname of the cache directory (a string).
+        """
+        super(LintianCache, self).__init__(directory=directory)
+
+    @required_property
+    def directory(self):
+        """The pathname of the directory where reports are cached (a string)."""
+
+    def get(self, key):
+        """
+        Get a cached Lintian report.
+
+        :param key: The key of the report (a string).
+        :returns: The output of Lintian (a string) or :data:`None` when the
+                  cache doesn't contain a report with the given key.
+        """
+        filename = self.get_filename(key)
+        if os.path.isfile(filename):
+            with codecs.open(filename, 'r', 'UTF-8') as handle:
+                return handle.read()
+
+    def put(self, key, report):
+        """
+        Add a Lintian report to the cache.
+
+        :param key: The key of the report (a string).
+        :param report: The output of Lintian (a string).
+        """
+        filename = self.get_filename(key)
+        directory = os.path.dirname(filename)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Write the report to a temporary file and rename it into place so
+        # that concurrent readers never see a partially written report.
+        with tempfile.NamedTemporaryFile(dir=directory, suffix='.tmp', delete=False) as handle:
+            handle.write(report.encode('UTF-8'))
+        os.rename(handle.name, filename)
+
+    def get_filename(self, key):
+        """
+        Get the pathname of the file where the report with the given key is stored.
+
+        :param key: The key of the report (a string).
+        :returns: The pathname of a file (a string).
+        """
+        return os.path.join(self.directory, key[:2], key + '.txt')
@@ -99,6 +99,163 @@ Supported options:
 
     Can also be set using the environment variable $PY2DEB_CALLBACK.
 
+  -j, --jobs=COUNT
+
+    Build up to COUNT packages concurrently using a pool of worker processes.
+    Defaults to one (packages are built one by one).
+
+    Can also be set using the environment variable $PY2DEB_JOBS.
+
+  --pipeline
+
+    Hand packages to a pool of worker processes (see --jobs) as soon as they
+    have been prepared for conversion, instead of preparing the complete
+    requirement set before the first build starts.
+
+    Can also be set using the environment variable $PY2DEB_PIPELINE.
+
+  --build-cache=DIRECTORY
+
+    Cache converted packages in the given directory, under a fingerprint of
+    the source distribution and the conversion options. Packages are only
+    converted again when their fingerprint changes, cached archives are
+    linked into the repository directory.
+
+    Can also be set using the environment variable $PY2DEB_BUILD_CACHE.
+
+  --scratch-directory=DIRECTORY
+
+    Build packages in temporary directories created inside the given
+    directory instead of the system wide temporary directory. Use this to
+    build on a fast local disk or tmpfs. If this directory doesn't exist
+    py2deb refuses to run.
+
+    Can also be set using the environment variable $PY2DEB_SCRATCH_DIRECTORY.
+
+  --background-cleanup
+
+    Empty build directories in a background thread (and reuse them) instead
+    of removing each build directory before the next package is built.
+
+    Can also be set using the environment variable $PY2DEB_BACKGROUND_CLEANUP.
+
+  --compression=TYPE
+
+    Compress the converted packages using TYPE, which is one of the strings
+    `gzip', `none', `xz' or `zstd'. By default dpkg-deb picks the compression
+    type. Can be overridden for specific packages in the configuration file.
+
+    Can also be set using the environment variable $PY2DEB_COMPRESSION.
+
+  --compression-level=LEVEL
+
+    Set the compression level (the valid range depends on the compression
+    type). By default dpkg-deb picks the compression level.
+
+    Can also be set using the environment variable $PY2DEB_COMPRESSION_LEVEL.
+
+  --compression-threads=COUNT
+
+    Use up to COUNT threads to compress each package (zero means one thread
+    per processor). Only applies to the `xz' and `zstd' compression types.
+
+    Can also be set using the environment variable $PY2DEB_COMPRESSION_THREADS.
+
+  --streaming
+
+    Stream the files of converted packages straight into the generated
+    archives instead of unpacking them into a build directory and running
+    dpkg-deb. Packages that need a build directory (because of a Python
+    callback or conversion command) or zstd compression are still built
+    using dpkg-deb.
+
+    Can also be set using the environment variable $PY2DEB_STREAMING.
+
+  --reproducible
+
+    Generate reproducible packages: Converting the same input twice results
+    in identical archives. The conversion date is omitted from the package
+    description and the last modified times of all files are clamped to
+    $SOURCE_DATE_EPOCH (defaults to the last modified time of the source
+    distribution). Enabled automatically when $SOURCE_DATE_EPOCH is set.
+
+    Can also be set using the environment variable $PY2DEB_REPRODUCIBLE.
+
+  --precompile
+
+    Compile the Python modules of converted packages to bytecode files on
+    the build host (in parallel) and include these in the packages, instead
+    of compiling them in the post-installation script on every target
+    system. Requires Python 3.7 or newer. Implies --streaming for the
+    packages that support streaming.
+
+    Can also be set using the environment variable $PY2DEB_PRECOMPILE.
+
+  --dbgsym
+
+    Keep the debugging information of compiled object files in separate
+    <name>-dbgsym packages (using the build ID based layout under
+    /usr/lib/debug/.build-id) instead of discarding it when the object
+    files are stripped. Debug symbol packages are built in the background
+    while the converted packages are built.
+
+    Can also be set using the environment variable $PY2DEB_DBGSYM.
+
+  --fast-launchers
+
+    Replace the console scripts of converted packages (the entry points in
+    entry_points.txt) with launchers that import the entry point directly,
+    instead of wrappers that load the entry point using pkg_resources (which
+    can take hundreds of milliseconds).
+
+    Can also be set using the environment variable $PY2DEB_FAST_LAUNCHERS.
+
+  --zip-bundles
+
+    When a custom installation prefix is used, pack the Python modules,
+    package data and (precompiled) bytecode files of each converted package
+    into a zip archive under the installation prefix, so that importing
+    modules doesn't have to search a directory with thousands of files.
+    Packages that aren't zip safe (for example because they contain compiled
+    extension modules or refer to __file__) are installed as usual.
+    Requires Python 3.7 or newer and implies --streaming.
+
+    Can also be set using the environment variable $PY2DEB_ZIP_BUNDLES.
+
+  --module-index
+
+    When a custom installation prefix is used, maintain an index of the top
+    level modules installed under the prefix (updated by the maintainer
+    scripts of the converted packages) and generate a small runtime package
+    that resolves imports of these modules using the index, so that importing
+    modules doesn't have to search a directory with thousands of files.
+
+    Can also be set using the environment variable $PY2DEB_MODULE_INDEX.
+
+  --dependency-cache=DIRECTORY
+
+    Cache the system dependencies of object files (found using
+    dpkg-shlibdeps) in the given directory, so that unchanged object files
+    aren't analyzed again. By default no dependency cache is used.
+
+    Can also be set using the environment variable $PY2DEB_DEPENDENCY_CACHE.
+
+  --dependency-cache-size=COUNT
+
+    Limit the dependency cache to COUNT object files (the least recently used
+    object files are removed first). Defaults to 10000.
+
+    Can also be set using the environment variable $PY2DEB_DEPENDENCY_CACHE_SIZE.
+
+  --lintian-batch
+
+    Don't run Lintian while each package is being built, instead check all
+    converted packages after the conversion using one Lintian process per
+    processor. Lintian reports are cached under the checksum of the archive
+    so unchanged archives aren't checked again.
+
+    Can also be set using the environment variable $PY2DEB_LINTIAN_BATCH.
+
   --report-dependencies=FILENAME
 
     Add the Debian relationships needed to depend on the converted
@@ -148,11 +305,15 @@ def main():
         # Initialize a package converter.
         converter = PackageConverter()
         # Parse and validate the command line options.
-        options, arguments = getopt.getopt(sys.argv[1:], 'c:r:yvh', [
+        options, arguments = getopt.getopt(sys.argv[1:], 'c:r:j:yvh', [
             'config=', 'repository=', 'use-system-package=', 'name-prefix=',
             'no-name-prefix=', 'rename=', 'install-prefix=',
-            'install-alternative=', 'python-callback=', 'report-dependencies=',
-            'yes', 'verbose', 'help',
+            'install-alternative=', 'python-callback=', 'jobs=', 'pipeline',
+            'build-cache=', 'scratch-directory=', 'background-cleanup',
+            'compression=', 'compression-level=', 'compression-threads=', 'streaming',
+            'reproducible', 'precompile', 'dbgsym', 'fast-launchers', 'zip-bundles',
+            'module-index', 'dependency-cache=', 'dependency-cache-size=', 'lintian-batch',
+            'report-dependencies=', 'yes', 'verbose', 'help',
         ])
         control_file_to_update = None
         for option, value in options:
@@ -177,6 +338,42 @@ def main():
                 converter.install_alternative(link, path)
             elif option == '--python-callback':
                 converter.set_python_callback(value)
+            elif option in ('-j', '--jobs'):
+                converter.set_jobs(value)
+            elif option == '--pipeline':
+                converter.set_pipeline_enabled(True)
+            elif option == '--build-cache':
+                converter.set_build_cache(value)
+            elif option == '--scratch-directory':
+                converter.set_scratch_directory(value)
+            elif option == '--background-cleanup':
+                converter.set_background_cleanup(True)
+            elif option == '--compression':
+                converter.set_compression(value)
+            elif option == '--compression-level':
+                converter.set_compression_level(value)
+            elif option == '--compression-threads':
+                converter.set_compression_threads(value)
+            elif option == '--streaming':
+                converter.set_streaming_enabled(True)
+            elif option == '--reproducible':
+                converter.set_reproducible(True)
+            elif option == '--precompile':
+                converter.set_precompile_enabled(True)
+            elif option == '--dbgsym':
+                converter.set_dbgsym_enabled(True)
+            elif option == '--fast-launchers':
+                converter.set_fast_launchers_enabled(True)
+            elif option == '--zip-bundles':
+                converter.set_zip_bundles_enabled(True)
+            elif option == '--module-index':
+                converter.set_module_index_enabled(True)
+            elif option == '--dependency-cache':
+                converter.set_dependency_cache(value)
+            elif option == '--dependency-cache-size':
+                converter.set_dependency_cache_size(value)
+            elif option == '--lintian-batch':
+                converter.set_lintian_batch(True)
             elif option == '--report-dependencies':
                 control_file_to_update = value
                 if not os.path.isfile(control_file_to_update):
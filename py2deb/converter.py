@@ -18,35 +18,58 @@ conversion logic.
 """
 
 # Standard library modules.
+import collections
+import contextlib
 import importlib
 import logging
+import multiprocessing
 import os
+import platform
 import re
 import shutil
+import sys
 import tempfile
 
 # External dependencies.
-from property_manager import PropertyManager, cached_property, lazy_property, mutable_property, set_property
-from deb_pkg_tools.cache import get_default_cache
-from deb_pkg_tools.checks import check_duplicate_files
+from property_manager import (
+    PropertyManager,
+    cached_property,
+    clear_property,
+    lazy_property,
+    mutable_property,
+    set_property,
+)
+from deb_pkg_tools.control import unparse_control_fields
 from deb_pkg_tools.utils import find_debian_architecture
 from humanfriendly import coerce_boolean
-from humanfriendly.text import compact
+from humanfriendly.text import compact, pluralize
 from pip_accel import PipAccelerator
 from pip_accel.config import Config as PipAccelConfig
 from six.moves import configparser
 
 # Modules included in our package.
+from py2deb import __version__
+from py2deb.cache import BuildCache, DependencyCache, LintianCache
+from py2deb.manifests import check_duplicate_files
 from py2deb.utils import (
+    BuildDirectoryPool,
+    LRUCache,
     PackageRepository,
+    PathRewriter,
+    TemporaryDirectory,
+    coerce_compression,
+    coerce_count,
     convert_package_name,
     default_name_prefix,
     normalize_package_name,
     normalize_package_version,
-    package_names_match,
+    python_version,
+    report_cache_statistics,
+    snapshot_cache_statistics,
     tokenize_version,
 )
-from py2deb.package import PackageToConvert
+from py2deb.package import KNOWN_INSTALL_PREFIXES, PackageToConvert
+from py2deb.writer import ArchiveWriter, run_lintian_batch
 
 # Initialize a logger.
 logger = logging.getLogger(__name__)
@@ -59,6 +82,12 @@ The keys are the names reported by :func:`os.uname()` and the values are
 machine architecture labels used in the Debian packaging system.
 """
 
+PIPELINE_QUEUE_SIZE = 5
+"""The maximum number of prepared packages waiting for a worker process in pipelined mode (an integer)."""
+
+WORKER_PACKAGES = []
+"""The packages to be built by a worker process (a list of :class:`.PackageToConvert` objects)."""
+
 
 class PackageConverter(PropertyManager):
 
@@ -105,6 +134,225 @@ class PackageConverter(PropertyManager):
         """
         return set()
 
+    @lazy_property
+    def archives_to_check(self):
+        """
+        The archives waiting to be checked by :func:`run_lintian_batch()` (a list of strings).
+
+        When :attr:`lintian_batch` is :data:`True` the archives are added by
+        :func:`store_archive()`.
+        """
+        return []
+
+    @mutable_property
+    def background_cleanup(self):
+        """
+        :data:`True` to empty build directories in the background, :data:`False` otherwise (the default).
+
+        By default each package is built in a new temporary directory that's
+        removed (using :func:`shutil.rmtree()`) before the next package is
+        built. When this is :data:`True` build directories are managed by a
+        :class:`.BuildDirectoryPool` instead, which empties them in a
+        background thread and reuses them for later builds.
+
+        This applies to packages built in the main process. When :attr:`jobs`
+        is greater than one each worker process removes its own build
+        directories (it doesn't block the other workers while doing so).
+        """
+        return False
+
+    @background_cleanup.setter
+    def background_cleanup(self, value):
+        """Automatically coerce :attr:`background_cleanup` to a boolean value."""
+        set_property(self, 'background_cleanup', coerce_boolean(value))
+
+    @mutable_property(cached=True)
+    def build_cache(self):
+        """
+        The cache of converted packages (a :class:`.BuildCache` object or :data:`None`).
+
+        By default no build cache is used and a package is considered to be
+        converted already when the :attr:`repository` contains an archive with
+        the same name, version and architecture. This doesn't notice changes
+        to the source distribution or to conversion options that don't affect
+        the name or version of the package.
+
+        When a build cache directory is configured, converted archives are
+        stored in the cache under a fingerprint of all of the inputs that
+        determine their contents (refer to :attr:`.PackageToConvert.fingerprint`)
+        and a package is only skipped when an archive with a matching
+        fingerprint is available in the cache. Cached archives are hard linked
+        into the :attr:`repository` directory (or copied when the cache and
+        the repository are on different file systems).
+
+        The cache directory is created when it doesn't exist yet.
+        """
+        return None
+
+    @build_cache.setter
+    def build_cache(self, value):
+        """Automatically coerce :attr:`build_cache` values."""
+        if value:
+            directory = os.path.abspath(os.path.expanduser(value))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            value = BuildCache(directory)
+        else:
+            value = None
+        set_property(self, 'build_cache', value)
+
+    @cached_property
+    def build_directory_pool(self):
+        """
+        The pool of build directories used by :func:`get_build_directory()` (a :class:`.BuildDirectoryPool` object).
+
+        The pool is closed at the end of each conversion, which waits for
+        pending cleanups and removes the pooled directories.
+        """
+        return BuildDirectoryPool(directory=self.scratch_directory)
+
+    @mutable_property
+    def compression(self):
+        """
+        The compression type of converted archives (a string or :data:`None`).
+
+        One of the strings ``gzip``, ``none``, ``xz`` or ``zstd``. The default
+        is :data:`None` which means ``dpkg-deb`` picks its own default (which
+        depends on the version of dpkg). The compression type, level and
+        number of threads can be overridden for specific packages using
+        :func:`set_package_compression()`.
+
+        The compression options are passed to ``dpkg-deb --build`` as command
+        line options (refer to :func:`.build_archive()`). The number of
+        threads requires dpkg 1.21.9 or later, with older versions it's
+        ignored (with a warning).
+        """
+        return None
+
+    @compression.setter
+    def compression(self, value):
+        """Validate the value of :attr:`compression`."""
+        set_property(self, 'compression', coerce_compression(value))
+
+    @mutable_property
+    def compression_level(self):
+        """
+        The compression level of converted archives (a non-negative integer or :data:`None`).
+
+        The valid range depends on the compression type (refer to
+        :attr:`compression`). The default is :data:`None` which means
+        ``dpkg-deb`` picks its own default.
+        """
+        return None
+
+    @compression_level.setter
+    def compression_level(self, value):
+        """Validate the value of :attr:`compression_level`."""
+        set_property(self, 'compression_level', coerce_count(value, "compression level"))
+
+    @lazy_property
+    def compression_overrides(self):
+        """
+        Package specific compression options (a dictionary).
+
+        The keys of this dictionary are lowercased Python package names and
+        the values are dictionaries with one or more of the keys
+        ``compression``, ``level`` and ``threads``. Refer to
+        :func:`set_package_compression()` for details.
+        """
+        return {}
+
+    @mutable_property
+    def compression_threads(self):
+        """
+        The maximum number of threads used to compress archives (a non-negative integer or :data:`None`).
+
+        Zero means ``dpkg-deb`` uses as many threads as there are processors.
+        The default is :data:`None` which means ``dpkg-deb`` picks its own
+        default. Only the ``xz`` and ``zstd`` compressors use multiple threads.
+
+        When :attr:`jobs` is greater than one each worker process compresses
+        its own archives, so the total number of compression threads can be up
+        to :attr:`jobs` times this value.
+        """
+        return None
+
+    @compression_threads.setter
+    def compression_threads(self, value):
+        """Validate the value of :attr:`compression_threads`."""
+        set_property(self, 'compression_threads', coerce_count(value, "number of compression threads"))
+
+    @mutable_property
+    def dbgsym_enabled(self):
+        """
+        :data:`True` to generate debug symbol packages, :data:`False` otherwise (the default).
+
+        By default the debugging information of compiled object files is
+        discarded when they're stripped. When this is :data:`True` the
+        debugging information is split off in the same pass (see
+        :func:`.strip_object_files()`) and a ``<name>-dbgsym`` package is
+        generated for each converted package that contains object files with
+        debugging information (refer to :func:`.PackageToConvert.build_dbgsym_package()`).
+        The debug files are installed using the build ID based layout under
+        ``/usr/lib/debug/.build-id`` so that debuggers find them automatically.
+
+        The debug symbol package is built in a background thread while the
+        package itself is being built, it's added to the :attr:`repository`
+        but not to the :attr:`build_cache` and it isn't included in the
+        archives returned by :func:`convert()`.
+        """
+        return False
+
+    @dbgsym_enabled.setter
+    def dbgsym_enabled(self, value):
+        """Automatically coerce :attr:`dbgsym_enabled` to a boolean value."""
+        set_property(self, 'dbgsym_enabled', coerce_boolean(value))
+
+    @mutable_property(cached=True)
+    def dependency_cache(self):
+        """
+        The cache of system dependencies of object files (a :class:`.DependencyCache` object or :data:`None`).
+
+        Finding the system dependencies of object files (see
+        :func:`.find_system_dependencies()`) runs :man:`dpkg-shlibdeps`, which
+        is slow for packages that contain many object files. The results are
+        cached per object file (identified by its SHA-256 digest and the
+        :attr:`debian_architecture`), so unchanged binaries (e.g. in nightly
+        builds) are not analyzed again. The number of cached object files is
+        limited by :attr:`dependency_cache_size`.
+
+        By default no dependency cache is used and :man:`dpkg-shlibdeps` is
+        run once for all of the object files in a package. Setting this
+        property to the pathname of a directory enables the cache (stored in
+        ``dependencies.sqlite3`` in that directory), setting it to an empty
+        string disables the cache again.
+        """
+        return None
+
+    @dependency_cache.setter
+    def dependency_cache(self, value):
+        """Automatically coerce :attr:`dependency_cache` values."""
+        if value:
+            directory = os.path.abspath(os.path.expanduser(value))
+            value = DependencyCache(os.path.join(directory, 'dependencies.sqlite3'),
+                                    max_entries=self.dependency_cache_size)
+        else:
+            value = None
+        set_property(self, 'dependency_cache', value)
+
+    @mutable_property
+    def dependency_cache_size(self):
+        """The maximum number of object files in the :attr:`dependency_cache` (an integer, defaults to 10000)."""
+        return 10000
+
+    @dependency_cache_size.setter
+    def dependency_cache_size(self, value):
+        """Validate :attr:`dependency_cache_size` and apply it to the :attr:`dependency_cache`."""
+        value = coerce_count(value, "dependency cache size")
+        set_property(self, 'dependency_cache_size', value)
+        if self.dependency_cache:
+            self.dependency_cache.max_entries = value
+
     @cached_property
     def debian_architecture(self):
         """
@@ -116,6 +364,28 @@ class PackageConverter(PropertyManager):
         """
         return find_debian_architecture()
 
+    @mutable_property
+    def fast_launchers_enabled(self):
+        """
+        :data:`True` to generate fast console script launchers, :data:`False` otherwise (the default).
+
+        The console scripts generated by ``setup.py`` load their entry point
+        using :mod:`pkg_resources`, which scans all installed distributions
+        and checks their requirements before the program even starts (this
+        can easily take a few hundred milliseconds). When this is
+        :data:`True` the executables under ``bin/`` that correspond to the
+        ``console_scripts`` and ``gui_scripts`` entry points of a package (see
+        :attr:`.PackageToConvert.console_scripts`) are replaced with launchers
+        that import the entry point directly (see
+        :func:`.PackageToConvert.generate_launcher()`).
+        """
+        return False
+
+    @fast_launchers_enabled.setter
+    def fast_launchers_enabled(self, value):
+        """Automatically coerce :attr:`fast_launchers_enabled` to a boolean value."""
+        set_property(self, 'fast_launchers_enabled', coerce_boolean(value))
+
     @mutable_property
     def install_prefix(self):
         """
@@ -139,6 +409,34 @@ class PackageConverter(PropertyManager):
         """
         return '/usr'
 
+    @mutable_property
+    def jobs(self):
+        """
+        The number of packages to build concurrently (a positive integer, defaults to 1).
+
+        When this is greater than one the packages that haven't been converted
+        in a previous run are built by a pool of worker processes (using the
+        :mod:`multiprocessing` module). The worker processes are forked after
+        the requirement set has been downloaded and unpacked, so they inherit
+        the configuration of the converter. Each worker process gets its own
+        :pypi:`pip-accel` state and each package build uses its own temporary
+        build directory, so the results are the same as those of a serial run.
+
+        .. note:: Because the :attr:`python_callback` is called inside the
+                  worker processes, changes it makes to the state of the
+                  converter are not visible in the parent process.
+        """
+        return 1
+
+    @jobs.setter
+    def jobs(self, value):
+        """Automatically coerce :attr:`jobs` to a positive integer."""
+        value = int(value)
+        if value < 1:
+            msg = "The number of concurrent jobs should be a positive integer! (%r)"
+            raise ValueError(msg % value)
+        set_property(self, 'jobs', value)
+
     @mutable_property
     def lintian_enabled(self):
         """
@@ -156,6 +454,34 @@ class PackageConverter(PropertyManager):
         """Automatically coerce :attr:`lintian_enabled` to a boolean value."""
         set_property(self, 'lintian_enabled', coerce_boolean(value))
 
+    @mutable_property
+    def lintian_batch(self):
+        """
+        :data:`True` to run Lintian_ after the conversion, :data:`False` to run it during each build.
+
+        Lintian often takes longer than building the package that it checks.
+        When this is :data:`True` (and :attr:`lintian_enabled` is also
+        :data:`True`) packages are built without running Lintian and all
+        archives generated by :func:`convert()` or :func:`convert_iter()` are
+        checked afterwards by a pool of concurrent Lintian processes (refer to
+        :func:`run_lintian_batch()`). Defaults to :data:`False`.
+        """
+        return False
+
+    @lintian_batch.setter
+    def lintian_batch(self, value):
+        """Automatically coerce :attr:`lintian_batch` to a boolean value."""
+        set_property(self, 'lintian_batch', coerce_boolean(value))
+
+    @mutable_property(cached=True)
+    def lintian_cache(self):
+        """
+        The cache of Lintian reports used in batch mode (a :class:`.LintianCache` object).
+
+        The cache is stored in the directory ``~/.cache/py2deb/lintian``.
+        """
+        return LintianCache(os.path.expanduser('~/.cache/py2deb/lintian'))
+
     @lazy_property
     def lintian_ignore(self):
         """A list of strings with Lintian tags to ignore."""
@@ -170,6 +496,56 @@ class PackageConverter(PropertyManager):
             'vcs-field-uses-unknown-uri-format',
         ]
 
+    @mutable_property
+    def module_index_enabled(self):
+        """
+        :data:`True` to maintain an index of installed modules, :data:`False` otherwise (the default).
+
+        With a custom installation prefix the Python modules of all converted
+        packages are installed in a single ``lib`` directory and every import
+        of a top level module has to search this (potentially huge) directory.
+        When this is :data:`True` the maintainer scripts of the converted
+        packages add their top level modules to an index in the ``lib``
+        directory (refer to :func:`py2deb.hooks.update_module_index()`) and
+        each conversion generates a small runtime package (see
+        :func:`build_module_index_package()`) that installs a meta path
+        finder which resolves imports using the index (see :mod:`py2deb.finder`).
+        The converted packages depend on the runtime package (see
+        :attr:`module_index_package`).
+
+        The finder is activated by a ``*.pth`` file, so like
+        :attr:`zip_bundles_enabled` this makes the snippet embedded in
+        executable scripts add the ``lib`` directory using
+        :func:`site.addsitedir()`. This has no effect without a custom
+        installation prefix.
+        """
+        return False
+
+    @module_index_enabled.setter
+    def module_index_enabled(self, value):
+        """Automatically coerce :attr:`module_index_enabled` to a boolean value."""
+        set_property(self, 'module_index_enabled', coerce_boolean(value))
+
+    @property
+    def module_index_package(self):
+        """
+        The name of the runtime package that installs the module index finder (a string).
+
+        The name is based on :attr:`name_prefix`, for example
+        ``python-py2deb-module-index``.
+        """
+        return '%s-py2deb-module-index' % self.name_prefix
+
+    @property
+    def module_index_required(self):
+        """
+        :data:`True` when converted packages depend on the :attr:`module_index_package`, :data:`False` otherwise.
+
+        This is the case when :attr:`module_index_enabled` is :data:`True` and
+        a custom :attr:`install_prefix` is used.
+        """
+        return self.module_index_enabled and self.install_prefix not in KNOWN_INSTALL_PREFIXES
+
     @lazy_property
     def name_mapping(self):
         """
@@ -220,6 +596,128 @@ class PackageConverter(PropertyManager):
         """
         return default_name_prefix()
 
+    @lazy_property
+    def path_rewriters(self):
+        """
+        Cache for :func:`get_path_rewriter()` (a dictionary).
+
+        The keys are tuples with the inputs of the rewrite table (whether a
+        custom installation prefix is used and the :attr:`path_rules`) and the
+        values are :class:`.PathRewriter` objects, so each table is built
+        once per converter and the rewritten directory prefixes are shared
+        by all packages.
+        """
+        return {}
+
+    @lazy_property
+    def path_rules(self):
+        """
+        User defined rules to rewrite the pathnames of files in converted packages (a list).
+
+        A list of tuples with two values each: A regular expression pattern
+        and a replacement (refer to :func:`add_path_rule()`). These rules are
+        applied after the built in rules of :func:`get_path_rewriter()`.
+        """
+        return []
+
+    @cached_property
+    def packages_by_name(self):
+        """
+        Index of :attr:`packages_to_convert` by normalized package name (a dictionary).
+
+        The keys of the dictionary are Python package names normalized using
+        :func:`.normalize_package_name()` and the values are lists of
+        :class:`.PackageToConvert` objects. This enables
+        :func:`transform_version()` to find the package in the requirement set
+        that satisfies a requirement without comparing the name of the
+        requirement to the name of every package in the requirement set.
+
+        The index is computed on first use and recomputed after
+        :attr:`packages_to_convert` is changed.
+        """
+        index = {}
+        for package in self.packages_to_convert:
+            index.setdefault(normalize_package_name(package.python_name), []).append(package)
+        return index
+
+    @mutable_property
+    def packages_to_convert(self):
+        """
+        The Python packages in the requirement set (a list of :class:`.PackageToConvert` objects).
+
+        This is set by :func:`convert_requirement_set()` once the requirement
+        set has been downloaded and unpacked, because
+        :func:`transform_version()` needs to know about all packages in the
+        requirement set.
+        """
+        return []
+
+    @packages_to_convert.setter
+    def packages_to_convert(self, value):
+        """Store :attr:`packages_to_convert` and reset the caches derived from it."""
+        set_property(self, 'packages_to_convert', list(value))
+        clear_property(self, 'packages_by_name')
+        clear_property(self, 'required_versions')
+
+    @mutable_property
+    def pipeline_enabled(self):
+        """
+        :data:`True` to overlap preparation and building of packages, :data:`False` otherwise (the default).
+
+        When this is :data:`True` the packages are prepared for conversion
+        (looking up existing or cached archives, which requires the checksum
+        of the source distribution when a :attr:`build_cache` is configured)
+        one by one in the main process and each package that needs to be
+        built is handed to a pool of :attr:`jobs` worker processes as soon as
+        it's ready, instead of preparing the complete requirement set first.
+        Refer to :func:`build_packages_pipelined()` for details.
+
+        .. note:: :pypi:`pip-accel` downloads and unpacks the requirement set
+                  using a single run of :pypi:`pip`, so downloads don't
+                  overlap with builds.
+        """
+        return False
+
+    @pipeline_enabled.setter
+    def pipeline_enabled(self, value):
+        """Automatically coerce :attr:`pipeline_enabled` to a boolean value."""
+        set_property(self, 'pipeline_enabled', coerce_boolean(value))
+
+    @mutable_property
+    def precompile_enabled(self):
+        """
+        :data:`True` to include bytecode files in packages, :data:`False` otherwise (the default).
+
+        By default the post-installation script of each package compiles its
+        ``*.py`` files on the target system (see :func:`.generate_bytecode_files()`).
+        When this is :data:`True` the bytecode files are compiled once on the
+        build host instead, using a pool of worker processes (refer to
+        :func:`.compile_bytecode()`), they're included in the package and the
+        post-installation script doesn't compile anything.
+
+        The bytecode files are compiled for the running interpreter (which is
+        also the interpreter on the target system) as "unchecked hash" based
+        bytecode files (see `PEP 552`_), so they remain valid regardless of the
+        last modified times of the installed ``*.py`` files. This requires
+        Python 3.7 or newer.
+
+        Because :func:`.build_archive()` removes
+        ``__pycache__`` directories from the build directory, bytecode files
+        can only be included in packages that are streamed into their archive
+        (see :attr:`streaming_enabled`). Enabling this option therefore also
+        streams the packages that support it, other packages are converted
+        as if this option was disabled (refer to
+        :attr:`.PackageToConvert.bytecode_included` for details).
+
+        .. _PEP 552: https://www.python.org/dev/peps/pep-0552/
+        """
+        return False
+
+    @precompile_enabled.setter
+    def precompile_enabled(self, value):
+        """Automatically coerce :attr:`precompile_enabled` to a boolean value."""
+        set_property(self, 'precompile_enabled', coerce_boolean(value))
+
     @mutable_property
     def prerelease_workaround(self):
         """
@@ -330,6 +828,18 @@ class PackageConverter(PropertyManager):
             value = None
         set_property(self, 'python_callback', value)
 
+    @cached_property
+    def required_versions(self):
+        """
+        Cache for :func:`strip_trailing_zeros()` (a dictionary).
+
+        The keys of the dictionary are tuples with two strings each (a
+        normalized Python package name and a required version) and the values
+        are the versions returned by :func:`strip_trailing_zeros()`. The cache
+        is reset when :attr:`packages_to_convert` is changed.
+        """
+        return {}
+
     @mutable_property(cached=True)
     def repository(self):
         """
@@ -357,6 +867,60 @@ class PackageConverter(PropertyManager):
             raise ValueError(msg % directory)
         set_property(self, 'repository', PackageRepository(directory))
 
+    @mutable_property
+    def reproducible(self):
+        """
+        :data:`True` to generate reproducible packages, :data:`False` otherwise.
+
+        When this is :data:`True` converting the same input twice results in
+        identical ``*.deb`` archives (so that they can be deduplicated by
+        their checksum):
+
+        - The date and time of the conversion are omitted from the package
+          description (see :attr:`.PackageToConvert.debian_description`).
+        - The last modified times of all archive members are clamped to
+          :attr:`.PackageToConvert.source_date_epoch`.
+        - The members of the archive are sorted by pathname and owned by
+          ``root`` (``dpkg-deb --build`` always does this, the
+          :class:`.ArchiveWriter` does it when
+          :attr:`~.ArchiveWriter.sort_members` is enabled).
+
+        Defaults to :data:`True` when the environment variable
+        ``$SOURCE_DATE_EPOCH`` is set (see :attr:`source_date_epoch`),
+        :data:`False` otherwise.
+        """
+        return self.source_date_epoch is not None
+
+    @reproducible.setter
+    def reproducible(self, value):
+        """Automatically coerce :attr:`reproducible` to a boolean value."""
+        set_property(self, 'reproducible', coerce_boolean(value))
+
+    @mutable_property
+    def scratch_directory(self):
+        """
+        The directory where packages are built (a string or :data:`None`).
+
+        Each package is built in a temporary directory that's created inside
+        the scratch directory. By default (when this is :data:`None`) the
+        system wide temporary files directory is used. Pointing this to a
+        fast local disk (or tmpfs) can considerably speed up the conversion
+        of large packages.
+        """
+
+    @scratch_directory.setter
+    def scratch_directory(self, value):
+        """Automatically coerce :attr:`scratch_directory` values."""
+        if value:
+            value = os.path.abspath(os.path.expanduser(value))
+            if not os.path.isdir(value):
+                msg = "Scratch directory doesn't exist! (%s)"
+                raise ValueError(msg % value)
+        else:
+            value = None
+        set_property(self, 'scratch_directory', value)
+        clear_property(self, 'build_directory_pool')
+
     @lazy_property
     def scripts(self):
         """
@@ -373,6 +937,64 @@ class PackageConverter(PropertyManager):
         """
         return {}
 
+    @mutable_property
+    def source_date_epoch(self):
+        """
+        The timestamp used by reproducible builds (an integer or :data:`None`).
+
+        Defaults to the value of the environment variable ``$SOURCE_DATE_EPOCH``
+        (refer to the `SOURCE_DATE_EPOCH specification`_) or :data:`None` when
+        the environment variable isn't set. Only used when :attr:`reproducible`
+        is :data:`True`.
+
+        .. _SOURCE_DATE_EPOCH specification: https://reproducible-builds.org/specs/source-date-epoch/
+        """
+        return coerce_count(os.environ.get('SOURCE_DATE_EPOCH') or None, "value of $SOURCE_DATE_EPOCH")
+
+    @source_date_epoch.setter
+    def source_date_epoch(self, value):
+        """Automatically coerce :attr:`source_date_epoch` to a non-negative integer."""
+        set_property(self, 'source_date_epoch', coerce_count(value, "source date epoch"))
+
+    @mutable_property
+    def streaming_enabled(self):
+        """
+        :data:`True` to stream packages into archives, :data:`False` to use ``dpkg-deb`` (the default).
+
+        By default the files of a converted package are unpacked into a build
+        directory and the ``*.deb`` archive is created by ``dpkg-deb --build``
+        (using :func:`.build_archive()`). When this is
+        :data:`True` the files are streamed straight into the archive by an
+        :class:`.ArchiveWriter` instead, which roughly halves the disk I/O of
+        building pure Python packages. Only object files are written to the
+        build directory (so that they can be stripped).
+
+        Packages that are subject to a :attr:`python_callback` or a conversion
+        command (see :func:`set_conversion_command()`) and packages that use
+        ``zstd`` compression are still built using ``dpkg-deb`` (refer to
+        :attr:`.PackageToConvert.streaming_supported` for details).
+        The :attr:`compression_threads` option doesn't apply to streamed
+        packages.
+        """
+        return False
+
+    @streaming_enabled.setter
+    def streaming_enabled(self, value):
+        """Automatically coerce :attr:`streaming_enabled` to a boolean value."""
+        set_property(self, 'streaming_enabled', coerce_boolean(value))
+
+    @property
+    def strip_concurrency(self):
+        """
+        The number of object files to strip or analyze concurrently (a positive integer).
+
+        This is the number of processors divided by :attr:`jobs` (so that
+        concurrent builds don't oversubscribe the processors), with a minimum
+        of one. Refer to :func:`.strip_object_files()` and
+        :func:`.find_system_dependencies()` for details.
+        """
+        return max(1, multiprocessing.cpu_count() // self.jobs)
+
     @lazy_property
     def system_packages(self):
         """
@@ -393,6 +1015,81 @@ class PackageConverter(PropertyManager):
         """
         return {}
 
+    @lazy_property
+    def transformation_cache(self):
+        """
+        Cache for :func:`transform_name()` (an :class:`.LRUCache` object).
+
+        The cache keys include every input of the transformation (the Python
+        package name, the extras, the override from :attr:`name_mapping` and
+        the :attr:`name_prefix`) so changes to :attr:`name_prefix`,
+        :attr:`name_mapping` and :attr:`system_packages` take effect
+        immediately, even when the dictionaries are modified directly. The
+        version transformations in :mod:`py2deb.utils` are cached by their
+        arguments (which include :attr:`prerelease_workaround`) in the same
+        way.
+
+        Hit and miss counters of the lookups made during each conversion are
+        logged at debug level at the end of the conversion (see
+        :func:`.report_cache_statistics()`).
+        """
+        return LRUCache('transform_name')
+
+    @mutable_property
+    def zip_bundles_enabled(self):
+        """
+        :data:`True` to pack Python modules into zip bundles, :data:`False` otherwise (the default).
+
+        With a custom installation prefix the Python modules of all converted
+        packages are installed in a single ``lib`` directory and every import
+        has to search this (potentially huge) directory. When this is
+        :data:`True` the Python modules, package data and bytecode files of
+        each package are packed into a zip archive in the ``lib`` directory
+        instead (refer to :attr:`.PackageToConvert.zip_bundle_supported` and
+        :func:`.PackageToConvert.create_zip_bundle()`). Each zip archive is
+        referenced by a ``*.pth`` file and the snippet embedded in executable
+        scripts adds the ``lib`` directory using :func:`site.addsitedir()`
+        so that the ``*.pth`` files are processed.
+
+        This has no effect without a custom installation prefix. Because the
+        bytecode files are compiled on the build host this implies
+        :attr:`streaming_enabled` and requires Python 3.7 or newer (like
+        :attr:`precompile_enabled`).
+        """
+        return False
+
+    @zip_bundles_enabled.setter
+    def zip_bundles_enabled(self, value):
+        """Automatically coerce :attr:`zip_bundles_enabled` to a boolean value."""
+        set_property(self, 'zip_bundles_enabled', coerce_boolean(value))
+
+    def add_path_rule(self, pattern, replacement):
+        r"""
+        Add a rule to rewrite the pathnames of files in converted packages.
+
+        :param pattern: A regular expression pattern (a string) that matches
+                        (part of) the directory of a pathname.
+        :param replacement: The replacement (a string or callable, refer to
+                            :func:`re.sub()`).
+        :raises: :exc:`~exceptions.ValueError` when no pattern is provided
+                 or the pattern is not a valid regular expression.
+
+        The rule is applied to the directory of each file (including the
+        trailing slash) after the built in rules, so it sees pathnames in the
+        final layout relative to the installation prefix, for example:
+
+        .. code-block:: python
+
+           converter.add_path_rule(r'^lib/python3\.\d+/dist-packages/', 'lib/python3/dist-packages/')
+
+        Refer to :class:`.PathRewriter` for details.
+        """
+        if not pattern:
+            raise ValueError("Please provide a nonempty path rewrite pattern!")
+        # Validate the pattern before it's added.
+        PathRewriter([(pattern, replacement)])
+        self.path_rules.append((pattern, replacement))
+
     def install_alternative(self, link, path):
         r"""
         Install system wide link for program installed in custom installation prefix.
@@ -460,6 +1157,54 @@ class PackageConverter(PropertyManager):
         """
         self.pip_accel.config.auto_install = coerce_boolean(enabled)
 
+    def set_background_cleanup(self, enabled):
+        """
+        Enable or disable emptying of build directories in the background (see :attr:`background_cleanup`).
+
+        :param enabled: Any value, evaluated using :func:`~humanfriendly.coerce_boolean()`.
+        """
+        self.background_cleanup = enabled
+
+    def set_build_cache(self, directory):
+        """
+        Set the pathname of the directory where converted packages are cached.
+
+        :param directory: The pathname of a directory (a string). Any value
+                          that evaluates to :data:`False` disables the cache.
+
+        Refer to :attr:`build_cache` for details.
+        """
+        self.build_cache = directory
+
+    def set_compression(self, compression):
+        """
+        Set the compression type of converted archives (see :attr:`compression`).
+
+        :param compression: One of the strings ``gzip``, ``none``, ``xz`` or ``zstd``.
+        :raises: :exc:`~exceptions.ValueError` when the compression type isn't supported.
+        """
+        self.compression = compression
+
+    def set_compression_level(self, level):
+        """
+        Set the compression level of converted archives (see :attr:`compression_level`).
+
+        :param level: A non-negative integer (or a string containing one).
+        :raises: :exc:`~exceptions.ValueError` when the value is not a
+                 non-negative integer.
+        """
+        self.compression_level = level
+
+    def set_compression_threads(self, threads):
+        """
+        Set the maximum number of compression threads (see :attr:`compression_threads`).
+
+        :param threads: A non-negative integer (or a string containing one).
+        :raises: :exc:`~exceptions.ValueError` when the value is not a
+                 non-negative integer.
+        """
+        self.compression_threads = threads
+
     def set_conversion_command(self, python_package_name, command):
         """
         Set shell command to be executed during conversion process.
@@ -499,6 +1244,44 @@ class PackageConverter(PropertyManager):
             raise ValueError("Please provide a nonempty shell command!")
         self.scripts[python_package_name.lower()] = command
 
+    def set_dbgsym_enabled(self, enabled):
+        """
+        Enable or disable debug symbol packages (see :attr:`dbgsym_enabled`).
+
+        :param enabled: Any value, evaluated using :func:`~humanfriendly.coerce_boolean()`.
+        """
+        self.dbgsym_enabled = enabled
+
+    def set_dependency_cache(self, directory):
+        """
+        Set the pathname of the directory where system dependencies are cached.
+
+        :param directory: The pathname of a directory (a string). Any value
+                          that evaluates to :data:`False` disables the cache
+                          (the default).
+
+        Refer to :attr:`dependency_cache` for details.
+        """
+        self.dependency_cache = directory
+
+    def set_dependency_cache_size(self, size):
+        """
+        Set the maximum number of object files in the dependency cache (see :attr:`dependency_cache_size`).
+
+        :param size: A non-negative integer (or a string containing one).
+        :raises: :exc:`~exceptions.ValueError` when the value is not a
+                 non-negative integer.
+        """
+        self.dependency_cache_size = size
+
+    def set_fast_launchers_enabled(self, enabled):
+        """
+        Enable or disable fast console script launchers (see :attr:`fast_launchers_enabled`).
+
+        :param enabled: Any value, evaluated using :func:`~humanfriendly.coerce_boolean()`.
+        """
+        self.fast_launchers_enabled = enabled
+
     def set_install_prefix(self, directory):
         """
         Set installation prefix to use during package conversion.
@@ -515,6 +1298,16 @@ class PackageConverter(PropertyManager):
             raise ValueError("Please provide a nonempty installation prefix!")
         self.install_prefix = directory
 
+    def set_jobs(self, jobs):
+        """
+        Set the number of packages to build concurrently.
+
+        :param jobs: A positive integer (or a string containing one).
+        :raises: :exc:`~exceptions.ValueError` when the value is not a
+                 positive integer.
+        """
+        self.jobs = jobs
+
     def set_lintian_enabled(self, enabled):
         """
         Enable or disable automatic Lintian_ checks after package building.
@@ -525,6 +1318,24 @@ class PackageConverter(PropertyManager):
         """
         self.lintian_enabled = enabled
 
+    def set_lintian_batch(self, enabled):
+        """
+        Enable or disable running Lintian_ in a batch after the conversion.
+
+        :param enabled: Any value, evaluated using :func:`~humanfriendly.coerce_boolean()`.
+
+        Refer to :attr:`lintian_batch` for details.
+        """
+        self.lintian_batch = enabled
+
+    def set_module_index_enabled(self, enabled):
+        """
+        Enable or disable the module index (see :attr:`module_index_enabled`).
+
+        :param enabled: Any value, evaluated using :func:`~humanfriendly.coerce_boolean()`.
+        """
+        self.module_index_enabled = enabled
+
     def set_name_prefix(self, prefix):
         """
         Set package name prefix to use during package conversion.
@@ -537,6 +1348,22 @@ class PackageConverter(PropertyManager):
             raise ValueError("Please provide a nonempty name prefix!")
         self.name_prefix = prefix
 
+    def set_pipeline_enabled(self, enabled):
+        """
+        Enable or disable pipelined conversion (see :attr:`pipeline_enabled`).
+
+        :param enabled: Any value, evaluated using :func:`~humanfriendly.coerce_boolean()`.
+        """
+        self.pipeline_enabled = enabled
+
+    def set_precompile_enabled(self, enabled):
+        """
+        Enable or disable including bytecode files in packages (see :attr:`precompile_enabled`).
+
+        :param enabled: Any value, evaluated using :func:`~humanfriendly.coerce_boolean()`.
+        """
+        self.precompile_enabled = enabled
+
     def set_python_callback(self, expression):
         """Set the value of :attr:`python_callback`."""
         self.python_callback = expression
@@ -551,6 +1378,70 @@ class PackageConverter(PropertyManager):
         """
         self.repository = directory
 
+    def set_reproducible(self, enabled):
+        """
+        Enable or disable reproducible packages (see :attr:`reproducible`).
+
+        :param enabled: Any value, evaluated using :func:`~humanfriendly.coerce_boolean()`.
+        """
+        self.reproducible = enabled
+
+    def set_scratch_directory(self, directory):
+        """
+        Set the pathname of the directory where packages are built (see :attr:`scratch_directory`).
+
+        :param directory: The pathname of a directory (a string).
+        :raises: :exc:`~exceptions.ValueError` when the directory doesn't
+                 exist.
+        """
+        self.scratch_directory = directory
+
+    def set_package_compression(self, python_package_name, compression=None, level=None, threads=None):
+        """
+        Override the compression options for a specific package.
+
+        :param python_package_name: The name of a Python package
+                                    as found on PyPI (a string).
+        :param compression: Overrides :attr:`compression` (a string, optional).
+        :param level: Overrides :attr:`compression_level` (a non-negative
+                      integer or a string containing one, optional).
+        :param threads: Overrides :attr:`compression_threads` (a non-negative
+                        integer or a string containing one, optional).
+        :raises: :exc:`~exceptions.ValueError` when the package name is not
+                 provided (e.g. an empty string) or one of the options is
+                 invalid.
+
+        This is useful for example to compress large packages that are
+        installed infrequently using ``xz`` while using a fast compressor for
+        everything else. Options that aren't given keep their global value
+        (unless they were overridden by a previous call).
+        """
+        if not python_package_name:
+            raise ValueError("Please provide a nonempty Python package name!")
+        overrides = self.compression_overrides.setdefault(python_package_name.lower(), {})
+        if compression is not None:
+            overrides['compression'] = coerce_compression(compression)
+        if level is not None:
+            overrides['level'] = coerce_count(level, "compression level")
+        if threads is not None:
+            overrides['threads'] = coerce_count(threads, "number of compression threads")
+
+    def set_streaming_enabled(self, enabled):
+        """
+        Enable or disable streaming of packages into archives (see :attr:`streaming_enabled`).
+
+        :param enabled: Any value, evaluated using :func:`~humanfriendly.coerce_boolean()`.
+        """
+        self.streaming_enabled = enabled
+
+    def set_zip_bundles_enabled(self, enabled):
+        """
+        Enable or disable zip bundles (see :attr:`zip_bundles_enabled`).
+
+        :param enabled: Any value, evaluated using :func:`~humanfriendly.coerce_boolean()`.
+        """
+        self.zip_bundles_enabled = enabled
+
     def use_system_package(self, python_package_name, debian_package_name):
         """
         Exclude a Python package from conversion.
@@ -584,6 +1475,24 @@ class PackageConverter(PropertyManager):
         - ``$PY2DEB_INSTALL_PREFIX``
         - ``$PY2DEB_AUTO_INSTALL``
         - ``$PY2DEB_LINTIAN``
+        - ``$PY2DEB_LINTIAN_BATCH``
+        - ``$PY2DEB_JOBS``
+        - ``$PY2DEB_PIPELINE``
+        - ``$PY2DEB_BUILD_CACHE``
+        - ``$PY2DEB_SCRATCH_DIRECTORY``
+        - ``$PY2DEB_BACKGROUND_CLEANUP``
+        - ``$PY2DEB_COMPRESSION``
+        - ``$PY2DEB_COMPRESSION_LEVEL``
+        - ``$PY2DEB_COMPRESSION_THREADS``
+        - ``$PY2DEB_STREAMING``
+        - ``$PY2DEB_REPRODUCIBLE``
+        - ``$PY2DEB_PRECOMPILE``
+        - ``$PY2DEB_DBGSYM``
+        - ``$PY2DEB_FAST_LAUNCHERS``
+        - ``$PY2DEB_ZIP_BUNDLES``
+        - ``$PY2DEB_MODULE_INDEX``
+        - ``$PY2DEB_DEPENDENCY_CACHE``
+        - ``$PY2DEB_DEPENDENCY_CACHE_SIZE``
         """
         for variable, setter in (('PY2DEB_CONFIG', self.load_configuration_file),
                                  ('PY2DEB_REPOSITORY', self.set_repository),
@@ -591,6 +1500,24 @@ class PackageConverter(PropertyManager):
                                  ('PY2DEB_INSTALL_PREFIX', self.set_install_prefix),
                                  ('PY2DEB_AUTO_INSTALL', self.set_auto_install),
                                  ('PY2DEB_LINTIAN', self.set_lintian_enabled),
+                                 ('PY2DEB_LINTIAN_BATCH', self.set_lintian_batch),
+                                 ('PY2DEB_JOBS', self.set_jobs),
+                                 ('PY2DEB_PIPELINE', self.set_pipeline_enabled),
+                                 ('PY2DEB_BUILD_CACHE', self.set_build_cache),
+                                 ('PY2DEB_SCRATCH_DIRECTORY', self.set_scratch_directory),
+                                 ('PY2DEB_BACKGROUND_CLEANUP', self.set_background_cleanup),
+                                 ('PY2DEB_COMPRESSION', self.set_compression),
+                                 ('PY2DEB_COMPRESSION_LEVEL', self.set_compression_level),
+                                 ('PY2DEB_COMPRESSION_THREADS', self.set_compression_threads),
+                                 ('PY2DEB_STREAMING', self.set_streaming_enabled),
+                                 ('PY2DEB_REPRODUCIBLE', self.set_reproducible),
+                                 ('PY2DEB_PRECOMPILE', self.set_precompile_enabled),
+                                 ('PY2DEB_DBGSYM', self.set_dbgsym_enabled),
+                                 ('PY2DEB_FAST_LAUNCHERS', self.set_fast_launchers_enabled),
+                                 ('PY2DEB_ZIP_BUNDLES', self.set_zip_bundles_enabled),
+                                 ('PY2DEB_MODULE_INDEX', self.set_module_index_enabled),
+                                 ('PY2DEB_DEPENDENCY_CACHE', self.set_dependency_cache),
+                                 ('PY2DEB_DEPENDENCY_CACHE_SIZE', self.set_dependency_cache_size),
                                  ('PY2DEB_CALLBACK', self.set_python_callback)):
             value = os.environ.get(variable)
             if value is not None:
@@ -618,6 +1545,24 @@ class PackageConverter(PropertyManager):
            install-prefix = /usr/lib/py2deb
            auto-install = on
            lintian = on
+           lintian-batch = on
+           jobs = 4
+           pipeline = off
+           build-cache = ~/.cache/py2deb
+           scratch-directory = /dev/shm
+           background-cleanup = on
+           compression = zstd
+           compression-level = 3
+           compression-threads = 0
+           streaming = on
+           reproducible = on
+           precompile = on
+           dbgsym = on
+           fast-launchers = on
+           zip-bundles = on
+           module-index = on
+           dependency-cache = ~/.cache/py2deb
+           dependency-cache-size = 10000
 
            # The `alternatives' section contains instructions
            # for Debian's `update-alternatives' system.
@@ -628,6 +1573,7 @@ class PackageConverter(PropertyManager):
            # specific to a package.
            [package:py2deb]
            no-name-prefix = true
+           compression = xz
 
         Note that the configuration options shown here are just examples, they
         are not the configuration defaults (they are what I use to convert
@@ -646,6 +1592,10 @@ class PackageConverter(PropertyManager):
         **script**:
           Set a shell command to be executed during the conversion process
           (refer to :func:`set_conversion_command()` for details).
+
+        **compression**, **compression-level** and **compression-threads**:
+          Override the global compression options for the package (refer to
+          :func:`set_package_compression()` for details).
         """
         # Load the configuration file.
         parser = configparser.RawConfigParser()
@@ -669,8 +1619,44 @@ class PackageConverter(PropertyManager):
             self.set_auto_install(parser.get('py2deb', 'auto-install'))
         if parser.has_option('py2deb', 'lintian'):
             self.set_lintian_enabled(parser.get('py2deb', 'lintian'))
+        if parser.has_option('py2deb', 'lintian-batch'):
+            self.set_lintian_batch(parser.get('py2deb', 'lintian-batch'))
         if parser.has_option('py2deb', 'python-callback'):
             self.set_python_callback(parser.get('py2deb', 'python-callback'))
+        if parser.has_option('py2deb', 'jobs'):
+            self.set_jobs(parser.get('py2deb', 'jobs'))
+        if parser.has_option('py2deb', 'pipeline'):
+            self.set_pipeline_enabled(parser.get('py2deb', 'pipeline'))
+        if parser.has_option('py2deb', 'build-cache'):
+            self.set_build_cache(parser.get('py2deb', 'build-cache'))
+        if parser.has_option('py2deb', 'scratch-directory'):
+            self.set_scratch_directory(parser.get('py2deb', 'scratch-directory'))
+        if parser.has_option('py2deb', 'background-cleanup'):
+            self.set_background_cleanup(parser.get('py2deb', 'background-cleanup'))
+        if parser.has_option('py2deb', 'compression'):
+            self.set_compression(parser.get('py2deb', 'compression'))
+        if parser.has_option('py2deb', 'compression-level'):
+            self.set_compression_level(parser.get('py2deb', 'compression-level'))
+        if parser.has_option('py2deb', 'compression-threads'):
+            self.set_compression_threads(parser.get('py2deb', 'compression-threads'))
+        if parser.has_option('py2deb', 'streaming'):
+            self.set_streaming_enabled(parser.get('py2deb', 'streaming'))
+        if parser.has_option('py2deb', 'reproducible'):
+            self.set_reproducible(parser.get('py2deb', 'reproducible'))
+        if parser.has_option('py2deb', 'precompile'):
+            self.set_precompile_enabled(parser.get('py2deb', 'precompile'))
+        if parser.has_option('py2deb', 'dbgsym'):
+            self.set_dbgsym_enabled(parser.get('py2deb', 'dbgsym'))
+        if parser.has_option('py2deb', 'fast-launchers'):
+            self.set_fast_launchers_enabled(parser.get('py2deb', 'fast-launchers'))
+        if parser.has_option('py2deb', 'zip-bundles'):
+            self.set_zip_bundles_enabled(parser.get('py2deb', 'zip-bundles'))
+        if parser.has_option('py2deb', 'module-index'):
+            self.set_module_index_enabled(parser.get('py2deb', 'module-index'))
+        if parser.has_option('py2deb', 'dependency-cache'):
+            self.set_dependency_cache(parser.get('py2deb', 'dependency-cache'))
+        if parser.has_option('py2deb', 'dependency-cache-size'):
+            self.set_dependency_cache_size(parser.get('py2deb', 'dependency-cache-size'))
         # Apply the defined alternatives.
         if parser.has_section('alternatives'):
             for link, path in parser.items('alternatives'):
@@ -688,6 +1674,14 @@ class PackageConverter(PropertyManager):
                 if parser.has_option(section, 'script'):
                     script = parser.get(section, 'script')
                     self.set_conversion_command(package, script)
+                compression_options = {}
+                for option, keyword in (('compression', 'compression'),
+                                        ('compression-level', 'level'),
+                                        ('compression-threads', 'threads')):
+                    if parser.has_option(section, option):
+                        compression_options[keyword] = parser.get(section, option)
+                if compression_options:
+                    self.set_package_compression(package, **compression_options)
 
     def load_default_configuration_files(self):
         """
@@ -734,47 +1728,514 @@ class PackageConverter(PropertyManager):
         ['python-py2deb (=0.18)']
 
         """
+        cache_statistics = snapshot_cache_statistics(self.transformation_cache)
         try:
-            generated_archives = []
-            dependencies_to_report = []
-            # Download and unpack the requirement set and store the complete
-            # set as an instance variable because transform_version() will need
-            # it later on.
-            self.packages_to_convert = list(self.get_source_distributions(pip_install_arguments))
             # Convert packages that haven't been converted already.
-            for package in self.packages_to_convert:
-                # If the requirement is a 'direct' (non-transitive) requirement
-                # it means the caller explicitly asked for this package to be
-                # converted, so we add it to the list of converted dependencies
-                # that we report to the caller once we've finished converting.
-                if package.requirement.is_direct:
-                    dependencies_to_report.append('%s (= %s)' % (package.debian_name, package.debian_version))
+            converted_archives = {}
+            for package, archive in self.convert_requirement_set(pip_install_arguments):
+                converted_archives[id(package)] = archive
+            # Check the archives generated by this conversion using Lintian.
+            self.run_lintian_batch()
+            # Report the archives in the order of the requirement set (which
+            # doesn't depend on the order in which concurrent builds finish).
+            generated_archives = [converted_archives[id(p)] for p in self.packages_to_convert]
+            # Generate the runtime package of the module index (when enabled).
+            if self.module_index_required:
+                generated_archives.append(self.build_module_index_package())
+            # If a requirement is a 'direct' (non-transitive) requirement it
+            # means the caller explicitly asked for this package to be
+            # converted, so we add it to the list of converted dependencies
+            # that we report to the caller.
+            dependencies_to_report = [p.debian_relationship for p in self.packages_to_convert
+                                      if p.requirement.is_direct]
+            # Let the caller know which archives were generated (whether
+            # previously or now) and how to depend on the converted packages.
+            return generated_archives, sorted(dependencies_to_report)
+        finally:
+            # Always clean up temporary directories created by pip and pip-accel.
+            self.pip_accel.cleanup_temporary_directories()
+            self.build_directory_pool.close()
+            report_cache_statistics(cache_statistics)
+
+    def convert_iter(self, pip_install_arguments):
+        """
+        Convert one or more Python packages to Debian packages, reporting results as they become available.
+
+        :param pip_install_arguments: The command line arguments to the ``pip
+                                      install`` command.
+        :returns: A generator of tuples with two strings each:
+
+                  1. The pathname of a generated Debian package archive.
+                  2. The Debian package relationship required to depend on
+                     the converted package.
+        :raises: :exc:`~deb_pkg_tools.checks.DuplicateFilesFound` after the
+                 last result has been generated, if two converted package
+                 archives contain the same files.
+
+        This is an alternative to :func:`convert()` for callers that want to
+        start processing (e.g. publishing) converted packages while other
+        packages are still being built. The packages are built in topological
+        order (refer to :func:`schedule_packages()`) and each package is
+        reported as soon as it and the packages it depends on have been
+        converted, so callers never see a package before its dependencies.
+        Unlike :func:`convert()` a relationship is reported for every package
+        in the requirement set (not just the direct requirements).
+        """
+        cache_statistics = snapshot_cache_statistics(self.transformation_cache)
+        try:
+            for package, archive in self.convert_requirement_set(pip_install_arguments):
+                yield getattr(archive, 'filename', archive), package.debian_relationship
+            # Generate the runtime package of the module index (when enabled).
+            if self.module_index_required:
+                yield self.build_module_index_package(), self.module_index_package
+            # Check the archives generated by this conversion using Lintian.
+            self.run_lintian_batch()
+        finally:
+            # Always clean up temporary directories created by pip and pip-accel.
+            self.pip_accel.cleanup_temporary_directories()
+            self.build_directory_pool.close()
+            report_cache_statistics(cache_statistics)
+
+    def convert_requirement_set(self, pip_install_arguments):
+        """
+        Download, unpack and convert a requirement set (used by :func:`convert()` and :func:`convert_iter()`).
+
+        :param pip_install_arguments: The command line arguments to the ``pip
+                                      install`` command.
+        :returns: A generator of tuples like those generated by
+                  :func:`convert_packages()`.
+
+        When the generator is exhausted the complete requirement set is
+        available in :attr:`packages_to_convert`.
+        """
+        # Download and unpack the requirement set and store the complete set
+        # as an instance variable because transform_version() will need it
+        # later on.
+        self.packages_to_convert = list(self.get_source_distributions(pip_install_arguments))
+        return self.convert_packages(self.packages_to_convert)
+
+    def convert_packages(self, packages):
+        """
+        Convert Python packages to Debian packages in dependency order.
+
+        :param packages: A list of :class:`.PackageToConvert` objects.
+        :returns: A generator of tuples with two values each:
+
+                  1. A :class:`.PackageToConvert` object.
+                  2. The pathname of the generated ``*.deb`` archive (a string)
+                     or a :class:`~deb_pkg_tools.package.PackageFile` object
+                     when the package was converted in a previous run.
+        :raises: :exc:`~deb_pkg_tools.checks.DuplicateFilesFound` if two
+                 converted package archives contain the same files (certainly
+                 not what you want within a set of dependencies).
+
+        Packages are generated as soon as they have been converted, but never
+        before the packages they depend on (as determined by
+        :func:`schedule_packages()`). When :attr:`pipeline_enabled` is
+        :data:`True` the packages are prepared and built by
+        :func:`build_packages_pipelined()`, otherwise all packages are
+        prepared before the first build starts (see :func:`build_packages()`).
+        """
+        schedule = self.schedule_packages(packages)
+        finished_archives = {}
+        generated_archives = []
+        context = get_fork_context() if self.pipeline_enabled else None
+        if self.pipeline_enabled and context is None:
+            logger.warning("Not using pipelined conversion because worker processes can't be forked on this platform.")
+        if context is not None:
+            results = self.build_packages_pipelined([package for package, dependencies in schedule], context)
+        else:
+            packages_to_build = []
+            for package, dependencies in schedule:
                 if package.existing_archive:
                     # If the same version of this package was converted in a
                     # previous run we can save a lot of time by skipping it.
                     logger.info("Package %s (%s) already converted: %s",
                                 package.python_name, package.python_version,
                                 package.existing_archive.filename)
-                    generated_archives.append(package.existing_archive)
+                    finished_archives[id(package)] = package.existing_archive
                 else:
-                    archive = package.convert()
-                    if not os.path.samefile(os.path.dirname(archive), self.repository.directory):
-                        shutil.move(archive, self.repository.directory)
-                        archive = os.path.join(self.repository.directory, os.path.basename(archive))
-                    generated_archives.append(archive)
-            # Use deb-pkg-tools to sanity check the generated package archives
-            # for duplicate files. This should never occur but unfortunately
-            # can happen because Python's packaging infrastructure is a lot
-            # more `forgiving' in the sense of blindly overwriting files
-            # installed by other packages ;-).
-            if len(generated_archives) > 1:
-                check_duplicate_files(generated_archives, cache=get_default_cache())
-            # Let the caller know which archives were generated (whether
-            # previously or now) and how to depend on the converted packages.
-            return generated_archives, sorted(dependencies_to_report)
+                    packages_to_build.append(package)
+            results = self.build_packages(packages_to_build)
+        while schedule:
+            # Report the packages whose own conversion and the conversion of
+            # their dependencies has finished. Because the schedule is sorted
+            # in topological order a single pass suffices.
+            pending = []
+            unreported = set(id(p) for p, d in schedule)
+            for package, dependencies in schedule:
+                if id(package) in finished_archives and not any(id(d) in unreported for d in dependencies):
+                    unreported.discard(id(package))
+                    generated_archives.append(finished_archives[id(package)])
+                    yield package, finished_archives[id(package)]
+                else:
+                    pending.append((package, dependencies))
+            schedule = pending
+            if schedule:
+                package, archive = next(results)
+                finished_archives[id(package)] = archive
+        # Sanity check the generated package archives for duplicate files.
+        # This should never occur but unfortunately can happen because
+        # Python's packaging infrastructure is a lot more `forgiving' in the
+        # sense of blindly overwriting files installed by other packages ;-).
+        if len(generated_archives) > 1:
+            self.check_for_duplicate_files(generated_archives)
+
+    def check_for_duplicate_files(self, archives):
+        """
+        Check a group of converted package archives for duplicate files.
+
+        :param archives: A list of pathnames (strings) or
+                         :class:`~deb_pkg_tools.package.PackageFile` objects
+                         of ``*.deb`` archives in the :attr:`repository`.
+        :raises: :exc:`~deb_pkg_tools.checks.DuplicateFilesFound` when
+                 duplicate files are found.
+
+        The manifests of the archives are taken from the :attr:`repository`
+        (see :func:`.PackageRepository.get_manifest()`), so only archives that
+        weren't built by py2deb and haven't been checked before are inspected.
+        Refer to :func:`py2deb.manifests.check_duplicate_files()` for details.
+        """
+        archives = [getattr(archive, 'filename', archive) for archive in archives]
+        check_duplicate_files(archives, [self.repository.get_manifest(archive) for archive in archives])
+
+    def schedule_packages(self, packages):
+        """
+        Sort Python packages in topological order of their requirements.
+
+        :param packages: A list of :class:`.PackageToConvert` objects.
+        :returns: A list of tuples with two values each:
+
+                  1. A :class:`.PackageToConvert` object.
+                  2. A list with the :class:`.PackageToConvert` objects that
+                     the package depends on (based on
+                     :attr:`~.PackageToConvert.python_requirements`) and that
+                     precede the package in the result.
+
+        Packages without dependencies inside the given set come first, the
+        order of `packages` is preserved where the dependencies allow it.
+        Circular dependencies are broken by taking the first remaining package
+        in the order of `packages`. Requirements are matched to packages using
+        :attr:`packages_by_name`, so `packages` is expected to be (a subset of)
+        :attr:`packages_to_convert`.
+        """
+        members = set(id(p) for p in packages)
+        dependencies = {}
+        for package in packages:
+            names = set(normalize_package_name(r.project_name) for r in package.python_requirements)
+            dependencies[id(package)] = [d for n in sorted(names) for d in self.packages_by_name.get(n, [])
+                                         if id(d) in members and d is not package]
+        schedule = []
+        scheduled = set()
+        remaining = list(packages)
+        while remaining:
+            for package in remaining:
+                if all(id(d) in scheduled for d in dependencies[id(package)]):
+                    break
+            else:
+                package = remaining[0]
+                logger.debug("Breaking circular dependency at %s.", package)
+            remaining.remove(package)
+            schedule.append((package, [d for d in dependencies[id(package)] if id(d) in scheduled]))
+            scheduled.add(id(package))
+        return schedule
+
+    def build_packages(self, packages):
+        """
+        Build Debian packages for the given Python packages.
+
+        :param packages: A list of :class:`.PackageToConvert` objects.
+        :returns: A generator of tuples with two values each:
+
+                  1. A :class:`.PackageToConvert` object.
+                  2. The pathname of the generated ``*.deb`` archive (a
+                     string), after it was moved to the :attr:`repository`.
+
+        When :attr:`jobs` is greater than one the packages are built by a pool
+        of worker processes, otherwise they are built one by one. Either way
+        builds are started in the order of `packages` and results are
+        generated as soon as each build finishes. The worker processes are
+        always forked (see :func:`get_fork_context()`), when that isn't
+        possible the packages are built one by one.
+        """
+        num_workers = min(self.jobs, len(packages))
+        context = get_fork_context() if num_workers > 1 else None
+        if num_workers > 1 and context is None:
+            logger.warning("Building packages one by one because worker processes can't be forked on this platform.")
+        if context is not None:
+            logger.info("Building %s using %i worker processes ..",
+                        pluralize(len(packages), "package"), num_workers)
+            pool = context.Pool(processes=num_workers,
+                                initializer=initialize_worker,
+                                initargs=(self, packages))
+            try:
+                for result in pool.imap_unordered(convert_in_worker, range(len(packages))):
+                    yield self.store_worker_result(packages, result)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            for package in packages:
+                yield package, self.store_archive(package, package.convert())
+
+    def build_packages_pipelined(self, packages, context):
+        """
+        Prepare and build Debian packages for the given Python packages (see :attr:`pipeline_enabled`).
+
+        :param packages: A list of :class:`.PackageToConvert` objects (in the
+                         order in which they should be built).
+        :param context: The :mod:`multiprocessing` context used to create the
+                        worker processes (see :func:`get_fork_context()`).
+        :returns: A generator of tuples like those generated by
+                  :func:`build_packages()`, including the packages that were
+                  converted in a previous run (in which case the second value
+                  is a :class:`~deb_pkg_tools.package.PackageFile` object).
+
+        The packages are prepared one by one in the main process: When an
+        existing archive is found (see :attr:`.PackageToConvert.existing_archive`)
+        it's generated right away, otherwise the package is handed to a pool
+        of :attr:`jobs` worker processes (at least one, so that preparation
+        and building overlap). The pool is created when the first package
+        needs to be built and at most :data:`PIPELINE_QUEUE_SIZE` packages
+        wait for a worker, when this bounded queue is full preparation waits
+        for the oldest build to finish. Finished builds are generated as soon
+        as possible, also while preparation is still in progress.
+
+        Because the requirement set is complete before preparation starts,
+        :func:`transform_version()` sees the complete requirement set
+        regardless of the order in which packages are built.
+        """
+        pool = None
+        queued_builds = collections.deque()
+        try:
+            for index, package in enumerate(packages):
+                # Generate the builds that have finished in the meantime.
+                while queued_builds and queued_builds[0].ready():
+                    yield self.store_worker_result(packages, queued_builds.popleft().get())
+                if package.existing_archive:
+                    logger.info("Package %s (%s) already converted: %s",
+                                package.python_name, package.python_version,
+                                package.existing_archive.filename)
+                    yield package, package.existing_archive
+                    continue
+                if pool is None:
+                    num_workers = min(self.jobs, len(packages) - index)
+                    logger.info("Building packages using %s while the requirement set is being prepared ..",
+                                pluralize(num_workers, "worker process", "worker processes"))
+                    pool = context.Pool(processes=num_workers,
+                                        initializer=initialize_worker,
+                                        initargs=(self, packages))
+                # Wait for room in the queue before handing over this package.
+                while len(queued_builds) >= num_workers + PIPELINE_QUEUE_SIZE:
+                    yield self.store_worker_result(packages, queued_builds.popleft().get())
+                queued_builds.append(pool.apply_async(convert_in_worker, (index,)))
+            # Generate the remaining builds in the order in which they finish.
+            while queued_builds:
+                finished = [result for result in queued_builds if result.ready()]
+                if not finished:
+                    queued_builds[0].wait(0.1)
+                for result in finished:
+                    queued_builds.remove(result)
+                    yield self.store_worker_result(packages, result.get())
         finally:
-            # Always clean up temporary directories created by pip and pip-accel.
-            self.pip_accel.cleanup_temporary_directories()
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+    def store_worker_result(self, packages, result):
+        """
+        Store the result of :func:`convert_in_worker()` in the parent process.
+
+        :param packages: The list of :class:`.PackageToConvert` objects given
+                         to :func:`initialize_worker()`.
+        :param result: The tuple returned by :func:`convert_in_worker()`.
+        :returns: A tuple with the :class:`.PackageToConvert` object and the
+                  pathname of the ``*.deb`` archive in the :attr:`repository`
+                  (see :func:`store_archive()`).
+        """
+        index, archive, manifest, dbgsym_archive = result
+        # The manifest and debug symbol package were recorded in the worker process.
+        packages[index].manifest = manifest
+        packages[index].dbgsym_archive = dbgsym_archive
+        return packages[index], self.store_archive(packages[index], archive)
+
+    def build_module_index_package(self):
+        """
+        Build the runtime package that resolves imports using the module index.
+
+        :returns: The pathname of the generated ``*.deb`` archive in the
+                  :attr:`repository` (a string).
+
+        The package installs :mod:`py2deb.finder` as ``py2deb_finder.py`` in
+        the ``lib`` directory of the :attr:`install_prefix` together with a
+        ``py2deb_finder.pth`` file that calls :func:`py2deb.finder.install()`
+        when the ``lib`` directory is added using :func:`site.addsitedir()`.
+        The package is architecture independent and its version matches the
+        version of py2deb. The archive is created by an :class:`.ArchiveWriter`.
+        """
+        modules_directory = os.path.join(self.install_prefix, 'lib')
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'finder.py'), 'rb') as handle:
+            finder_module = handle.read()
+        with self.get_build_directory() as build_directory:
+            writer = ArchiveWriter(directory=build_directory)
+            if self.source_date_epoch is not None:
+                writer.timestamp = self.source_date_epoch
+                writer.sort_members = True
+            writer.add_file(os.path.join(modules_directory, 'py2deb_finder.py'), finder_module, 0o644)
+            writer.add_file(os.path.join(modules_directory, 'py2deb_finder.pth'),
+                            b'import py2deb_finder; py2deb_finder.install()\n', 0o644)
+            maintainer = os.environ.get('DEBFULLNAME', 'Unknown')
+            if 'DEBFULLNAME' in os.environ and os.environ.get('DEBEMAIL'):
+                maintainer = '%s <%s>' % (maintainer, os.environ['DEBEMAIL'].strip('<>'))
+            control_fields = unparse_control_fields(dict(package=self.module_index_package,
+                                                         version=__version__,
+                                                         maintainer=maintainer,
+                                                         description='module index for %s' % self.install_prefix,
+                                                         architecture='all',
+                                                         depends=[python_version()],
+                                                         priority='optional',
+                                                         section='python'))
+            directory_mtime = self.repository.get_directory_mtime()
+            archive = writer.create_archive(control_fields, {}, self.repository.directory)
+        self.repository.add_archive(archive, directory_mtime=directory_mtime)
+        return archive
+
+    def store_archive(self, package, archive):
+        """
+        Move a generated package archive to the :attr:`repository` directory.
+
+        :param package: The :class:`.PackageToConvert` object that was built.
+        :param archive: The pathname of a ``*.deb`` archive (a string).
+        :returns: The pathname of the archive in the repository (a string).
+
+        An existing archive with the same filename is replaced and the index
+        of the repository is updated (see :func:`.PackageRepository.add_archive()`).
+        When a :attr:`build_cache` is configured the archive is also added to
+        the cache (under the :attr:`~.PackageToConvert.fingerprint` of the
+        package). The debug symbol package (see :attr:`dbgsym_enabled`) is
+        moved to the repository as well.
+        """
+        directory_mtime = None
+        if not os.path.samefile(os.path.dirname(archive), self.repository.directory):
+            pathname = os.path.join(self.repository.directory, os.path.basename(archive))
+            directory_mtime = self.repository.get_directory_mtime()
+            shutil.move(archive, pathname)
+            archive = pathname
+        self.repository.add_archive(archive, manifest=package.manifest, directory_mtime=directory_mtime)
+        if package.dbgsym_archive:
+            pathname = os.path.join(self.repository.directory, os.path.basename(package.dbgsym_archive))
+            directory_mtime = self.repository.get_directory_mtime()
+            shutil.move(package.dbgsym_archive, pathname)
+            self.repository.add_archive(pathname, directory_mtime=directory_mtime)
+            package.dbgsym_archive = pathname
+        if self.build_cache:
+            self.build_cache.put(package.fingerprint, archive)
+        if self.lintian_enabled and self.lintian_batch:
+            self.archives_to_check.append(archive)
+        return archive
+
+    def run_lintian_batch(self):
+        """
+        Check the archives generated since the last batch using Lintian_ (see :attr:`lintian_batch`).
+
+        The archives are checked by :func:`.run_lintian_batch()` using up to
+        one Lintian process per processor, the tags in :attr:`lintian_ignore`
+        are suppressed and the reports are cached in :attr:`lintian_cache`.
+        """
+        archives, self.archives_to_check[:] = list(self.archives_to_check), []
+        if archives:
+            run_lintian_batch(archives, ignore=self.lintian_ignore, cache=self.lintian_cache)
+
+    def get_compression_options(self, python_package_name):
+        """
+        Get the effective compression options for a package.
+
+        :param python_package_name: The name of a Python package (a string).
+        :returns: A dictionary with the keys ``compression``, ``level`` and
+                  ``threads`` (refer to :attr:`compression`,
+                  :attr:`compression_level` and :attr:`compression_threads`)
+                  combined with the package specific overrides in
+                  :attr:`compression_overrides`.
+        """
+        options = dict(
+            compression=self.compression,
+            level=self.compression_level,
+            threads=self.compression_threads,
+        )
+        options.update(self.compression_overrides.get(python_package_name.lower(), {}))
+        return options
+
+    def get_path_rewriter(self, custom_install_prefix):
+        """
+        Get the rewrite table for the pathnames of files in binary distributions.
+
+        :param custom_install_prefix: :data:`True` if packages are installed
+                                      under a custom installation prefix,
+                                      :data:`False` otherwise (refer to
+                                      :attr:`.PackageToConvert.has_custom_install_prefix`).
+        :returns: A :class:`.PathRewriter` object (cached in :attr:`path_rewriters`).
+
+        The built in rules (in the order in which they're applied) are:
+
+        1. On PyPy the top level ``site-packages`` directory of virtual
+           environments is moved to ``lib/pypyX.Y/site-packages``.
+        2. With a custom installation prefix the complete
+           ``lib/pythonX.Y/site-packages/`` prefix is replaced by ``lib/``.
+        3. Otherwise the versioned PyPy directory segment is normalized (on
+           PyPy) and ``site-packages`` is renamed to ``dist-packages`` (see
+           https://wiki.debian.org/Python#Deviations_from_upstream).
+
+        The :attr:`path_rules` are applied after the built in rules.
+        """
+        key = (bool(custom_install_prefix), tuple(self.path_rules))
+        rewriter = self.path_rewriters.get(key)
+        if rewriter is None:
+            rules = []
+            on_pypy = platform.python_implementation() == 'PyPy'
+            if on_pypy:
+                # cPython uses /lib/pythonX.Y/(dist|site)-packages/ while PyPy
+                # uses /site-packages/ (a top level directory). Make the
+                # latter look like the former so that the following rules
+                # don't need to care about the difference.
+                rules.append((r'^(dist|site)-packages/', 'lib/pypy%i.%i/site-packages/' % sys.version_info[:2]))
+            if custom_install_prefix:
+                # Strip the complete /usr/lib/pythonX.Y/site-packages/ prefix
+                # so it can be replaced with the custom installation prefix.
+                rules.append((r'lib/(python|pypy)\d+(\.\d+)*/(dist|site)-packages/', 'lib/'))
+            else:
+                if on_pypy:
+                    # Normalize the PyPy "versioned directory segment" (it
+                    # differs between virtual environments versus system wide
+                    # installations). In PyPy 3 /usr/lib/python3/dist-packages
+                    # is shared with cPython, in PyPy 2 /usr/lib/pypy/dist-packages
+                    # is used (refer to the README files in those directories).
+                    rules.append((r'/pypy\d(\.\d)?/', '/python3/' if sys.version_info[0] == 3 else '/pypy/'))
+                rules.append((r'/site-packages/', '/dist-packages/'))
+            rewriter = PathRewriter(rules + list(self.path_rules))
+            self.path_rewriters[key] = rewriter
+        return rewriter
+
+    @contextlib.contextmanager
+    def get_build_directory(self):
+        """
+        Create a directory in which a package can be built (a context manager).
+
+        :returns: A context manager that returns the pathname of an empty
+                  directory (a string) inside the :attr:`scratch_directory`.
+
+        When :attr:`background_cleanup` is enabled the directory is taken from
+        the :attr:`build_directory_pool`, otherwise a :class:`.TemporaryDirectory`
+        is used.
+        """
+        if self.background_cleanup:
+            directory = self.build_directory_pool.acquire()
+            try:
+                yield directory
+            finally:
+                self.build_directory_pool.release(directory)
+        else:
+            with TemporaryDirectory(prefix='py2deb-build-', dir=self.scratch_directory) as directory:
+                yield directory
 
     def get_source_distributions(self, pip_install_arguments):
         """
@@ -830,6 +2291,7 @@ class PackageConverter(PropertyManager):
         >>> converter.transform_name('raven', 'flask')
         'some-web-app-raven-flask'
 
+        The results are cached in :attr:`transformation_cache`.
         """
         key = python_package_name.lower()
         # Check for a system package override by the caller.
@@ -837,8 +2299,26 @@ class PackageConverter(PropertyManager):
         if debian_package_name:
             # We don't modify the names of system packages.
             return debian_package_name
-        # Check for a package rename override by the caller.
-        debian_package_name = self.name_mapping.get(key)
+        # Check for a package rename override by the caller. The override and
+        # the name prefix are part of the cache key, so changes to them (even
+        # when made directly to the dictionaries) never return stale results.
+        override = self.name_mapping.get(key)
+        cache_key = (python_package_name, extras, override, self.name_prefix)
+        return self.transformation_cache.lookup(
+            cache_key, lambda: self.compute_name(python_package_name, extras, override)
+        )
+
+    def compute_name(self, python_package_name, extras, override):
+        """
+        Compute the Debian package name for :func:`transform_name()` (bypassing the cache).
+
+        :param python_package_name: The name of a Python package
+                                    as found on PyPI (a string).
+        :param extras: Any extras requested to be included (a tuple of strings).
+        :param override: The override from :attr:`name_mapping` (a string or :data:`None`).
+        :returns: The transformed name (a string).
+        """
+        debian_package_name = override
         if not debian_package_name:
             # No override. Make something up :-).
             debian_package_name = convert_package_name(
@@ -886,16 +2366,45 @@ class PackageConverter(PropertyManager):
         that would otherwise result in converted packages that cannot be
         installed.
         """
-        matching_packages = [
-            pkg for pkg in self.packages_to_convert
-            if package_names_match(pkg.python_name, python_requirement_name)
-        ]
+        modified_version = self.strip_trailing_zeros(python_requirement_name, python_requirement_version)
+        if modified_version != python_requirement_version:
+            logger.warning("Stripping superfluous trailing zeros from required"
+                           " version of %s required by %s! (%s -> %s)",
+                           python_requirement_name, package_to_convert.python_name,
+                           python_requirement_version, modified_version)
+            python_requirement_version = modified_version
+        return normalize_package_version(python_requirement_version, prerelease_workaround=self.prerelease_workaround)
+
+    def strip_trailing_zeros(self, python_requirement_name, python_requirement_version):
+        """
+        Strip trailing zeros from a required version when :pypi:`pip` would ignore them.
+
+        :param python_requirement_name: The name of a Python package
+                                        as found on PyPI (a string).
+        :param python_requirement_version: The required version of the
+                                           Python package (a string).
+        :returns: The required version with superfluous trailing zeros
+                  removed, or the given version when there's nothing to strip
+                  (a string).
+        :raises: :exc:`~exceptions.Exception` when the requirement set
+                 contains more than one package whose name matches the
+                 given name.
+
+        Refer to :func:`transform_version()` for the context. The package in
+        the requirement set is found using :attr:`packages_by_name` and the
+        results are cached in :attr:`required_versions`, because the same
+        requirement is usually shared by several packages.
+        """
+        normalized_name = normalize_package_name(python_requirement_name)
+        cache_key = (normalized_name, python_requirement_version)
+        if cache_key in self.required_versions:
+            return self.required_versions[cache_key]
+        matching_packages = self.packages_by_name.get(normalized_name, [])
         if len(matching_packages) > 1:
             # My assumption while writing this code is that this should never
             # happen. This check is to make sure that if it does happen it will
             # be noticed because the last thing I want is for this `hack' to
             # result in packages that are silently wrongly converted.
-            normalized_name = normalize_package_name(python_requirement_name)
             num_matches = len(matching_packages)
             raise Exception(compact("""
                 Expected requirement set to contain exactly one Python package
@@ -929,10 +2438,66 @@ class PackageConverter(PropertyManager):
                     # only zeros, i.e. pip considers the version numbers the same
                     # although apt would not agree.
                     if all(re.match('^0+$', t) for t in required_suffix if t.isdigit()):
-                        modified_version = ''.join(required_prefix)
-                        logger.warning("Stripping superfluous trailing zeros from required"
-                                       " version of %s required by %s! (%s -> %s)",
-                                       python_requirement_name, package_to_convert.python_name,
-                                       python_requirement_version, modified_version)
-                        python_requirement_version = modified_version
-        return normalize_package_version(python_requirement_version, prerelease_workaround=self.prerelease_workaround)
+                        python_requirement_version = ''.join(required_prefix)
+        self.required_versions[cache_key] = python_requirement_version
+        return python_requirement_version
+
+
+def get_fork_context():
+    """
+    Get the :mod:`multiprocessing` context used to create worker processes.
+
+    :returns: A context that uses the ``fork`` start method (the
+              :mod:`multiprocessing` module itself on Python 2, which always
+              forks) or :data:`None` when processes can't be forked.
+
+    :func:`initialize_worker()` relies on its arguments being inherited by
+    the worker processes: The converter and the packages to build can't be
+    pickled, so the ``spawn`` and ``forkserver`` start methods (the default
+    on Mac OS X and, starting from Python 3.14, on other POSIX platforms)
+    can't be used.
+    """
+    if not hasattr(multiprocessing, 'get_context'):
+        return multiprocessing
+    try:
+        return multiprocessing.get_context('fork')
+    except ValueError:
+        return None
+
+
+def initialize_worker(converter, packages):
+    """
+    Initialize a worker process created by :func:`PackageConverter.build_packages()`.
+
+    :param converter: The :class:`PackageConverter` that created the worker.
+    :param packages: The list of :class:`.PackageToConvert` objects to build.
+
+    Worker processes (also those created by
+    :func:`PackageConverter.build_packages_pipelined()`) are forked so the
+    arguments are inherited instead of pickled. Each worker gets its own :pypi:`pip-accel` state to avoid
+    sharing temporary directories with the parent process or other workers.
+    """
+    global WORKER_PACKAGES
+    converter.pip_accel = PipAccelerator(converter.pip_accel.config, validate=False)
+    # Background threads don't survive the fork and the worker could be
+    # terminated before they finish, so workers clean up synchronously.
+    converter.background_cleanup = False
+    # The worker mustn't use the database connection of the parent process.
+    if converter.dependency_cache:
+        converter.dependency_cache.reset()
+    WORKER_PACKAGES = packages
+
+
+def convert_in_worker(index):
+    """
+    Convert a package inside a worker process (see :func:`initialize_worker()`).
+
+    :param index: The index of the package in the list given to :func:`initialize_worker()`.
+    :returns: A tuple with the given index, the pathname of the generated
+              ``*.deb`` archive (a string), the manifest of the package (see
+              :attr:`.PackageToConvert.manifest`) and the pathname of the
+              debug symbol package (see :attr:`.PackageToConvert.dbgsym_archive`).
+    """
+    package = WORKER_PACKAGES[index]
+    archive = package.convert()
+    return index, archive, package.manifest, package.dbgsym_archive
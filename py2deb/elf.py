@@ -0,0 +1,208 @@
+# py2deb: Python to Debian package converter.
+#
+# Author: Peter Odding <peter.odding@paylogic.com>
+# Last Change: August 6, 2020
+# URL: https://py2deb.readthedocs.io
+
+"""
+The :mod:`py2deb.elf` module implements in process inspection of ELF_ object files.
+
+Converted packages that contain compiled extension modules need special
+handling: Their object files are stripped, their system dependencies are found
+using :man:`dpkg-shlibdeps` and they determine the architecture of the
+package. This module identifies object files by their magic bytes and parses
+their section headers, dynamic section and notes (through :mod:`mmap`) to find
+out whether they were already stripped, which shared libraries they need and
+what their build ID is, without running external programs.
+
+.. _ELF: https://en.wikipedia.org/wiki/Executable_and_Linkable_Format
+"""
+
+# Standard library modules.
+import binascii
+import collections
+import logging
+import mmap
+import os
+import struct
+
+# Initialize a logger.
+logger = logging.getLogger(__name__)
+
+ELF_MAGIC = b'\x7fELF'
+"""The magic bytes at the start of every ELF_ file (a byte string)."""
+
+SHT_SYMTAB = 2
+"""The section type of symbol tables (an integer)."""
+
+SHT_DYNAMIC = 6
+"""The section type of the dynamic section (an integer)."""
+
+SHT_NOTE = 7
+"""The section type of note sections (an integer)."""
+
+NT_GNU_BUILD_ID = 3
+"""The type of the note that contains the GNU build ID (an integer)."""
+
+DT_NULL = 0
+"""The tag that marks the end of the dynamic section (an integer)."""
+
+DT_NEEDED = 1
+"""The tag of dynamic section entries that name a needed shared library (an integer)."""
+
+DT_SONAME = 14
+"""The tag of the dynamic section entry that contains the shared object name (an integer)."""
+
+ELFInfo = collections.namedtuple('ELFInfo', 'machine, needed, soname, stripped, build_id')
+"""
+The results of :func:`parse_elf_data()` (a :func:`~collections.namedtuple()`).
+
+The fields are:
+
+- ``machine``: The ``e_machine`` field of the ELF header (an integer).
+- ``needed``: A list with the names of the shared libraries needed by the
+  object file (strings) or :data:`None` when the object file doesn't have a
+  section header table (in which case the needed libraries are unknown).
+- ``soname``: The shared object name (a string or :data:`None`).
+- ``stripped``: :data:`True` when the object file doesn't contain a symbol
+  table or debugging information, :data:`False` otherwise.
+- ``build_id``: The GNU build ID of the object file (a string of hexadecimal
+  digits or :data:`None`).
+"""
+
+
+def find_elf_files(directory):
+    """
+    Find ELF_ object files (executables and shared objects).
+
+    :param directory: The pathname of the directory to search (a string).
+    :returns: A sorted list of filenames of object files (strings).
+
+    This replaces :func:`deb_pkg_tools.package.find_object_files()`, which
+    considers every ``*.so`` file and every executable file that contains
+    binary data to be an object file. Files are identified by their magic
+    bytes instead, so files with binary contents that aren't object files
+    are no longer stripped and don't affect the architecture of the package.
+    Symbolic links are ignored.
+    """
+    object_files = []
+    for root, dirs, files in os.walk(directory):
+        for filename in files:
+            pathname = os.path.join(root, filename)
+            if not os.path.islink(pathname) and is_elf_file(pathname):
+                object_files.append(pathname)
+    return sorted(object_files)
+
+
+def inspect_elf_file(filename):
+    """
+    Inspect an ELF_ object file.
+
+    :param filename: The pathname of an object file (a string).
+    :returns: An :data:`ELFInfo` object.
+    :raises: :exc:`~exceptions.ValueError` when the file isn't a valid ELF file.
+    """
+    with open(filename, 'rb') as handle:
+        if os.fstat(handle.fileno()).st_size < len(ELF_MAGIC):
+            raise ValueError("Not an ELF file! (%s)" % filename)
+        data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return parse_elf_data(data)
+        finally:
+            data.close()
+
+
+def is_elf_data(data):
+    """
+    Check whether data starts with the ELF_ magic bytes.
+
+    :param data: A byte string (or another object that supports slicing).
+    :returns: :data:`True` if the data is an ELF file, :data:`False` otherwise.
+    """
+    return data[:len(ELF_MAGIC)] == ELF_MAGIC
+
+
+def is_elf_file(filename):
+    """
+    Check whether a file starts with the ELF_ magic bytes.
+
+    :param filename: The pathname of a file (a string).
+    :returns: :data:`True` if the file is an ELF file, :data:`False` otherwise.
+    """
+    try:
+        with open(filename, 'rb') as handle:
+            return is_elf_data(handle.read(len(ELF_MAGIC)))
+    except EnvironmentError:
+        return False
+
+
+def parse_elf_data(data):
+    """
+    Parse the ELF_ header, section headers, dynamic section and notes of an object file.
+
+    :param data: The contents of an object file (a byte string or an
+                 :class:`mmap.mmap` object).
+    :returns: An :data:`ELFInfo` object.
+    :raises: :exc:`~exceptions.ValueError` when the data isn't a valid ELF file.
+    """
+    if not is_elf_data(data):
+        raise ValueError("Not an ELF file (the magic bytes don't match)!")
+    try:
+        elf_class = ord(data[4:5])
+        byte_order = {1: '<', 2: '>'}[ord(data[5:6])]
+        if elf_class == 1:
+            header_format, section_format, entry_format = 'HHIIIIIHHHHHH', 'IIIIIIIIII', 'iI'
+        elif elf_class == 2:
+            header_format, section_format, entry_format = 'HHIQQQIHHHHHH', 'IIQQQQIIQQ', 'qQ'
+        else:
+            raise ValueError("Unsupported ELF class! (%i)" % elf_class)
+        header = struct.unpack_from(byte_order + header_format, data, 16)
+        machine, section_offset = header[1], header[5]
+        section_size, section_count, names_index = header[10], header[11], header[12]
+        # Parse the section header table.
+        sections = [
+            struct.unpack_from(byte_order + section_format, data, section_offset + i * section_size)
+            for i in range(section_count)
+        ]
+        if not sections:
+            return ELFInfo(machine=machine, needed=None, soname=None, stripped=True, build_id=None)
+        names = sections[names_index]
+
+        def get_string(table, offset):
+            start = table[4] + offset
+            return data[start:data.find(b'\0', start)].decode('UTF-8', 'replace')
+
+        section_names = [get_string(names, s[0]) for s in sections]
+        stripped = not any(s[1] == SHT_SYMTAB for s in sections) and not any(
+            name.startswith('.debug_') for name in section_names
+        )
+        # Parse the dynamic section and the note sections.
+        needed = []
+        soname = None
+        build_id = None
+        entry_size = struct.calcsize(byte_order + entry_format)
+        for section in sections:
+            if section[1] == SHT_NOTE and build_id is None:
+                offset, end = section[4], section[4] + section[5]
+                while offset + 12 <= end:
+                    name_size, description_size, note_type = struct.unpack_from(byte_order + 'III', data, offset)
+                    name_offset = offset + 12
+                    description_offset = name_offset + (name_size + 3) // 4 * 4
+                    if note_type == NT_GNU_BUILD_ID and data[name_offset:name_offset + name_size] == b'GNU\0':
+                        build_id = binascii.hexlify(data[description_offset:description_offset + description_size])
+                        build_id = build_id.decode('ascii')
+                        break
+                    offset = description_offset + (description_size + 3) // 4 * 4
+            elif section[1] == SHT_DYNAMIC:
+                strings = sections[section[6]]
+                for offset in range(section[4], section[4] + section[5], entry_size):
+                    tag, value = struct.unpack_from(byte_order + entry_format, data, offset)
+                    if tag == DT_NULL:
+                        break
+                    elif tag == DT_NEEDED:
+                        needed.append(get_string(strings, value))
+                    elif tag == DT_SONAME:
+                        soname = get_string(strings, value)
+        return ELFInfo(machine=machine, needed=needed, soname=soname, stripped=stripped, build_id=build_id)
+    except (IndexError, KeyError, TypeError, struct.error) as e:
+        raise ValueError("Invalid ELF file! (%s)" % e)
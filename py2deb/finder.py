@@ -0,0 +1,164 @@
+# py2deb: Python to Debian package converter.
+#
+# Authors:
+#  - Arjan Verwer
+#  - Peter Odding <peter.odding@paylogic.com>
+# Last Change: August 6, 2020
+# URL: https://py2deb.readthedocs.io
+
+"""
+The :mod:`py2deb.finder` module finds top level modules using a precomputed index.
+
+When hundreds of packages are installed in the same custom installation prefix
+every import has to search the ``lib`` directory of the prefix, which can
+contain thousands of entries. The post-installation and pre-removal hooks (see
+:mod:`py2deb.hooks`) maintain an index of the top level modules that are
+installed in the prefix and the :class:`ModuleIndexFinder` defined in this
+module resolves imports of these modules with a dictionary lookup.
+
+Like :mod:`py2deb.hooks` this module is embedded in generated packages: It's
+installed as ``py2deb_finder.py`` in the ``lib`` directory of the installation
+prefix by the runtime package that's generated when
+:attr:`~py2deb.converter.PackageConverter.module_index_enabled` is :data:`True`
+(see :func:`~py2deb.converter.PackageConverter.build_module_index_package()`),
+so it can only use Python's standard library. The runtime package includes a
+``*.pth`` file that calls :func:`install()` when the ``lib`` directory is added
+using :func:`site.addsitedir()` (which is what the snippet that py2deb embeds
+in executable scripts does).
+"""
+
+# Standard library modules.
+import json
+import os
+import sys
+
+try:
+    # Python 3.4+ (meta path finders that implement find_spec()).
+    from importlib.machinery import PathFinder
+    from importlib.util import spec_from_file_location
+except ImportError:
+    # Python 2 and older versions of Python 3 (the finder isn't installed).
+    PathFinder = None
+    spec_from_file_location = None
+
+INDEX_FILENAME = 'py2deb-modules.json'
+"""The name of the index file in the directory where Python modules are installed (a string)."""
+
+
+class ModuleIndexFinder(object):
+
+    """
+    Meta path finder that resolves top level modules using the index of an installation prefix.
+
+    The index is a JSON file in the directory where Python modules are
+    installed (see :data:`INDEX_FILENAME`) that maps the names of top level
+    modules to the pathnames of their ``*.py`` files (``__init__.py`` for
+    packages) or extension modules, it's maintained by
+    :func:`py2deb.hooks.update_module_index()` and
+    :func:`py2deb.hooks.cleanup_module_index()`. Modules that aren't in the
+    index (and submodules, which are found in the directory of their parent
+    package) are left to the other finders on :data:`sys.meta_path`. Modules
+    in the index are only resolved when they can't be found in the entries of
+    :data:`sys.path` that precede the directory of the index, so that (for
+    example) the standard library isn't shadowed by indexed modules.
+    """
+
+    def __init__(self, modules_directory):
+        """
+        Initialize a :class:`ModuleIndexFinder` object.
+
+        :param modules_directory: The absolute pathname of the directory where
+                                  Python modules are installed (a string).
+        """
+        self.modules_directory = modules_directory
+        self.modules = load_module_index(modules_directory)
+
+    def find_spec(self, fullname, path=None, target=None):
+        """
+        Find the module specification of a top level module.
+
+        :param fullname: The fully qualified name of the module (a string).
+        :param path: :data:`None` for top level modules, the ``__path__`` of
+                     the parent package for submodules.
+        :param target: Ignored (refer to :class:`importlib.abc.MetaPathFinder`).
+        :returns: A :class:`importlib.machinery.ModuleSpec` object or
+                  :data:`None` when the module isn't in the index.
+
+        The entries of :data:`sys.path` that precede the directory of the
+        index are searched first (using :class:`~importlib.machinery.PathFinder`)
+        so the result is the same as without the index. Namespace packages
+        found there don't take precedence over the indexed module (like
+        regular packages and modules don't).
+        """
+        if path is None:
+            location = self.modules.get(fullname)
+            if location:
+                try:
+                    preceding_entries = sys.path[:sys.path.index(self.modules_directory)]
+                except ValueError:
+                    # The index doesn't apply when its directory isn't on the module search path.
+                    return None
+                spec = PathFinder.find_spec(fullname, preceding_entries)
+                if spec is not None and spec.loader is not None:
+                    return spec
+                if os.path.basename(location) == '__init__.py':
+                    return spec_from_file_location(fullname, location,
+                                                   submodule_search_locations=[os.path.dirname(location)])
+                return spec_from_file_location(fullname, location)
+        return None
+
+    def invalidate_caches(self):
+        """Reload the index (this is called when the caches of the import system are invalidated)."""
+        self.modules = load_module_index(self.modules_directory)
+
+
+def install(modules_directory=None):
+    """
+    Add a :class:`ModuleIndexFinder` to :data:`sys.meta_path`.
+
+    :param modules_directory: The absolute pathname of the directory where
+                              Python modules are installed (a string,
+                              defaults to the directory that contains this
+                              module).
+    :returns: The :class:`ModuleIndexFinder` object or :data:`None` when the
+              running Python interpreter doesn't support it.
+
+    The finder is inserted just before :class:`~importlib.machinery.PathFinder`,
+    so built in and frozen modules keep precedence, and modules found earlier
+    on the module search path keep precedence as well (see
+    :func:`ModuleIndexFinder.find_spec()`). Installing a finder for the same
+    directory twice has no effect.
+    """
+    if spec_from_file_location is None:
+        return None
+    if not modules_directory:
+        modules_directory = os.path.dirname(os.path.abspath(__file__))
+    for finder in sys.meta_path:
+        if getattr(finder, 'modules_directory', None) == modules_directory:
+            return finder
+    finder = ModuleIndexFinder(modules_directory)
+    try:
+        position = sys.meta_path.index(PathFinder)
+    except ValueError:
+        position = len(sys.meta_path)
+    sys.meta_path.insert(position, finder)
+    return finder
+
+
+def load_module_index(modules_directory):
+    """
+    Load the index of top level modules.
+
+    :param modules_directory: The absolute pathname of the directory where
+                              Python modules are installed (a string).
+    :returns: A dictionary with the names of modules (strings) as keys and
+              the pathnames of their files (strings) as values. When the index
+              doesn't exist (yet) or can't be loaded an empty dictionary is
+              returned.
+    """
+    try:
+        with open(os.path.join(modules_directory, INDEX_FILENAME)) as handle:
+            entries = json.load(handle)
+        return dict((name, entry['path']) for name, entry in entries.items())
+    except (EnvironmentError, KeyError, TypeError, ValueError, AttributeError):
+        return {}
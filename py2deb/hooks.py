@@ -48,7 +48,8 @@ HAS_PEP_3147 = hasattr(imp, 'get_tag')
 logger = logging.getLogger('py2deb.hooks')
 
 
-def post_installation_hook(package_name, alternatives, modules_directory, namespaces, namespace_style):
+def post_installation_hook(package_name, alternatives, modules_directory, namespaces, namespace_style,
+                           bytecode_included=False, module_index=False):
     """
     Generic post-installation hook for packages generated by py2deb.
 
@@ -76,21 +77,37 @@ def post_installation_hook(package_name, alternatives, modules_directory, namesp
       The style of namespaces being used (one of the strings returned by
       :attr:`~py2deb.package.PackageToConvert.namespace_style`).
 
+    :param bytecode_included:
+
+      :data:`True` if the package includes bytecode files (see
+      :attr:`~py2deb.package.PackageToConvert.bytecode_included`),
+      :data:`False` otherwise.
+
+    :param module_index:
+
+      :data:`True` to add the top level modules of the package to the module
+      index (see :attr:`~py2deb.converter.PackageConverter.module_index_enabled`),
+      :data:`False` otherwise.
+
     Uses the following functions to implement everything py2deb needs from the
     post-installation maintainer script:
 
-    - :func:`generate_bytecode_files()`
+    - :func:`generate_bytecode_files()` (unless the package includes bytecode files)
     - :func:`create_alternatives()`
     - :func:`initialize_namespaces()`
+    - :func:`update_module_index()` (if `module_index` is :data:`True`)
     """
     initialize_logging()
     installed_files = find_installed_files(package_name)
-    generate_bytecode_files(package_name, installed_files)
+    if not bytecode_included:
+        generate_bytecode_files(package_name, installed_files)
     create_alternatives(package_name, alternatives)
     initialize_namespaces(package_name, modules_directory, namespaces, namespace_style)
+    if module_index:
+        update_module_index(package_name, modules_directory, installed_files)
 
 
-def pre_removal_hook(package_name, alternatives, modules_directory, namespaces):
+def pre_removal_hook(package_name, alternatives, modules_directory, namespaces, module_index=False):
     """
     Generic pre-removal hook for packages generated by py2deb.
 
@@ -113,18 +130,26 @@ def pre_removal_hook(package_name, alternatives, modules_directory, namespaces):
       The namespaces used by the package (a list of tuples in the format
       generated by :attr:`py2deb.package.PackageToConvert.namespaces`).
 
+    :param module_index:
+
+      :data:`True` to remove the top level modules of the package from the
+      module index, :data:`False` otherwise.
+
     Uses the following functions to implement everything py2deb needs from the
     pre-removal maintainer script:
 
     - :func:`cleanup_bytecode_files()`
     - :func:`cleanup_alternatives()`
     - :func:`cleanup_namespaces()`
+    - :func:`cleanup_module_index()` (if `module_index` is :data:`True`)
     """
     initialize_logging()
     installed_files = find_installed_files(package_name)
     cleanup_bytecode_files(package_name, installed_files)
     cleanup_alternatives(package_name, alternatives)
     cleanup_namespaces(package_name, modules_directory, namespaces)
+    if module_index:
+        cleanup_module_index(package_name, modules_directory)
 
 
 def initialize_logging():
@@ -195,13 +220,19 @@ def cleanup_bytecode_helper(filenames):
 
     :param filenames: A list of strings with the absolute pathnames of installed files.
     :returns: The number of files that were removed (an integer).
+
+    Bytecode files that are included in the list of filenames (because they
+    were included in the package) are left alone, these are removed by
+    :man:`dpkg` when the package is removed.
     """
     num_removed = 0
+    installed_files = set(filenames)
     for filename in filenames:
         if filename.endswith('.py'):
             for bytecode_file in find_bytecode_files(filename):
-                os.unlink(bytecode_file)
-                num_removed += 1
+                if bytecode_file not in installed_files:
+                    os.unlink(bytecode_file)
+                    num_removed += 1
             if HAS_PEP_3147:
                 remove_empty_directory(os.path.join(os.path.dirname(filename), '__pycache__'))
     return num_removed
@@ -375,6 +406,136 @@ def cleanup_namespaces(package_name, modules_directory, namespaces):
                 logger.info("Cleaned up %i namespaces for %s package.", num_cleaned, package_name)
 
 
+def update_module_index(package_name, modules_directory, installed_files):
+    """
+    Add the top level modules installed by a package to the module index.
+
+    :param package_name:
+
+        The name of the system package (a string).
+
+    :param modules_directory:
+
+        The absolute pathname of the directory where Python modules are
+        installed (a string).
+
+    :param installed_files:
+
+        A list of strings with the absolute pathnames of installed files.
+
+    The index is used by :class:`py2deb.finder.ModuleIndexFinder` to resolve
+    imports without searching the modules directory (refer to
+    :class:`ModuleIndex` and :func:`find_top_level_modules()`).
+    """
+    modules = find_top_level_modules(modules_directory, installed_files)
+    if modules:
+        with ModuleIndex(modules_directory) as index:
+            for name, pathname in modules:
+                index[name] = dict(path=pathname, package=package_name)
+        logger.info("Added %i module(s) of %s package to module index.", len(modules), package_name)
+
+
+def cleanup_module_index(package_name, modules_directory):
+    """
+    Remove the top level modules previously added by :func:`update_module_index()`.
+
+    :param package_name:
+
+        The name of the system package (a string).
+
+    :param modules_directory:
+
+        The absolute pathname of the directory where Python modules are
+        installed (a string).
+    """
+    with ModuleIndex(modules_directory) as index:
+        names = [name for name, entry in index.items() if entry.get('package') == package_name]
+        for name in names:
+            del index[name]
+    if names:
+        logger.info("Removed %i module(s) of %s package from module index.", len(names), package_name)
+
+
+def find_top_level_modules(modules_directory, installed_files):
+    """
+    Find the top level modules in a list of installed files.
+
+    :param modules_directory:
+
+        The absolute pathname of the directory where Python modules are
+        installed (a string).
+
+    :param installed_files:
+
+        A list of strings with the absolute pathnames of installed files.
+
+    :returns:
+
+        A sorted list of tuples with two strings each: The name of a module
+        and the pathname of its ``*.py`` file, the ``__init__.py`` file of a
+        package or an extension module.
+    """
+    modules = {}
+    for filename in installed_files:
+        directory, basename = os.path.split(filename)
+        if directory == modules_directory:
+            if basename.endswith('.py'):
+                name = basename[:-len('.py')]
+            elif basename.endswith('.so'):
+                # Extension modules like example.cpython-38-x86_64-linux-gnu.so.
+                name = basename.split('.')[0]
+            else:
+                continue
+        elif os.path.dirname(directory) == modules_directory and basename == '__init__.py':
+            name = os.path.basename(directory)
+        else:
+            continue
+        if name.replace('_', 'a').isalnum() and not name[0].isdigit():
+            modules[name] = filename
+    return sorted(modules.items())
+
+
+class ModuleIndex(dict):
+
+    """
+    Persistent index of the top level modules installed in a modules directory.
+
+    The keys are module names and the values are dictionaries with the keys
+    ``path`` (the pathname of the module) and ``package`` (the name of the
+    system package that installed the module). The index is loaded by
+    :func:`py2deb.finder.load_module_index()`, so it's replaced atomically
+    (processes that are starting up never see a partially written file).
+    """
+
+    def __init__(self, modules_directory):
+        """
+        Initialize a :class:`ModuleIndex` object.
+
+        :param modules_directory:
+
+            The absolute pathname of the directory where Python modules are
+            installed (a string).
+        """
+        self.data_file = os.path.join(modules_directory, 'py2deb-modules.json')
+
+    def __enter__(self):
+        """Load the persistent data file (if it exists)."""
+        if os.path.isfile(self.data_file):
+            with open(self.data_file) as handle:
+                self.update(json.load(handle))
+        return self
+
+    def __exit__(self, exc_type=None, exc_value=None, traceback=None):
+        """Save the persistent data file."""
+        if len(self) > 0:
+            temporary_file = '%s.%i' % (self.data_file, os.getpid())
+            with open(temporary_file, 'w') as handle:
+                json.dump(self, handle, indent=2, sort_keys=True)
+            os.rename(temporary_file, self.data_file)
+        elif os.path.isfile(self.data_file):
+            os.unlink(self.data_file)
+
+
 class NameSpaceReferenceCount(dict):
 
     """Persistent reference counting for initialization of namespace packages."""
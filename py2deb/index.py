@@ -0,0 +1,342 @@
+# py2deb: Python to Debian package converter.
+#
+# Author: Peter Odding <peter.odding@paylogic.com>
+# Last Change: August 6, 2020
+# URL: https://py2deb.readthedocs.io
+
+"""
+The :mod:`py2deb.index` module implements a persistent index of repository directories.
+
+Finding the archives in a repository directory used to require listing the
+directory and parsing the filename of every ``*.deb`` archive whenever a
+:class:`.PackageRepository` was created. For repositories containing tens of
+thousands of archives this made every conversion start slowly. The
+:class:`RepositoryIndex` class keeps the metadata of the archives in an SQLite_
+database inside the repository directory, so that it can be shared by every
+py2deb process that uses the repository.
+
+.. _SQLite: https://sqlite.org/
+"""
+
+# Standard library modules.
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+# External dependencies.
+from deb_pkg_tools.package import BINARY_PACKAGE_ARCHIVE_EXTENSIONS, PackageFile, parse_filename
+from deb_pkg_tools.version import Version
+from humanfriendly.text import pluralize
+from property_manager import PropertyManager, lazy_property, required_property
+
+# Modules included in our package.
+from py2deb.utils import hash_files
+
+# Initialize a logger.
+logger = logging.getLogger(__name__)
+
+INDEX_DIRECTORY = '.py2deb'
+"""
+The name of the subdirectory of a repository that contains the index (a string).
+
+The index is stored in a subdirectory so that the (temporary) journal files
+created by SQLite_ don't change the last modified time of the repository
+directory (which would defeat :func:`RepositoryIndex.reconcile()`).
+"""
+
+INDEX_FILENAME = 'index.sqlite3'
+"""The filename of the index inside :data:`INDEX_DIRECTORY` (a string)."""
+
+SCHEMA_VERSION = 2
+"""The version of the database schema (an integer, stored as ``PRAGMA user_version``)."""
+
+
+class RepositoryIndex(PropertyManager):
+
+    """
+    Persistent index of the ``*.deb`` archives in a repository directory.
+
+    For each archive the index records the package name, version and
+    architecture (parsed from the filename), the size and last modified time
+    of the file, the SHA-256 digest of its contents and its manifest (refer to
+    :mod:`py2deb.manifests`). The digest is calculated when an archive is
+    added using :func:`add_archive()` and otherwise on demand by
+    :func:`get_checksum()` (hashing every archive in a large repository that
+    was populated by other means would be very slow). Manifests are recorded
+    when py2deb builds an archive and otherwise on demand by
+    :func:`.PackageRepository.get_manifest()`.
+
+    The index is kept up to date in two ways:
+
+    - :func:`add_archive()` updates the index incrementally when py2deb adds
+      an archive to the repository (including the recorded last modified
+      time of the directory, when the index was up to date before).
+
+    - :func:`reconcile()` compares the index to the repository directory, but
+      only when the last modified time of the directory differs from the one
+      recorded during the previous reconciliation (i.e. when files have been
+      added, removed or renamed by other means). Only archives that are new
+      or whose size or last modified time changed have their filename parsed.
+    """
+
+    def __init__(self, directory):
+        """
+        Initialize a :class:`RepositoryIndex` object.
+
+        :param directory: The pathname of the repository directory (a string).
+        """
+        super(RepositoryIndex, self).__init__(directory=directory)
+
+    @lazy_property
+    def connection(self):
+        """
+        The connection to the SQLite_ database (a :class:`sqlite3.Connection` object).
+
+        The database (and the directory that contains it) is created when it
+        doesn't exist yet. When the schema of an existing database doesn't
+        match :data:`SCHEMA_VERSION` it's recreated (it's only a cache after
+        all).
+        """
+        if not os.path.isdir(os.path.dirname(self.filename)):
+            os.makedirs(os.path.dirname(self.filename))
+        connection = sqlite3.connect(self.filename, timeout=60, check_same_thread=False)
+        with connection:
+            if connection.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                logger.debug("Initializing repository index: %s", self.filename)
+                connection.execute('DROP TABLE IF EXISTS archives')
+                connection.execute('DROP TABLE IF EXISTS properties')
+                connection.execute('''
+                    CREATE TABLE archives (
+                        filename TEXT PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        version TEXT NOT NULL,
+                        architecture TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        mtime REAL NOT NULL,
+                        checksum TEXT,
+                        manifest TEXT
+                    )
+                ''')
+                connection.execute('CREATE INDEX archives_by_name ON archives (name, version, architecture)')
+                connection.execute('CREATE TABLE properties (name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+                connection.execute('PRAGMA user_version = %i' % SCHEMA_VERSION)
+        return connection
+
+    @required_property
+    def directory(self):
+        """The pathname of the repository (a string)."""
+
+    @lazy_property
+    def filename(self):
+        """The pathname of the SQLite_ database (a string)."""
+        return os.path.join(self.directory, INDEX_DIRECTORY, INDEX_FILENAME)
+
+    @lazy_property
+    def lock(self):
+        """
+        A lock that serializes access to :attr:`connection` (a :class:`threading.Lock` object).
+
+        This makes it safe to share the index between threads.
+        """
+        return threading.Lock()
+
+    @property
+    def owned_by_current_user(self):
+        """
+        :data:`True` if :attr:`directory` and the index are owned by the current user, :data:`False` otherwise.
+
+        In a repository directory that's shared with other users (like
+        ``/tmp``, the default repository) the index would be shared as well,
+        so other users could create or change it (and the archives listed in
+        it). The index file and the directory that contains it only need to
+        be owned by the current user when they exist (they're created on
+        demand) and they're checked using :func:`os.lstat()` so that a
+        symbolic link planted by another user isn't followed.
+        """
+        uid = os.getuid()
+        if os.stat(self.directory).st_uid != uid:
+            return False
+        for pathname in (os.path.dirname(self.filename), self.filename):
+            if os.path.lexists(pathname) and os.lstat(pathname).st_uid != uid:
+                return False
+        return True
+
+    def add_archive(self, pathname, checksum=None, manifest=None, directory_mtime=None):
+        """
+        Add an archive to the index (or update the entry of an existing archive).
+
+        :param pathname: The pathname of a ``*.deb`` archive inside
+                         :attr:`directory` (a string).
+        :param checksum: The SHA-256 digest of the archive (a string). If this
+                         isn't given it's calculated.
+        :param manifest: The manifest of the archive (a dictionary, refer to
+                         :mod:`py2deb.manifests`). If this isn't given it's
+                         created on demand by :func:`.PackageRepository.get_manifest()`.
+        :param directory_mtime: The last modified time of :attr:`directory`
+                                before the archive was moved into it (a
+                                number, optional).
+        :returns: A :class:`~deb_pkg_tools.package.PackageFile` object.
+
+        When the archive is already indexed and its size and last modified
+        time haven't changed (e.g. because it was hard linked from the
+        :class:`.BuildCache`) the known checksum and manifest are kept.
+
+        When `directory_mtime` matches the value recorded by :func:`reconcile()`
+        the index was up to date before the archive was added, so the new last
+        modified time of :attr:`directory` is recorded in the same transaction
+        (otherwise the next call to :func:`get_archives()` would scan the
+        directory again because of this archive).
+        """
+        archive = parse_filename(pathname)
+        stat = os.stat(archive.filename)
+        known_checksum, known_manifest = self.get_known_values(archive.filename, stat)
+        checksum = checksum or known_checksum or hash_files(archive.filename)
+        manifest = json.dumps(manifest) if manifest else known_manifest
+        with self.lock, self.connection:
+            self.update_entry(archive, stat, checksum, manifest)
+            if directory_mtime is not None:
+                row = self.connection.execute("SELECT value FROM properties WHERE name = 'mtime'").fetchone()
+                if row and row[0] == repr(directory_mtime):
+                    self.connection.execute(
+                        "UPDATE properties SET value = ? WHERE name = 'mtime'",
+                        (repr(os.stat(self.directory).st_mtime),),
+                    )
+        return archive
+
+    def get_archives(self):
+        """
+        Get the archives in the repository.
+
+        :returns: A sorted list of :class:`~deb_pkg_tools.package.PackageFile` objects.
+
+        The index is reconciled against the repository directory before it's
+        queried (see :func:`reconcile()`).
+        """
+        self.reconcile()
+        with self.lock:
+            rows = self.connection.execute('SELECT filename, name, version, architecture FROM archives').fetchall()
+        return sorted(PackageFile(
+            name=name,
+            version=Version(version),
+            architecture=architecture,
+            filename=os.path.join(self.directory, filename),
+        ) for filename, name, version, architecture in rows)
+
+    def get_checksum(self, pathname):
+        """
+        Get the SHA-256 digest of an archive in the repository.
+
+        :param pathname: The pathname of a ``*.deb`` archive inside
+                         :attr:`directory` (a string).
+        :returns: A hexadecimal digest (a string).
+
+        The digest is calculated (and stored in the index) when the index
+        doesn't contain a digest yet or the size or last modified time of the
+        archive changed since the digest was calculated.
+        """
+        pathname = os.path.join(self.directory, os.path.basename(pathname))
+        checksum, manifest = self.get_known_values(pathname, os.stat(pathname))
+        if not checksum:
+            checksum = hash_files(pathname)
+            self.add_archive(pathname, checksum)
+        return checksum
+
+    def get_known_values(self, pathname, stat):
+        """
+        Get the checksum and manifest of an archive from the index.
+
+        :param pathname: The pathname of a ``*.deb`` archive inside
+                         :attr:`directory` (a string).
+        :param stat: The result of :func:`os.stat()` for the archive.
+        :returns: A tuple with two values: The SHA-256 digest of the archive
+                  and the manifest of the archive (serialized as JSON). Each
+                  value is :data:`None` when it's not known or the size or
+                  last modified time of the archive changed since it was
+                  recorded.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT size, mtime, checksum, manifest FROM archives WHERE filename = ?',
+                (os.path.basename(pathname),),
+            ).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            return row[2], row[3]
+        return None, None
+
+    def get_manifest(self, pathname):
+        """
+        Get the manifest of an archive from the index.
+
+        :param pathname: The pathname of a ``*.deb`` archive inside
+                         :attr:`directory` (a string).
+        :returns: A manifest (a dictionary) or :data:`None` when the index
+                  doesn't contain a (current) manifest for the archive.
+        """
+        pathname = os.path.join(self.directory, os.path.basename(pathname))
+        checksum, manifest = self.get_known_values(pathname, os.stat(pathname))
+        return json.loads(manifest) if manifest else None
+
+    def reconcile(self):
+        """
+        Synchronize the index with the contents of the repository directory.
+
+        :returns: :data:`True` if the directory was scanned, :data:`False` if
+                  the index was known to be up to date.
+
+        The last modified time of the repository directory is compared to the
+        value recorded during the previous reconciliation. When they match no
+        files have been added, removed or renamed in the meantime and the
+        directory isn't scanned.
+
+        The last modified time is recorded *before* the directory is scanned,
+        so that archives added during the scan are picked up next time.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM properties WHERE name = 'mtime'").fetchone()
+        directory_mtime = repr(os.stat(self.directory).st_mtime)
+        if row and row[0] == directory_mtime:
+            return False
+        logger.debug("Reconciling repository index with directory contents: %s", self.directory)
+        on_disk = {}
+        for filename in os.listdir(self.directory):
+            if filename.endswith(BINARY_PACKAGE_ARCHIVE_EXTENSIONS):
+                pathname = os.path.join(self.directory, filename)
+                if os.path.isfile(pathname):
+                    on_disk[filename] = os.stat(pathname)
+        with self.lock, self.connection:
+            indexed = dict((filename, (size, mtime)) for filename, size, mtime in self.connection.execute(
+                'SELECT filename, size, mtime FROM archives'
+            ))
+            removed = [(filename,) for filename in indexed if filename not in on_disk]
+            self.connection.executemany('DELETE FROM archives WHERE filename = ?', removed)
+            changed = 0
+            for filename, stat in on_disk.items():
+                if indexed.get(filename) != (stat.st_size, stat.st_mtime):
+                    archive = parse_filename(os.path.join(self.directory, filename))
+                    self.update_entry(archive, stat, None, None)
+                    changed += 1
+            self.connection.execute(
+                "INSERT OR REPLACE INTO properties (name, value) VALUES ('mtime', ?)", (directory_mtime,)
+            )
+        logger.debug("Updated %s and removed %s from repository index.",
+                     pluralize(changed, "archive"), pluralize(len(removed), "archive"))
+        return True
+
+    def update_entry(self, archive, stat, checksum, manifest):
+        """
+        Insert or replace the entry of an archive (the caller is expected to hold :attr:`lock`).
+
+        :param archive: A :class:`~deb_pkg_tools.package.PackageFile` object.
+        :param stat: The result of :func:`os.stat()` for the archive.
+        :param checksum: The SHA-256 digest of the archive (a string or :data:`None`).
+        :param manifest: The manifest of the archive serialized as JSON (a string or :data:`None`).
+        """
+        self.connection.execute('''
+            INSERT OR REPLACE INTO archives (filename, name, version, architecture, size, mtime, checksum, manifest)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            os.path.basename(archive.filename), archive.name, str(archive.version),
+            archive.architecture, stat.st_size, stat.st_mtime, checksum, manifest,
+        ))
@@ -0,0 +1,255 @@
+# py2deb: Python to Debian package converter.
+#
+# Author: Peter Odding <peter.odding@paylogic.com>
+# Last Change: August 6, 2020
+# URL: https://py2deb.readthedocs.io
+
+"""
+The :mod:`py2deb.manifests` module implements the check for duplicate files.
+
+After a requirement set has been converted py2deb checks that the converted
+packages don't contain conflicting files. This check used to be implemented
+using :func:`deb_pkg_tools.checks.check_duplicate_files()` which inspects the
+contents of every archive in the requirement set, even when most of them were
+converted (and checked) before.
+
+Instead py2deb now records a *manifest* for every archive: The pathnames of
+the files installed by the package and the names in its ``Conflicts`` and
+``Provides`` fields. Manifests of newly built archives are created from the
+build directory (see :func:`create_manifest()`) and manifests of existing
+archives are stored in the index of the repository (see
+:class:`.RepositoryIndex`), so the check itself is an in memory join of
+pathnames to packages (see :func:`check_duplicate_files()`).
+
+A manifest is a dictionary with the keys ``pathnames``, ``conflicts`` and
+``provides`` whose values are sorted lists of strings (so that manifests can
+be serialized as JSON). Manifests of newly built archives also have the key
+``checksums`` whose value is a dictionary with the pathnames of the files and
+the SHA-256 digests of their contents. These digests (and the MD5 digests in
+the ``md5sums`` control file) are calculated while the files are written to
+the build directory or archive (see :func:`get_digests()`), so the contents of
+a package don't need to be read again.
+"""
+
+# Standard library modules.
+import collections
+import hashlib
+import itertools
+import logging
+import os
+
+# External dependencies.
+from deb_pkg_tools.checks import DuplicateFilesFound
+from deb_pkg_tools.control import load_control_file
+from deb_pkg_tools.package import inspect_package, parse_filename
+from humanfriendly import Timer
+from humanfriendly.text import compact, pluralize
+
+# Initialize a logger.
+logger = logging.getLogger(__name__)
+
+
+def check_duplicate_files(archives, manifests):
+    """
+    Check a group of converted packages for conflicting files.
+
+    :param archives: A list of filenames (strings) of ``*.deb`` archives.
+    :param manifests: A list of manifests (dictionaries) that matches `archives`.
+    :raises: :exc:`~deb_pkg_tools.checks.DuplicateFilesFound` when duplicate
+             files are found.
+
+    This implements the same rules as
+    :func:`deb_pkg_tools.checks.check_duplicate_files()`: Multiple versions of
+    the same package are never reported and packages that have marked each
+    other as conflicting (by setting their ``Conflicts`` and ``Provides``
+    fields to a common value) are ignored. The error message is formatted in
+    the same way as well.
+    """
+    timer = Timer()
+    archives = [parse_filename(a) for a in archives]
+    manifests_by_archive = dict(zip(archives, manifests))
+    logger.info("Checking for duplicate files in %s ..", pluralize(len(archives), "package archive"))
+    # Join pathnames to the archives that contain them.
+    global_contents = collections.defaultdict(set)
+    for archive, manifest in manifests_by_archive.items():
+        for pathname in manifest['pathnames']:
+            global_contents[pathname].add(archive)
+    # Group the duplicate files by the archives involved.
+    duplicate_files = collections.defaultdict(list)
+    for pathname, group in global_contents.items():
+        if len(group) > 1:
+            duplicate_files[tuple(sorted(group, key=lambda a: a.filename))].append(pathname)
+    for group in list(duplicate_files):
+        # Never report multiple versions of the same package.
+        if len(set(archive.name for archive in group)) == 1:
+            duplicate_files.pop(group)
+            continue
+        # Ignore packages that have marked each other as conflicting.
+        marked_conflicts = find_virtual_name(manifests_by_archive, group, 'conflicts')
+        marked_provides = find_virtual_name(manifests_by_archive, group, 'provides')
+        if marked_conflicts and marked_conflicts == marked_provides:
+            duplicate_files.pop(group)
+    if duplicate_files:
+        summary = []
+        for group, filenames in sorted(duplicate_files.items()):
+            block = []
+            conflicts = pluralize(len(filenames), 'conflict', 'conflicts')
+            block.append("Found %s between %i packages:\n" % (conflicts, len(group)))
+            for i, archive in enumerate(sorted(group), start=1):
+                block.append("  %i. %s\n" % (i, archive.filename))
+            block.append("These packages contain %s:\n" % conflicts)
+            for i, filename in enumerate(sorted(filenames), start=1):
+                block.append("  %i. %s\n" % (i, filename))
+            summary.append(''.join(block))
+        archives_involved = set(itertools.chain.from_iterable(duplicate_files.keys()))
+        summary.insert(0, "Found %s in %s!\n" % (
+            pluralize(len(duplicate_files), 'duplicate file', 'duplicate files'),
+            pluralize(len(archives_involved), 'package archive', 'package archives'),
+        ))
+        summary.append(compact("""
+            Hint: If the package contents are correct you can resolve these
+            conflicts by marking the packages as conflicting. You do this by
+            adding the 'Conflicts' and 'Provides' fields and setting them to a
+            common value. That should silence this message.
+        """))
+        raise DuplicateFilesFound(('%s\n' % ('-' * 79)).join(summary))
+    logger.info("No conflicting files found (took %s).", timer)
+
+
+def create_manifest(build_directory, digests=None):
+    """
+    Create the manifest of a package from its build directory.
+
+    :param build_directory: The pathname of a directory containing the files
+                            to be packaged and a ``DEBIAN`` directory with the
+                            control file (a string).
+    :param digests: A dictionary with absolute pathnames (on the target system)
+                    of files in the build directory and tuples with their MD5
+                    and SHA-256 digests (see :func:`get_digests()`). Files that
+                    aren't in the dictionary are hashed and added to it.
+                    Digests of files that no longer exist are removed.
+    :returns: A manifest (a dictionary).
+    """
+    if digests is None:
+        digests = {}
+    pathnames = []
+    for root, dirs, files in os.walk(build_directory):
+        if root == build_directory and 'DEBIAN' in dirs:
+            dirs.remove('DEBIAN')
+        # Symbolic links to directories are reported as directories by
+        # os.walk() but they're not directories from the perspective of dpkg.
+        for name in files + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+            filename = os.path.join(root, name)
+            pathname = '/' + os.path.relpath(filename, build_directory)
+            pathnames.append(pathname)
+            if pathname not in digests and not os.path.islink(filename):
+                digests[pathname] = get_file_digests(filename)
+    for pathname in set(digests) - set(pathnames):
+        digests.pop(pathname)
+    return make_manifest(pathnames, load_control_file(os.path.join(build_directory, 'DEBIAN', 'control')),
+                         checksums=dict((p, d[1]) for p, d in digests.items()))
+
+
+def find_virtual_name(manifests_by_archive, group, field_name):
+    """
+    Find the single package name that a group of archives share in one of their relationship fields.
+
+    :param manifests_by_archive: A dictionary with archives and manifests.
+    :param group: An iterable of archives.
+    :param field_name: The name of a relationship in the manifests (a string).
+    :returns: A package name (a string) or :data:`None`.
+    """
+    package_names = set()
+    for archive in group:
+        names = manifests_by_archive[archive][field_name]
+        if not names:
+            return None
+        package_names.update(names)
+    if len(package_names) == 1:
+        return list(package_names)[0]
+
+
+def get_digests(contents):
+    """
+    Calculate the digests of the contents of a file.
+
+    :param contents: The contents of a file (a byte string).
+    :returns: A tuple with the hexadecimal MD5 and SHA-256 digests (two strings).
+    """
+    return hashlib.md5(contents).hexdigest(), hashlib.sha256(contents).hexdigest()
+
+
+def get_file_digests(filename):
+    """
+    Calculate the digests of a file (in a single pass).
+
+    :param filename: The pathname of the file (a string).
+    :returns: A tuple with the hexadecimal MD5 and SHA-256 digests (two strings).
+    """
+    md5 = hashlib.md5()
+    sha256 = hashlib.sha256()
+    with open(filename, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b''):
+            md5.update(chunk)
+            sha256.update(chunk)
+    return md5.hexdigest(), sha256.hexdigest()
+
+
+def get_names(fields, field_name):
+    """
+    Get the package names in a relationship field.
+
+    :param fields: A dictionary with parsed control fields.
+    :param field_name: The name of a relationship field (a string).
+    :returns: A sorted list of package names.
+    """
+    field = fields.get(field_name)
+    return sorted(field.names) if field else []
+
+
+def load_manifest(archive, cache=None):
+    """
+    Create the manifest of an existing archive.
+
+    :param archive: The pathname of a ``*.deb`` archive (a string).
+    :param cache: The :class:`deb_pkg_tools.cache.PackageCache` to use
+                  (defaults to :data:`None`).
+    :returns: A manifest (a dictionary).
+    """
+    fields, contents = inspect_package(archive, cache=cache)
+    return make_manifest((p for p, entry in contents.items() if not entry.permissions.startswith('d')), fields)
+
+
+def make_manifest(pathnames, fields, checksums=None):
+    """
+    Create a manifest from the contents and control fields of a package.
+
+    :param pathnames: An iterable with the absolute pathnames of the files
+                      installed by the package (strings).
+    :param fields: A dictionary with parsed control fields (refer to
+                   :func:`deb_pkg_tools.control.parse_control_fields()`).
+    :param checksums: A dictionary with absolute pathnames and SHA-256 digests
+                      (strings) or :data:`None`.
+    :returns: A manifest (a dictionary).
+    """
+    manifest = dict(
+        pathnames=sorted(pathnames),
+        conflicts=get_names(fields, 'Conflicts'),
+        provides=get_names(fields, 'Provides'),
+    )
+    if checksums is not None:
+        manifest['checksums'] = dict(checksums)
+    return manifest
+
+
+def write_md5sums(directory, digests):
+    """
+    Create the ``DEBIAN/md5sums`` control file of a package.
+
+    :param directory: The pathname of a directory containing the files to be
+                      packaged and a ``DEBIAN`` directory (a string).
+    :param digests: A dictionary like the one used by :func:`create_manifest()`.
+    """
+    with open(os.path.join(directory, 'DEBIAN', 'md5sums'), 'w') as handle:
+        for pathname, (md5, sha256) in sorted(digests.items()):
+            handle.write('%s  %s\n' % (md5, pathname.lstrip('/')))
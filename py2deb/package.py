@@ -18,34 +18,59 @@ conversion logic.
 """
 
 # Standard library modules.
+import contextlib
 import glob
+import hashlib
 import logging
 import os
-import platform
+import py_compile
 import re
-import sys
+import tempfile
 import time
+import zipfile
+from multiprocessing.pool import ThreadPool
 
 # External dependencies.
-from deb_pkg_tools.control import merge_control_fields, unparse_control_fields
-from deb_pkg_tools.package import build_package, find_object_files, find_system_dependencies, strip_object_files
+from deb_pkg_tools.control import merge_control_fields, parse_control_fields, unparse_control_fields
+from deb_pkg_tools.package import (
+    clean_package_tree,
+    parse_filename,
+)
 from executor import execute
 from humanfriendly.text import concatenate, pluralize
-from pkg_resources import Requirement
+from pkg_resources import EntryPoint, Requirement
 from pkginfo import UnpackedSDist
-from property_manager import PropertyManager, cached_property
+from property_manager import PropertyManager, cached_property, mutable_property
 from six import BytesIO
 from six.moves import configparser
 
 # Modules included in our package.
+from py2deb import __version__
+from py2deb.elf import find_elf_files, is_elf_data
+from py2deb.manifests import create_manifest, make_manifest, write_md5sums
 from py2deb.namespaces import find_pkgutil_namespaces
 from py2deb.utils import (
-    TemporaryDirectory,
-    detect_python_script,
-    embed_install_prefix,
+    ChainedFile,
+    compile_bytecode,
+    describe_callable,
+    find_system_dependencies,
+    hash_directory,
+    hash_files,
+    link_or_copy,
     normalize_package_version,
     package_names_match,
     python_version,
+    rewrite_script,
+    strip_object_files,
+)
+from py2deb.writer import (
+    CHUNK_SIZE,
+    COMPRESSION_EXTENSIONS,
+    DEFAULT_COMPRESSION,
+    ArchiveWriter,
+    build_archive,
+    copy_chunks,
+    run_lintian,
 )
 
 # Initialize a logger.
@@ -79,6 +104,67 @@ class PackageToConvert(PropertyManager):
         self.converter = converter
         self.requirement = requirement
 
+    @cached_property
+    def bytecode_included(self):
+        """
+        :data:`True` if bytecode files are included in the package, :data:`False` otherwise.
+
+        This requires :attr:`.PackageConverter.precompile_enabled` to be
+        :data:`True`, support for unchecked hash based bytecode files (Python
+        3.7 and newer) and a package that's converted by :func:`convert_streaming()`
+        (because :func:`.build_archive()` removes
+        ``__pycache__`` directories). When this is :data:`False` the bytecode
+        files are generated by the post-installation script instead.
+        """
+        if not self.converter.precompile_enabled:
+            return False
+        if not hasattr(py_compile, 'PycInvalidationMode'):
+            logger.debug("Not including bytecode files in %s because %s doesn't support unchecked hash pycs.",
+                         self.python_name, python_version())
+            return False
+        if not self.streaming_supported:
+            logger.debug("Not including bytecode files in %s because it's not streamed.", self.python_name)
+            return False
+        return True
+
+    @cached_property
+    def console_scripts(self):
+        """
+        The console scripts defined by the package (a dictionary).
+
+        The keys are the names of the executables and the values are
+        :class:`pkg_resources.EntryPoint` objects. They're parsed from the
+        ``console_scripts`` and ``gui_scripts`` sections of the
+        ``entry_points.txt`` file in the package metadata (see
+        :func:`find_egg_info_file()`). Used to generate launchers when
+        :attr:`.PackageConverter.fast_launchers_enabled` is :data:`True`.
+        """
+        console_scripts = {}
+        filename = self.find_egg_info_file('entry_points.txt')
+        if filename:
+            try:
+                with open(filename) as handle:
+                    entry_points = EntryPoint.parse_map(handle.read())
+            except ValueError:
+                logger.warning("Failed to parse entry points of %s!", self, exc_info=True)
+            else:
+                for group in ('console_scripts', 'gui_scripts'):
+                    console_scripts.update(entry_points.get(group, {}))
+        return console_scripts
+
+    @mutable_property
+    def dbgsym_archive(self):
+        """
+        The pathname of the generated debug symbol package (a string or :data:`None`).
+
+        This is set by :func:`convert()` when
+        :attr:`.PackageConverter.dbgsym_enabled` is :data:`True` and the
+        package contains object files with debugging information (see
+        :func:`build_dbgsym_package()`). It's used by
+        :func:`.PackageConverter.store_archive()` to move the archive to the
+        repository.
+        """
+
     @cached_property
     def debian_dependencies(self):
         """
@@ -89,7 +175,8 @@ class PackageToConvert(PropertyManager):
 
         :returns: A list with Debian package relationships (strings) in the
                   format of the ``Depends:`` line of a Debian package
-                  ``control`` file. Based on :data:`python_requirements`.
+                  ``control`` file. Based on :data:`python_requirements`
+                  (and :attr:`.PackageConverter.module_index_required`).
 
         .. _Python version specifiers: http://www.python.org/dev/peps/pep-0440/#version-specifiers
         .. _Debian package relationships: https://www.debian.org/doc/debian-policy/ch-relationships.html
@@ -125,6 +212,9 @@ class PackageToConvert(PropertyManager):
                         raise Exception(msg % (constraint, self.python_name))
             else:
                 dependencies.add(debian_package_name)
+        if self.converter.module_index_required:
+            # Imports are resolved by the finder in the runtime package.
+            dependencies.add(self.converter.module_index_package)
         dependencies = sorted(dependencies)
         logger.debug("Debian dependencies of %s: %r", self, dependencies)
         return dependencies
@@ -135,9 +225,13 @@ class PackageToConvert(PropertyManager):
         Get a minimal description for the converted Debian package.
 
         Includes the name of the Python package and the date at which the
-        package was converted.
+        package was converted (except when :attr:`~.PackageConverter.reproducible`
+        is :data:`True`).
         """
-        text = ["Python package", self.python_name, "converted by py2deb on"]
+        text = ["Python package", self.python_name, "converted by py2deb"]
+        if self.converter.reproducible:
+            return ' '.join(text)
+        text.append("on")
         # The %e directive (not documented in the Python standard library but
         # definitely available on Linux which is the only platform that py2deb
         # targets, for obvious reasons :-) includes a leading space for single
@@ -212,6 +306,11 @@ class PackageToConvert(PropertyManager):
         else:
             return ''
 
+    @property
+    def debian_relationship(self):
+        """The Debian package relationship required to depend on the converted package (a string)."""
+        return '%s (= %s)' % (self.debian_name, self.debian_version)
+
     @cached_property
     def debian_version(self):
         """
@@ -231,14 +330,91 @@ class PackageToConvert(PropertyManager):
 
         :returns:
 
-            The pathname of the found archive (a string) or :data:`None` if no
-            existing archive is found.
+            A :class:`deb_pkg_tools.package.PackageFile` object for the found
+            archive or :data:`None` if no existing archive is found.
+
+        When a :attr:`~.PackageConverter.build_cache` is configured the
+        repository is ignored and the archive is looked up in the cache based
+        on :attr:`fingerprint` instead. Cached archives are linked into the
+        repository (replacing any archive with the same filename that was
+        built from different inputs) and when the cache doesn't contain a
+        matching archive :data:`None` is returned, so that the package is
+        converted again.
         """
-        return self.converter.repository.get_package(
-            self.debian_name, self.debian_version, "all"
-        ) or self.converter.repository.get_package(
-            self.debian_name, self.debian_version, self.converter.debian_architecture
-        )
+        if self.converter.build_cache:
+            cached_archive = self.converter.build_cache.get(self.fingerprint)
+            if not cached_archive:
+                return None
+            logger.info("Using cached archive of %s (fingerprint %s).", self.python_name, self.fingerprint)
+            directory_mtime = self.converter.repository.get_directory_mtime()
+            pathname = link_or_copy(cached_archive, os.path.join(
+                self.converter.repository.directory,
+                os.path.basename(cached_archive),
+            ))
+            self.converter.repository.add_archive(pathname, directory_mtime=directory_mtime)
+            return parse_filename(pathname)
+        candidates = [(self.debian_name, self.debian_version, 'all'),
+                      (self.debian_name, self.debian_version, self.converter.debian_architecture)]
+        existing_packages = self.converter.repository.get_packages(candidates)
+        for key in candidates:
+            if key in existing_packages:
+                return existing_packages[key]
+
+    @cached_property
+    def fingerprint(self):
+        """
+        A fingerprint of the inputs that determine the converted package (a string).
+
+        The fingerprint is the SHA-256 digest of :attr:`fingerprint_inputs`.
+        It's used to look up previously converted archives in the
+        :attr:`~.PackageConverter.build_cache`.
+        """
+        digest = hashlib.sha256()
+        for name, value in self.fingerprint_inputs:
+            digest.update(('%s: %s\n' % (name, value)).encode('UTF-8'))
+        return digest.hexdigest()
+
+    @cached_property
+    def fingerprint_inputs(self):
+        """
+        The inputs that determine the contents of the converted package.
+
+        :returns: A list of tuples with two strings each (a name and a value).
+
+        This includes the checksum of the source distribution, the name,
+        version and relationships of the Debian package (which cover the
+        name prefix, name mapping, system packages and prerelease
+        workaround), the conversion options (including the user defined
+        :attr:`~.PackageConverter.path_rules`) that influence the contents of
+        the package, the version of Python and the version of py2deb.
+
+        The date and time embedded in :attr:`debian_description` are
+        deliberately excluded (otherwise nothing would ever be reused).
+        """
+        return [
+            ('py2deb-version', __version__),
+            ('python-version', python_version()),
+            ('architecture', self.converter.debian_architecture),
+            ('source-checksum', self.source_checksum),
+            ('name', self.debian_name),
+            ('version', self.debian_version),
+            ('provides', self.debian_provides),
+            ('depends', ', '.join(self.debian_dependencies)),
+            ('maintainer', self.debian_maintainer),
+            ('install-prefix', self.converter.install_prefix),
+            ('alternatives', repr(sorted(self.converter.alternatives))),
+            ('script', self.converter.scripts.get(self.python_name.lower(), '')),
+            ('python-callback', describe_callable(self.converter.python_callback)),
+            ('path-rules', repr([(pattern, describe_callable(replacement) if callable(replacement) else replacement)
+                                 for pattern, replacement in self.converter.path_rules])),
+            ('lintian-ignore', repr(sorted(self.converter.lintian_ignore))),
+            ('compression', repr(sorted(self.converter.get_compression_options(self.python_name).items()))),
+            ('streaming', str(self.streaming_supported)),
+            ('source-date-epoch', str(self.source_date_epoch)),
+            ('bytecode', str(self.bytecode_included)),
+            ('launchers', str(self.converter.fast_launchers_enabled)),
+            ('zip-bundles', str(self.converter.zip_bundles_enabled)),
+        ]
 
     @cached_property
     def has_custom_install_prefix(self):
@@ -256,6 +432,35 @@ class PackageToConvert(PropertyManager):
         """
         return self.converter.install_prefix not in KNOWN_INSTALL_PREFIXES
 
+    @property
+    def lintian_inline(self):
+        """
+        :data:`True` if Lintian_ should check the package while it's being built, :data:`False` otherwise.
+
+        This is :data:`True` when :attr:`~.PackageConverter.lintian_enabled` is
+        :data:`True` and :attr:`~.PackageConverter.lintian_batch` is
+        :data:`False`. In batch mode the package is checked after the
+        conversion (refer to :func:`.PackageConverter.run_lintian_batch()`).
+
+        .. _Lintian: http://lintian.debian.org/
+        """
+        return self.converter.lintian_enabled and not self.converter.lintian_batch
+
+    @property
+    def lintian_overrides_file(self):
+        """The absolute pathname of the Lintian overrides file on the target system (a string)."""
+        return os.path.join('/usr/share/lintian/overrides', self.debian_name)
+
+    @mutable_property
+    def manifest(self):
+        """
+        The manifest of the converted package (a dictionary or :data:`None`).
+
+        This is set by :func:`convert()` (refer to :mod:`py2deb.manifests` for
+        details) and used by :func:`.PackageConverter.store_archive()` to
+        record the manifest in the index of the repository.
+        """
+
     @cached_property
     def metadata(self):
         """
@@ -459,6 +664,69 @@ class PackageToConvert(PropertyManager):
                         dotted_names.append(line)
         return dotted_names
 
+    @cached_property
+    def source_checksum(self):
+        """
+        The SHA-256 digest of the source distribution (a string).
+
+        When pip-accel knows the distribution archive(s) that the package was
+        unpacked from their contents are hashed, otherwise (e.g. for
+        requirements that point to a local directory) the unpacked source
+        directory is hashed (excluding the metadata generated by pip).
+        """
+        archives = self.requirement.related_archives
+        if archives:
+            return hash_files(*sorted(archives))
+        else:
+            return hash_directory(self.requirement.source_directory, exclude=('pip-egg-info',))
+
+    @cached_property
+    def source_date_epoch(self):
+        """
+        The timestamp of a reproducible build (an integer or :data:`None`).
+
+        This is :data:`None` unless :attr:`.PackageConverter.reproducible` is
+        :data:`True`. When :attr:`.PackageConverter.source_date_epoch` is set
+        that value is used, otherwise the last modified time of the ``PKG-INFO``
+        file in the source distribution (falling back to ``setup.py``) is used.
+        Unpacking a source distribution preserves the last modified times of
+        its files, so this value only depends on the source distribution.
+        """
+        if self.converter.reproducible:
+            if self.converter.source_date_epoch is not None:
+                return self.converter.source_date_epoch
+            for filename in ('PKG-INFO', 'setup.py'):
+                pathname = os.path.join(self.requirement.source_directory, filename)
+                if os.path.isfile(pathname):
+                    return int(os.path.getmtime(pathname))
+            return 0
+
+    @cached_property
+    def streaming_supported(self):
+        """
+        :data:`True` if the package is converted by :func:`convert_streaming()`, :data:`False` otherwise.
+
+        This requires :attr:`.PackageConverter.streaming_enabled` or
+        :attr:`.PackageConverter.precompile_enabled` to be :data:`True` (or
+        :attr:`.PackageConverter.zip_bundles_enabled` combined with a custom
+        installation prefix).
+        Packages that are subject to a user defined Python callback or
+        conversion command are still converted in a build directory (because
+        these operate on the files in the build directory) and so are packages
+        that use a compression type that isn't supported by :class:`.ArchiveWriter`.
+        """
+        if not (self.converter.streaming_enabled or self.converter.precompile_enabled or
+                (self.converter.zip_bundles_enabled and self.has_custom_install_prefix)):
+            return False
+        if self.converter.python_callback or self.converter.scripts.get(self.python_name.lower()):
+            logger.debug("Not streaming %s because it requires a build directory.", self.python_name)
+            return False
+        compression = self.converter.get_compression_options(self.python_name)['compression']
+        if (compression or DEFAULT_COMPRESSION) not in COMPRESSION_EXTENSIONS:
+            logger.debug("Not streaming %s because %s compression isn't supported.", self.python_name, compression)
+            return False
+        return True
+
     @cached_property
     def vcs_revision(self):
         """
@@ -476,13 +744,50 @@ class PackageToConvert(PropertyManager):
                     if name.strip() == 'node':
                         return value.strip()
 
+    @cached_property
+    def zip_bundle_supported(self):
+        """
+        :data:`True` if the package may be packed into a zip bundle, :data:`False` otherwise.
+
+        This requires :attr:`.PackageConverter.zip_bundles_enabled` to be
+        :data:`True`, a custom installation prefix, support for unchecked
+        hash based bytecode files (Python 3.7 and newer) and a package that's
+        converted by :func:`convert_streaming()`. Packages that define
+        namespace packages (which span several distributions) and packages
+        whose metadata contains a ``not-zip-safe`` flag are installed as
+        usual. The contents of the package are checked during the conversion
+        (see :func:`check_zip_safe()`).
+        """
+        if not (self.converter.zip_bundles_enabled and self.has_custom_install_prefix):
+            return False
+        if not hasattr(py_compile, 'PycInvalidationMode'):
+            logger.debug("Not creating zip bundle for %s because %s doesn't support unchecked hash pycs.",
+                         self.python_name, python_version())
+            return False
+        if not self.streaming_supported:
+            logger.debug("Not creating zip bundle for %s because it's not streamed.", self.python_name)
+            return False
+        if self.namespaces:
+            logger.debug("Not creating zip bundle for %s because it defines namespace packages.", self.python_name)
+            return False
+        if self.find_egg_info_file('not-zip-safe'):
+            logger.debug("Not creating zip bundle for %s because it's marked as not zip safe.", self.python_name)
+            return False
+        return True
+
     def convert(self):
         """
         Convert current package from Python package to Debian package.
 
         :returns: The pathname of the generated ``*.deb`` archive.
+
+        When :attr:`streaming_supported` is :data:`True` the conversion is
+        delegated to :func:`convert_streaming()`.
         """
-        with TemporaryDirectory(prefix='py2deb-build-') as build_directory:
+        if self.streaming_supported:
+            return self.convert_streaming()
+        with self.converter.get_build_directory() as build_directory, \
+                self.converter.get_build_directory() as debug_directory:
 
             # Prepare the absolute pathname of the Python interpreter on the
             # target system. This pathname will be embedded in the first line
@@ -490,14 +795,11 @@ class PackageToConvert(PropertyManager):
             # pre-removal scripts).
             python_executable = '/usr/bin/%s' % python_version()
 
-            # Unpack the binary distribution archive provided by pip-accel inside our build directory.
+            # Unpack the binary distribution archive provided by pip-accel inside
+            # our build directory, calculating the digests of the files on the way.
             build_install_prefix = os.path.join(build_directory, self.converter.install_prefix.lstrip('/'))
-            self.converter.pip_accel.bdists.install_binary_dist(
-                members=self.transform_binary_dist(python_executable),
-                prefix=build_install_prefix,
-                python=python_executable,
-                virtualenv_compatible=False,
-            )
+            digests = self.unpack_binary_dist(self.transform_binary_dist(python_executable),
+                                              build_install_prefix, python_executable)
 
             # Determine the directory (at build time) where the *.py files for
             # Python modules are located (the site-packages equivalent).
@@ -519,39 +821,35 @@ class PackageToConvert(PropertyManager):
             command = self.converter.scripts.get(self.python_name.lower())
             if command:
                 execute(command, directory=build_modules_directory, logger=logger)
+                # The command may have changed any file.
+                digests.clear()
 
             # Determine the package's dependencies, starting with the currently
             # running version of Python and the Python requirements converted
             # to Debian packages.
             dependencies = [python_version()] + self.debian_dependencies
 
-            # Check if the converted package contains any compiled *.so files.
-            object_files = find_object_files(build_directory)
+            # Check if the converted package contains any compiled object files.
+            object_files = find_elf_files(build_directory)
+            debug_files = []
             if object_files:
-                # Strip debugging symbols from the object files.
-                strip_object_files(object_files)
+                # Strip debugging symbols from the object files (keeping them
+                # in separate debug files when debug symbol packages are enabled).
+                debug_files = strip_object_files(object_files, concurrency=self.converter.strip_concurrency,
+                                                 debug_directory=debug_directory if self.converter.dbgsym_enabled
+                                                 else None)
+                for filename in object_files:
+                    digests.pop('/' + os.path.relpath(filename, build_directory), None)
                 # Determine system dependencies by analyzing the linkage of the
                 # *.so file(s) found in the converted package.
-                dependencies += find_system_dependencies(object_files)
+                dependencies += find_system_dependencies(object_files,
+                                                         architecture=self.converter.debian_architecture,
+                                                         cache=self.converter.dependency_cache,
+                                                         concurrency=self.converter.strip_concurrency)
 
             # Make up some control file fields ... :-)
             architecture = self.determine_package_architecture(object_files)
-            control_fields = unparse_control_fields(dict(package=self.debian_name,
-                                                         version=self.debian_version,
-                                                         maintainer=self.debian_maintainer,
-                                                         description=self.debian_description,
-                                                         architecture=architecture,
-                                                         depends=dependencies,
-                                                         provides=self.debian_provides,
-                                                         priority='optional',
-                                                         section='python'))
-
-            # Automatically add the Mercurial global revision id when available.
-            if self.vcs_revision:
-                control_fields['Vcs-Hg'] = self.vcs_revision
-
-            # Apply user defined control field overrides from `stdeb.cfg'.
-            control_fields = self.load_control_field_overrides(control_fields)
+            control_fields = self.generate_control_fields(dependencies, architecture)
 
             # Create the DEBIAN directory.
             debian_directory = os.path.join(build_directory, 'DEBIAN')
@@ -571,14 +869,10 @@ class PackageToConvert(PropertyManager):
             # how the internals of py2deb work). Because of this we silence
             # `known to be irrelevant' messages from Lintian using overrides.
             if self.converter.lintian_ignore:
-                overrides_directory = os.path.join(
-                    build_directory, 'usr', 'share', 'lintian', 'overrides',
-                )
-                overrides_file = os.path.join(overrides_directory, self.debian_name)
-                os.makedirs(overrides_directory)
+                overrides_file = os.path.join(build_directory, self.lintian_overrides_file.lstrip('/'))
+                os.makedirs(os.path.dirname(overrides_file))
                 with open(overrides_file, 'w') as handle:
-                    for tag in self.converter.lintian_ignore:
-                        handle.write('%s: %s\n' % (self.debian_name, tag))
+                    handle.write(self.generate_lintian_overrides())
 
             # Find the alternatives relevant to the package we're building.
             alternatives = set((link, path) for link, path in self.converter.alternatives
@@ -595,21 +889,14 @@ class PackageToConvert(PropertyManager):
                     os.remove(module_in_build_directory)
 
             # Generate post-installation and pre-removal maintainer scripts.
-            self.generate_maintainer_script(filename=os.path.join(debian_directory, 'postinst'),
-                                            python_executable=python_executable,
-                                            function='post_installation_hook',
-                                            package_name=self.debian_name,
-                                            alternatives=alternatives,
-                                            modules_directory=install_modules_directory,
-                                            namespaces=self.namespaces,
-                                            namespace_style=self.namespace_style)
-            self.generate_maintainer_script(filename=os.path.join(debian_directory, 'prerm'),
-                                            python_executable=python_executable,
-                                            function='pre_removal_hook',
-                                            package_name=self.debian_name,
-                                            alternatives=alternatives,
-                                            modules_directory=install_modules_directory,
-                                            namespaces=self.namespaces)
+            maintainer_scripts = self.generate_maintainer_scripts(python_executable, alternatives,
+                                                                  install_modules_directory)
+            for name, contents in maintainer_scripts.items():
+                filename = os.path.join(debian_directory, name)
+                with open(filename, 'w') as handle:
+                    handle.write(contents)
+                # Make sure the maintainer script is executable.
+                os.chmod(filename, 0o755)
 
             # Enable a user defined Python callback to manipulate the resulting
             # binary package before it's turned into a *.deb archive (e.g.
@@ -618,10 +905,358 @@ class PackageToConvert(PropertyManager):
                 logger.debug("Invoking user defined Python callback ..")
                 self.converter.python_callback(self.converter, self, build_directory)
                 logger.debug("User defined Python callback finished!")
+                # The callback may have changed any file.
+                digests.clear()
+
+            # Record the files that will be included in the package so that
+            # the duplicate files check doesn't have to inspect the archive.
+            # The package tree is cleaned first because build_archive() would
+            # otherwise remove files after we've recorded them. Files whose
+            # digests weren't recorded while unpacking (or that were changed
+            # afterwards) are hashed by create_manifest().
+            clean_package_tree(build_directory)
+            self.manifest = create_manifest(build_directory, digests)
+            write_md5sums(build_directory, digests)
+
+            # The debug symbol package is built at the same time.
+            with self.build_dbgsym_package_in_background(debug_files, debug_directory, control_fields):
+                return build_archive(directory=build_directory,
+                                     source_date_epoch=self.source_date_epoch,
+                                     check_package=self.lintian_inline,
+                                     **self.converter.get_compression_options(self.python_name))
+
+    def convert_streaming(self):
+        """
+        Convert current package from Python package to Debian package without a staging tree.
+
+        :returns: The pathname of the generated ``*.deb`` archive.
+
+        The files in the binary distribution are streamed into the archive by
+        an :class:`.ArchiveWriter`. Only object files are written to the build
+        directory, so that they can be stripped and their system dependencies
+        can be found. Otherwise this is equivalent to the conversion in a build
+        directory implemented by :func:`convert()`.
+        """
+        compression_options = self.converter.get_compression_options(self.python_name)
+        with self.converter.get_build_directory() as build_directory:
+
+            # Prepare the absolute pathname of the Python interpreter on the
+            # target system (see convert() for details).
+            python_executable = '/usr/bin/%s' % python_version()
 
-            return build_package(directory=build_directory,
-                                 check_package=self.converter.lintian_enabled,
-                                 copy_files=False)
+            writer = ArchiveWriter(directory=build_directory,
+                                   compression=compression_options['compression'] or DEFAULT_COMPRESSION,
+                                   compression_level=compression_options['level'])
+            if self.source_date_epoch is not None:
+                writer.timestamp = self.source_date_epoch
+                writer.sort_members = True
+
+            # The pattern that matches the directory (relative to the
+            # installation prefix) where the *.py files for Python modules are
+            # located (the site-packages equivalent).
+            if self.has_custom_install_prefix:
+                modules_pattern = re.compile('^lib/')
+            else:
+                modules_pattern = re.compile('^lib/py[^/]*/dist-packages/')
+            modules_directories = set()
+
+            # Identify the __init__.py files that define "pkgutil-style namespace
+            # packages" (these are generated by the maintainer scripts instead).
+            if self.namespace_style == 'pkgutil':
+                namespace_files = set(ns['relpath'] for ns in self.pkgutil_namespaces)
+            else:
+                namespace_files = set()
+
+            # Stream the binary distribution archive provided by pip-accel into
+            # the archive (except for object files, which are written to the
+            # build directory, and the files that may be packed into a zip
+            # bundle, which are written to the build directory until all files
+            # are known). Only the start of each file is read to classify it,
+            # the rest is copied in chunks (see read_member()).
+            object_files = {}
+            python_modules = []
+            bundle_members = []
+            zip_safe = self.zip_bundle_supported
+
+            def save_file(subdirectory, pathname, contents):
+                filename = os.path.join(build_directory, subdirectory, pathname.lstrip('/'))
+                if not os.path.isdir(os.path.dirname(filename)):
+                    os.makedirs(os.path.dirname(filename))
+                with open(filename, 'wb') as handle:
+                    copy_chunks(contents, handle)
+                return filename
+
+            def add_file(pathname, contents, mode):
+                if self.bytecode_included and pathname.endswith('.py') and not writer.is_excluded(pathname):
+                    # The module is compiled from a copy in the build directory.
+                    filename = save_file('modules', pathname, contents)
+                    python_modules.append((pathname, filename))
+                    with open(filename, 'rb') as handle:
+                        writer.add_file(pathname, handle, mode)
+                else:
+                    writer.add_file(pathname, contents, mode)
+
+            for member, handle in self.transform_binary_dist(python_executable):
+                pathname = os.path.join(self.converter.install_prefix, member.name)
+                head, contents = self.read_member(handle, python_executable)
+                match = modules_pattern.match(member.name)
+                if match:
+                    modules_directories.add(match.group(0))
+                    if member.name[match.end():] in namespace_files:
+                        logger.debug("Removing pkgutil-style namespace package file: %s", pathname)
+                        continue
+                if is_elf_data(head):
+                    if match and zip_safe:
+                        logger.debug("Not creating zip bundle for %s because it contains object files.",
+                                     self.python_name)
+                        zip_safe = False
+                    filename = save_file('objects', pathname, contents)
+                    os.chmod(filename, member.mode)
+                    object_files[pathname] = filename
+                elif (match and self.zip_bundle_supported and not writer.is_excluded(pathname) and
+                      not re.match(r'^[^/]+\.(egg|dist)-info/', member.name[match.end():])):
+                    bundle_members.append((pathname, save_file('bundle', pathname, contents), member.mode))
+                else:
+                    add_file(pathname, contents, member.mode)
+
+            # Determine the directory (at installation time) where the *.py
+            # files for Python modules are located.
+            if self.has_custom_install_prefix:
+                install_modules_directory = os.path.join(self.converter.install_prefix, 'lib')
+            elif len(modules_directories) != 1:
+                msg = "Expected to find a single 'dist-packages' directory inside converted package!"
+                raise Exception(msg)
+            else:
+                install_modules_directory = os.path.join(self.converter.install_prefix,
+                                                         modules_directories.pop().rstrip('/'))
+
+            # Pack the Python modules, package data and bytecode files into a
+            # zip bundle (the package metadata stays on disk so that it can
+            # still be found by pkg_resources).
+            if bundle_members:
+                if zip_safe and self.check_zip_safe(bundle_members):
+                    bundle, filename = self.create_zip_bundle(bundle_members, install_modules_directory,
+                                                              os.path.join(build_directory, 'modules'))
+                    with open(filename, 'rb') as handle:
+                        writer.add_file(bundle, handle, 0o644)
+                    writer.add_file(os.path.join(install_modules_directory, '%s.pth' % self.debian_name),
+                                    ('%s\n' % os.path.basename(bundle)).encode('UTF-8'), 0o644)
+                else:
+                    for pathname, filename, mode in bundle_members:
+                        with open(filename, 'rb') as handle:
+                            writer.add_file(pathname, handle, mode)
+                        if self.bytecode_included and pathname.endswith('.py'):
+                            python_modules.append((pathname, filename))
+
+            # Determine the package's dependencies (see convert() for details).
+            dependencies = [python_version()] + self.debian_dependencies
+            debug_directory = os.path.join(build_directory, 'dbgsym')
+            debug_files = []
+            if object_files:
+                filenames = sorted(object_files.values())
+                debug_files = strip_object_files(filenames, concurrency=self.converter.strip_concurrency,
+                                                 debug_directory=debug_directory if self.converter.dbgsym_enabled
+                                                 else None)
+                dependencies += find_system_dependencies(filenames,
+                                                         architecture=self.converter.debian_architecture,
+                                                         cache=self.converter.dependency_cache,
+                                                         concurrency=self.converter.strip_concurrency)
+                for pathname, filename in sorted(object_files.items()):
+                    with open(filename, 'rb') as handle:
+                        writer.add_file(pathname, handle, os.stat(filename).st_mode & 0o7777)
+
+            # Compile the Python modules to bytecode files on the build host
+            # (instead of in the post-installation script on every target system).
+            if python_modules:
+                for pathname, filename in compile_bytecode(python_modules,
+                                                           concurrency=self.converter.strip_concurrency):
+                    with open(filename, 'rb') as handle:
+                        writer.add_file(pathname, handle, 0o644, force=True)
+
+            # Generate the control fields.
+            architecture = self.determine_package_architecture(object_files)
+            control_fields = self.generate_control_fields(dependencies, architecture)
+
+            # Silence irrelevant messages from Lintian (see convert() for details).
+            if self.converter.lintian_ignore:
+                writer.add_file(self.lintian_overrides_file, self.generate_lintian_overrides().encode('UTF-8'), 0o644)
+
+            # Find the alternatives relevant to the package we're building.
+            alternatives = set((link, path) for link, path in self.converter.alternatives
+                               if path in writer.checksums)
+
+            # Generate post-installation and pre-removal maintainer scripts.
+            maintainer_scripts = self.generate_maintainer_scripts(python_executable, alternatives,
+                                                                  install_modules_directory)
+
+            # Record the files included in the package (for the duplicate files check).
+            self.manifest = make_manifest(writer.checksums, parse_control_fields(control_fields),
+                                          checksums=writer.sha256sums)
+
+            # Create the archive in a temporary directory, like build_archive()
+            # does (while the debug symbol package is built).
+            with self.build_dbgsym_package_in_background(debug_files, debug_directory, control_fields):
+                archive = writer.create_archive(control_fields, maintainer_scripts,
+                                                tempfile.mkdtemp(prefix='py2deb-archive-'))
+            if self.lintian_inline:
+                run_lintian(archive)
+            return archive
+
+    def build_dbgsym_package(self, debug_files, debug_directory, control_fields):
+        """
+        Build the debug symbol package of the converted package.
+
+        :param debug_files: A list of strings with the filenames of debug
+                            files (the result of :func:`.strip_object_files()`).
+        :param debug_directory: The directory that contains the debug files
+                                (a string).
+        :param control_fields: The control fields of the converted package (a
+                               :class:`deb_pkg_tools.deb822.Deb822` object).
+        :returns: The pathname of the generated ``*-dbgsym`` archive (a string).
+
+        The debug files are installed under ``/usr/lib/debug/.build-id`` and
+        the control fields follow the conventions of the ``*-dbgsym``
+        packages generated by :man:`dh_strip` (including the ``Build-Ids``
+        field). The archive is created by an :class:`.ArchiveWriter`.
+        """
+        compression_options = self.converter.get_compression_options(self.python_name)
+        if (compression_options['compression'] or DEFAULT_COMPRESSION) not in COMPRESSION_EXTENSIONS:
+            # Fall back to the default compression (e.g. instead of zstd).
+            compression_options = dict(compression=None, level=None)
+        writer = ArchiveWriter(directory=debug_directory,
+                               compression=compression_options['compression'] or DEFAULT_COMPRESSION,
+                               compression_level=compression_options['level'])
+        if self.source_date_epoch is not None:
+            writer.timestamp = self.source_date_epoch
+            writer.sort_members = True
+        build_ids = []
+        for filename in debug_files:
+            relpath = os.path.relpath(filename, debug_directory)
+            build_ids.append(relpath.replace('/', '')[:-len('.debug')])
+            with open(filename, 'rb') as handle:
+                writer.add_file(os.path.join('/usr/lib/debug/.build-id', relpath), handle.read(), 0o644)
+        package_name = control_fields['Package']
+        dbgsym_fields = unparse_control_fields(dict(package='%s-dbgsym' % package_name,
+                                                    version=control_fields['Version'],
+                                                    maintainer=control_fields['Maintainer'],
+                                                    description='debug symbols for %s' % package_name,
+                                                    architecture=control_fields['Architecture'],
+                                                    depends=['%s (= %s)' % (package_name, control_fields['Version'])],
+                                                    priority='optional',
+                                                    section='debug'))
+        dbgsym_fields['Auto-Built-Package'] = 'debug-symbols'
+        dbgsym_fields['Build-Ids'] = ' '.join(sorted(build_ids))
+        return writer.create_archive(dbgsym_fields, {}, tempfile.mkdtemp(prefix='py2deb-archive-'))
+
+    @contextlib.contextmanager
+    def build_dbgsym_package_in_background(self, debug_files, debug_directory, control_fields):
+        """
+        Build the debug symbol package in a background thread (a context manager).
+
+        :param debug_files: The debug files (refer to :func:`build_dbgsym_package()`).
+        :param debug_directory: The directory that contains the debug files (a string).
+        :param control_fields: The control fields of the converted package (a
+                               :class:`deb_pkg_tools.deb822.Deb822` object).
+
+        The package itself is built inside the context, when the context is
+        left the debug symbol package is waited for and :attr:`dbgsym_archive`
+        is set. Compressing the debug files doesn't hold the global
+        interpreter lock, so this doesn't add to the time it takes to build
+        the package. When there are no debug files nothing is done.
+        """
+        self.dbgsym_archive = None
+        if not debug_files:
+            yield
+            return
+        pool = ThreadPool(1)
+        try:
+            result = pool.apply_async(self.build_dbgsym_package, (debug_files, debug_directory, control_fields))
+            yield
+            self.dbgsym_archive = result.get()
+        finally:
+            pool.close()
+            pool.join()
+
+    def check_zip_safe(self, members):
+        """
+        Check whether the Python modules of the package can be imported from a zip archive.
+
+        :param members: A list of tuples like those given to :func:`create_zip_bundle()`.
+        :returns: :data:`True` if the package is zip safe, :data:`False` otherwise.
+
+        When the package metadata contains a ``zip-safe`` flag the package is
+        considered zip safe. Otherwise the package isn't zip safe when one of
+        its modules refers to ``__file__`` (like the analysis that
+        :pypi:`setuptools` does when it creates eggs), because such modules
+        usually expect to find files on disk.
+        """
+        if self.find_egg_info_file('zip-safe'):
+            return True
+        for pathname, filename, mode in members:
+            if pathname.endswith('.py'):
+                with open(filename, 'rb') as handle:
+                    refers_to_file = b'__file__' in handle.read()
+                if refers_to_file:
+                    logger.debug("Not creating zip bundle for %s because %s refers to __file__.",
+                                 self.python_name, pathname)
+                    return False
+        return True
+
+    def create_zip_bundle(self, members, modules_directory, directory):
+        """
+        Pack Python modules, package data and bytecode files into a zip archive.
+
+        :param members: A list of tuples with three values each: The absolute
+                        pathname of a file in `modules_directory` on the target
+                        system (a string), the pathname of a copy of the file
+                        on the build host (a string) and its permission bits
+                        (an integer).
+        :param modules_directory: The directory (on the target system) where
+                                  Python modules are installed (a string).
+        :param directory: The pathname of a directory where the zip archive
+                          is created (a string).
+        :returns: A tuple with two values: The absolute pathname of the zip
+                  archive on the target system (a string) and the pathname of
+                  the zip archive on the build host (a string).
+
+        The Python modules are compiled by :func:`.compile_bytecode()` and
+        the bytecode files are stored next to the modules (where
+        :mod:`zipimport` expects them) so nothing is compiled at import time.
+        Members are stored without compression (the ``*.deb`` archive is
+        compressed anyway) in sorted order, using :attr:`source_date_epoch`
+        as timestamp for reproducible builds. The files are copied into the
+        zip archive one at a time, so they don't need to fit in memory
+        together.
+        """
+        from importlib.util import cache_from_source
+        bundle = os.path.join(modules_directory, '%s.zip' % self.debian_name)
+        entries = {}
+        sources = []
+        for pathname, filename, mode in members:
+            name = os.path.relpath(pathname, modules_directory)
+            entries[name] = (filename, mode)
+            if name.endswith('.py'):
+                sources.append((os.path.join(bundle, name), filename))
+        bytecode_files = dict(compile_bytecode(sources, concurrency=self.converter.strip_concurrency))
+        for pathname, filename in sources:
+            bytecode_file = bytecode_files.get(cache_from_source(pathname))
+            if bytecode_file is not None:
+                entries[os.path.relpath(pathname, bundle) + 'c'] = (bytecode_file, 0o644)
+        # Zip archives can't represent timestamps before 1980.
+        timestamp = self.source_date_epoch if self.source_date_epoch is not None else time.time()
+        date_time = time.gmtime(max(timestamp, 315532800))[:6]
+        zip_file = os.path.join(directory, os.path.basename(bundle))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_STORED) as archive:
+            for name in sorted(entries):
+                filename, mode = entries[name]
+                info = zipfile.ZipInfo(name, date_time)
+                info.external_attr = (0o100000 | (mode & 0o7777)) << 16
+                with open(filename, 'rb') as source, archive.open(info, 'w') as target:
+                    copy_chunks(source, target)
+        logger.debug("Packed %s of %s into %s.", pluralize(len(entries), "file"), self.python_name, bundle)
+        return bundle, zip_file
 
     def determine_package_architecture(self, has_shared_object_files):
         """
@@ -675,6 +1310,65 @@ class PackageToConvert(PropertyManager):
         else:
             logger.debug("No matching %r files found.", pattern)
 
+    def generate_control_fields(self, dependencies, architecture):
+        """
+        Generate the control fields of the converted package.
+
+        :param dependencies: A list of strings with Debian package relationships.
+        :param architecture: The architecture of the package (a string).
+        :returns: A :class:`deb_pkg_tools.deb822.Deb822` object.
+        """
+        # Make up some control file fields ... :-)
+        control_fields = unparse_control_fields(dict(package=self.debian_name,
+                                                     version=self.debian_version,
+                                                     maintainer=self.debian_maintainer,
+                                                     description=self.debian_description,
+                                                     architecture=architecture,
+                                                     depends=dependencies,
+                                                     provides=self.debian_provides,
+                                                     priority='optional',
+                                                     section='python'))
+        # Automatically add the Mercurial global revision id when available.
+        if self.vcs_revision:
+            control_fields['Vcs-Hg'] = self.vcs_revision
+        # Apply user defined control field overrides from `stdeb.cfg'.
+        return self.load_control_field_overrides(control_fields)
+
+    def generate_launcher(self, entry_point, interpreter):
+        """
+        Generate a launcher for a console script that imports the entry point directly.
+
+        :param entry_point: A :class:`pkg_resources.EntryPoint` object (see
+                            :attr:`console_scripts`).
+        :param interpreter: The absolute pathname of the Python interpreter
+                            that should be referenced by the launcher (a string).
+        :returns: The contents of the launcher (a byte string) or :data:`None`
+                  when the entry point doesn't refer to a callable in a module.
+
+        The launcher is equivalent to the scripts that :pypi:`pip` generates
+        for wheels: It imports the callable and exits with its return value,
+        without loading :mod:`pkg_resources`.
+        """
+        if not entry_point.attrs:
+            return None
+        lines = [
+            '#!%s' % interpreter,
+            '# Launcher for the %r entry point generated by py2deb.' % str(entry_point),
+            'import sys',
+            'from %s import %s' % (entry_point.module_name, entry_point.attrs[0]),
+            "if __name__ == '__main__':",
+            '    sys.exit(%s())' % '.'.join(entry_point.attrs),
+        ]
+        return ('\n'.join(lines) + '\n').encode('UTF-8')
+
+    def generate_lintian_overrides(self):
+        """
+        Generate the contents of the Lintian overrides file (see :attr:`lintian_overrides_file`).
+
+        :returns: The contents of the overrides file (a string).
+        """
+        return ''.join('%s: %s\n' % (self.debian_name, tag) for tag in self.converter.lintian_ignore)
+
     def generate_maintainer_script(self, filename, python_executable, function, **arguments):
         """
         Generate a post-installation or pre-removal maintainer script.
@@ -699,6 +1393,88 @@ class PackageToConvert(PropertyManager):
             are serialized to text using :func:`repr()` and embedded inside the
             generated maintainer script.
         """
+        # Write the maintainer script.
+        with open(filename, 'w') as handle:
+            handle.write(self.render_maintainer_script(python_executable, function, **arguments))
+        # Make sure the maintainer script is executable.
+        os.chmod(filename, 0o755)
+
+    def generate_maintainer_scripts(self, python_executable, alternatives, modules_directory):
+        """
+        Generate the post-installation and pre-removal maintainer scripts.
+
+        :param python_executable: The absolute pathname of the Python
+                                  interpreter on the target system (a string).
+        :param alternatives: A set of tuples with two strings each (the
+                             alternatives relevant to the package).
+        :param modules_directory: The absolute pathname of the directory where
+                                  the Python modules are installed on the
+                                  target system (a string).
+        :returns: A dictionary with the names of the maintainer scripts
+                  (``postinst`` and ``prerm``) and their contents (strings).
+        """
+        return dict(
+            postinst=self.render_maintainer_script(python_executable=python_executable,
+                                                   function='post_installation_hook',
+                                                   package_name=self.debian_name,
+                                                   alternatives=alternatives,
+                                                   modules_directory=modules_directory,
+                                                   namespaces=self.namespaces,
+                                                   namespace_style=self.namespace_style,
+                                                   bytecode_included=self.bytecode_included,
+                                                   module_index=self.converter.module_index_required),
+            prerm=self.render_maintainer_script(python_executable=python_executable,
+                                                function='pre_removal_hook',
+                                                package_name=self.debian_name,
+                                                alternatives=alternatives,
+                                                modules_directory=modules_directory,
+                                                namespaces=self.namespaces,
+                                                module_index=self.converter.module_index_required),
+        )
+
+    def read_member(self, handle, python_executable):
+        """
+        Start reading a file in a binary distribution.
+
+        :param handle: A file-like object (as returned by :func:`transform_binary_dist()`).
+        :param python_executable: The absolute pathname of the Python
+                                  interpreter on the target system (a string).
+        :returns: A tuple with two values: The first chunk of the file (a byte
+                  string, used to classify the file) and the contents of the
+                  file (a file-like object).
+
+        Only the first :data:`.CHUNK_SIZE` bytes of the file are read, the
+        rest is chained after them (see :class:`.ChainedFile`) so that the
+        caller can copy the file in chunks (see :func:`.copy_chunks()`).
+        The interpreter reference in the first line of scripts is updated
+        (like :func:`pip_accel.bdist.BinaryDistributionManager.install_binary_dist()`
+        does) without reading the rest of the script. This matters for
+        scripts outside of the ``bin`` directory (e.g. modules that can be
+        run directly), executables are already updated by
+        :func:`.rewrite_script()`.
+        """
+        head = handle.read(CHUNK_SIZE)
+        if head.startswith(b'#!/'):
+            first_line, newline, rest = head.partition(b'\n')
+            first_line = self.converter.pip_accel.bdists.fix_hashbang(first_line, python_executable)
+            contents = ChainedFile([first_line + newline, rest], handle)
+        else:
+            contents = ChainedFile([head], handle)
+        return head, contents
+
+    def render_maintainer_script(self, python_executable, function, **arguments):
+        """
+        Render the contents of a post-installation or pre-removal maintainer script.
+
+        :param python_executable: The absolute pathname of the Python
+                                  interpreter on the target system (a string).
+        :param function: The name of the function in the :mod:`py2deb.hooks`
+                         module to be called when the maintainer script is
+                         run (a string).
+        :param arguments: Any keyword arguments to the function in the
+                          :mod:`py2deb.hooks` module.
+        :returns: The contents of the maintainer script (a string).
+        """
         # Read the py2deb/hooks.py script.
         py2deb_directory = os.path.dirname(os.path.abspath(__file__))
         hooks_script = os.path.join(py2deb_directory, 'hooks.py')
@@ -710,12 +1486,7 @@ class PackageToConvert(PropertyManager):
         # Generate the call to the top level function.
         encoded_arguments = ', '.join('%s=%r' % (k, v) for k, v in arguments.items())
         blocks.append('%s(%s)' % (function, encoded_arguments))
-        # Write the maintainer script.
-        with open(filename, 'w') as handle:
-            handle.write('\n\n'.join(blocks))
-            handle.write('\n')
-        # Make sure the maintainer script is executable.
-        os.chmod(filename, 0o755)
+        return '\n\n'.join(blocks) + '\n'
 
     def load_control_field_overrides(self, control_fields):
         """
@@ -786,64 +1557,72 @@ class PackageToConvert(PropertyManager):
 
         Builds the Python package (using :pypi:`pip-accel`) and changes the
         names of the files included in the package to match the layout
-        corresponding to the given conversion options.
-        """
-        # Detect whether we're running on PyPy (it needs special handling).
-        if platform.python_implementation() == 'PyPy':
-            on_pypy = True
-            normalized_pypy_path = 'lib/pypy%i.%i/site-packages/' % sys.version_info[:2]
-            if sys.version_info[0] == 3:
-                # The file /usr/lib/pypy3/dist-packages/README points to
-                # /usr/lib/pypy3/lib-python/3/site.py which states that in
-                # PyPy 3 /usr/lib/python3/dist-packages is shared between
-                # cPython and PyPy.
-                normalized_pypy_segment = '/python3/'
-            else:
-                # The file /usr/lib/pypy/dist-packages/README points to
-                # /usr/lib/pypy/lib-python/2.7/site.py which states that in
-                # PyPy 2 /usr/lib/pypy<version>/dist-packages is used for
-                # "Debian addons" however when you run the interpreter and
-                # inspect sys.path you'll find that /usr/lib/pypy/dist-packages
-                # is being used instead of the <version> directory. This might
-                # be a documentation bug?
-                normalized_pypy_segment = '/pypy/'
-        else:
-            on_pypy = False
+        corresponding to the given conversion options (using the rewrite
+        table returned by :func:`.PackageConverter.get_path_rewriter()`).
+        When :attr:`.PackageConverter.fast_launchers_enabled` is :data:`True`
+        console scripts are replaced by launchers (see :func:`generate_launcher()`).
+        """
+        # The rewrite table is shared between packages and remembers the
+        # rewritten directory prefixes (see PackageConverter.get_path_rewriter()).
+        rewriter = self.converter.get_path_rewriter(self.has_custom_install_prefix)
         for member, handle in self.converter.pip_accel.bdists.get_binary_dist(self.requirement):
             is_executable = member.name.startswith('bin/')
             # Note that at this point the installation prefix has already been
             # stripped from `member.name' by the get_binary_dist() method.
-            if on_pypy:
-                # Normalize PyPy virtual environment layout:
-                #
-                # 1. cPython uses /lib/pythonX.Y/(dist|site)-packages/
-                # 2. PyPy uses /site-packages/ (a top level directory)
-                #
-                # In this if branch we change 2 to look like 1 so that the
-                # following if/else branches don't need to care about the
-                # difference.
-                member.name = re.sub('^(dist|site)-packages/', normalized_pypy_path, member.name)
-            if self.has_custom_install_prefix:
-                # Strip the complete /usr/lib/pythonX.Y/site-packages/ prefix
-                # so we can replace it with the custom installation prefix.
-                member.name = re.sub(r'lib/(python|pypy)\d+(\.\d+)*/(dist|site)-packages/', 'lib/', member.name)
-                # Rewrite executable Python scripts so they know about the
-                # custom installation prefix.
-                if is_executable:
-                    handle = embed_install_prefix(handle, os.path.join(self.converter.install_prefix, 'lib'))
-            else:
-                if on_pypy:
-                    # Normalize the PyPy "versioned directory segment" (it differs
-                    # between virtual environments versus system wide installations).
-                    member.name = re.sub(r'/pypy\d(\.\d)?/', normalized_pypy_segment, member.name)
-                # Rewrite /site-packages/ to /dist-packages/. For details see
-                # https://wiki.debian.org/Python#Deviations_from_upstream.
-                member.name = member.name.replace('/site-packages/', '/dist-packages/')
-            # Update the interpreter reference in the first line of executable scripts.
+            member.name = rewriter.rewrite(member.name)
+            if is_executable and self.converter.fast_launchers_enabled:
+                # Replace console scripts that load their entry point using
+                # pkg_resources with launchers that import it directly.
+                entry_point = self.console_scripts.get(os.path.basename(member.name))
+                launcher = self.generate_launcher(entry_point, interpreter) if entry_point else None
+                if launcher:
+                    logger.debug("Generating launcher for %s (%s) ..", member.name, entry_point)
+                    handle = BytesIO(launcher)
             if is_executable:
-                handle = self.update_shebang(handle, interpreter)
+                # Update the interpreter reference in the first line of
+                # executable scripts and (given a custom installation prefix)
+                # rewrite them so they know about the custom installation
+                # prefix. The shebang is sniffed once and only the header of
+                # the script is buffered.
+                install_prefix = None
+                if self.has_custom_install_prefix:
+                    install_prefix = os.path.join(self.converter.install_prefix, 'lib')
+                site_directory = self.converter.zip_bundles_enabled or self.converter.module_index_enabled
+                handle = rewrite_script(handle, interpreter=interpreter, install_prefix=install_prefix,
+                                        site_directory=site_directory)
             yield member, handle
 
+    def unpack_binary_dist(self, members, directory, python_executable):
+        """
+        Unpack the files in a binary distribution into a build directory.
+
+        :param members: The result of :func:`transform_binary_dist()`.
+        :param directory: The pathname of the installation prefix in the build
+                          directory (a string).
+        :param python_executable: The absolute pathname of the Python
+                                  interpreter on the target system (a string).
+        :returns: A dictionary with the absolute pathnames (on the target
+                  system) and digests of the files (refer to
+                  :func:`.create_manifest()`).
+
+        This replaces :func:`pip_accel.bdist.BinaryDistributionManager.install_binary_dist()`,
+        which reads every file into memory at once: The files are read using
+        :func:`read_member()` and copied in chunks while their digests are
+        calculated, so the digests match the files in the build directory.
+        """
+        digests = {}
+        for member, handle in members:
+            filename = os.path.join(directory, member.name)
+            if not os.path.isdir(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            head, contents = self.read_member(handle, python_executable)
+            md5, sha256 = hashlib.md5(), hashlib.sha256()
+            with open(filename, 'wb') as output:
+                copy_chunks(contents, output, (md5, sha256))
+            os.chmod(filename, member.mode)
+            digests[os.path.join(self.converter.install_prefix, member.name)] = (md5.hexdigest(), sha256.hexdigest())
+        return digests
+
     def update_shebang(self, handle, interpreter):
         """
         Update the shebang_ of executable scripts.
@@ -871,14 +1650,12 @@ class PackageToConvert(PropertyManager):
                   kill it (the second of which implies needing to make a whole
                   lot of changes to py2deb).
 
+        Only the first line is replaced, the rest of the script is chained
+        through without copying (see :func:`.rewrite_script()`).
+
         .. _shebang: https://en.wikipedia.org/wiki/Shebang_(Unix)
         """
-        if detect_python_script(handle):
-            lines = handle.readlines()
-            lines[0] = b'#!' + interpreter.encode('ascii') + b'\n'
-            handle = BytesIO(b''.join(lines))
-            handle.seek(0)
-        return handle
+        return rewrite_script(handle, interpreter=interpreter)
 
     def __str__(self):
         """The name, version and extras of the package encoded in a human readable string."""
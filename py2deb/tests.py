@@ -20,33 +20,58 @@ dependencies.
 import fnmatch
 import functools
 import glob
+import hashlib
+import io
+import json
 import logging
+import multiprocessing
 import os
+import py_compile
 import shutil
 import sys
 import tempfile
+import time
 
 # External dependencies.
 import coloredlogs
 from deb_pkg_tools.checks import DuplicateFilesFound
 from deb_pkg_tools.control import load_control_file, patch_control_file
-from deb_pkg_tools.package import inspect_package, parse_filename
+from deb_pkg_tools.package import build_package, inspect_package, parse_filename
 from executor import execute
+from humanfriendly import Timer
 from humanfriendly.text import dedent
 from humanfriendly.testing import TestCase, run_cli, touch
 
 # Modules included in our package.
 from py2deb.cli import main
+from py2deb.cache import DependencyCache, LintianCache
 from py2deb.converter import PackageConverter
+from py2deb.elf import find_elf_files, inspect_elf_file, is_elf_file
+from py2deb.manifests import check_duplicate_files, create_manifest, get_digests, write_md5sums
+from py2deb.package import PackageToConvert
 from py2deb.utils import (
+    BuildDirectoryPool,
+    LRUCache,
+    PackageRepository,
+    PathRewriter,
     TemporaryDirectory,
+    compile_bytecode,
     convert_package_name,
     default_name_prefix,
+    find_system_dependencies,
+    hash_files,
+    merge_relationships,
     normalize_package_version,
+    patched_environment,
     python_version,
+    rewrite_script,
+    strip_object_files,
+    tokenize_version,
 )
+from py2deb.writer import CHUNK_SIZE
 from py2deb.hooks import (
     cleanup_bytecode_files,
+    cleanup_module_index,
     cleanup_namespaces,
     find_bytecode_files,
     find_installed_files,
@@ -55,6 +80,7 @@ from py2deb.hooks import (
     initialize_namespaces,
     post_installation_hook,
     pre_removal_hook,
+    update_module_index,
 )
 
 # Initialize a logger.
@@ -143,6 +169,14 @@ class PackageConverterTestCase(TestCase):
         self.assertRaises(ValueError, converter.install_alternative, '', 'path')
         self.assertRaises(ValueError, converter.set_conversion_command, 'package-name', '')
         self.assertRaises(ValueError, converter.set_conversion_command, '', 'command')
+        self.assertRaises(ValueError, converter.set_jobs, 0)
+        self.assertRaises(ValueError, converter.set_jobs, 'many')
+        self.assertRaises(ValueError, converter.set_scratch_directory, '/foo/bar/baz')
+        self.assertRaises(ValueError, converter.set_compression, 'lzma')
+        self.assertRaises(ValueError, converter.set_compression_level, -1)
+        self.assertRaises(ValueError, converter.set_compression_threads, 'many')
+        self.assertRaises(ValueError, converter.set_package_compression, 'package-name', level='high')
+        self.assertRaises(ValueError, converter.set_dependency_cache_size, -1)
         exit_code, output = run_cli(main, '--unsupported-option')
         assert exit_code != 0
         exit_code, output = run_cli(main, '--report-dependencies', '/tmp/definitely-not-an-existing-control-file')
@@ -172,6 +206,161 @@ class PackageConverterTestCase(TestCase):
         assert normalize_package_version('1.0a2', prerelease_workaround=True) == '1.0~a2'
         assert normalize_package_version('1.0a2', prerelease_workaround=False) == '1.0a2'
 
+    def test_transformation_caching(self):
+        """Test the caching of name and version transformations."""
+        cache = LRUCache('test', size=2)
+        assert cache.lookup('a', lambda: 1) == 1
+        assert cache.lookup('b', lambda: 2) == 2
+        assert cache.lookup('a', lambda: 3) == 1
+        # The least recently used entry ('b') should be discarded.
+        assert cache.lookup('c', lambda: 4) == 4
+        assert cache.lookup('b', lambda: 5) == 5
+        assert (cache.hits, cache.misses) == (1, 4)
+        # Statistics can be reported relative to earlier counters.
+        assert cache.describe(1, 1) == 'test: 0 hits, 3 misses, 2 entries'
+        # Cached values should never be mutated by callers.
+        tokenize_version('1.2.3').append('4')
+        assert tokenize_version('1.2.3') == ['1', '.', '2', '.', '3']
+        # Changes to the conversion options should be respected.
+        converter = self.create_isolated_converter()
+        converter.set_name_prefix('foo')
+        assert converter.transform_name('Example') == 'foo-example'
+        converter.set_name_prefix('bar')
+        assert converter.transform_name('Example') == 'bar-example'
+        converter.name_mapping['example'] = 'renamed-example'
+        assert converter.transform_name('Example') == 'renamed-example'
+        converter.system_packages['example'] = 'system-example'
+        assert converter.transform_name('Example') == 'system-example'
+
+    def test_path_rewriting(self):
+        """Test the rewriting of pathnames in binary distributions using :class:`~py2deb.utils.PathRewriter`."""
+        converter = self.create_isolated_converter()
+        rewriter = converter.get_path_rewriter(False)
+        assert rewriter is converter.get_path_rewriter(False)
+        assert rewriter.rewrite('lib/python3.8/site-packages/foo/bar.py') == 'lib/python3.8/dist-packages/foo/bar.py'
+        assert rewriter.rewrite('lib/python3.8/site-packages/foo/baz.py') == 'lib/python3.8/dist-packages/foo/baz.py'
+        assert rewriter.rewrite('bin/foo') == 'bin/foo'
+        assert rewriter.rewrite('setup.py') == 'setup.py'
+        # Each directory prefix is rewritten once.
+        assert sorted(rewriter.prefixes) == ['bin/', 'lib/python3.8/site-packages/foo/']
+        # Custom installation prefixes use a separate table.
+        rewriter = converter.get_path_rewriter(True)
+        assert rewriter.rewrite('lib/python3.8/site-packages/foo/bar.py') == 'lib/foo/bar.py'
+        # User defined rules are applied after the built in rules.
+        converter.add_path_rule(r'^lib/foo/', 'lib/renamed/')
+        rewriter = converter.get_path_rewriter(True)
+        assert rewriter.rewrite('lib/python3.8/site-packages/foo/bar.py') == 'lib/renamed/bar.py'
+        self.assertRaises(ValueError, converter.add_path_rule, '', 'lib/')
+        self.assertRaises(ValueError, converter.add_path_rule, '(', 'lib/')
+        self.assertRaises(ValueError, PathRewriter, [('[', '')])
+
+    def test_script_rewriting(self):
+        """Test the rewriting of executable scripts using :func:`~py2deb.utils.rewrite_script()`."""
+        script = b'\n'.join([
+            b'#!/usr/bin/env python',
+            b'# A comment.',
+            b'"""',
+            b'The docstring.',
+            b'"""',
+            b'from __future__ import (absolute_import,',
+            b'                        print_function)',
+            b'import os',
+            b'print(os.getcwd())',
+            b'',
+        ])
+        handle = rewrite_script(io.BytesIO(script), interpreter='/usr/bin/python3', install_prefix='/opt/example/lib')
+        lines = handle.read().splitlines()
+        assert lines[0] == b'#!/usr/bin/python3'
+        assert lines[7] == b"import sys; sys.path.insert(0, '/opt/example/lib')"
+        assert lines[1:7] + lines[8:] == script.splitlines()[1:]
+        # Without `from __future__ import ...' the snippet follows the leading comments.
+        handle = rewrite_script(io.BytesIO(b'#!/usr/bin/python\nimport os\n'), install_prefix='/opt/example/lib')
+        assert handle.readlines() == [b'#!/usr/bin/python\n',
+                                      b"import sys; sys.path.insert(0, '/opt/example/lib')\n",
+                                      b'import os\n']
+        # Files that aren't Python scripts are passed through unchanged.
+        for contents in (b'#!/bin/sh\necho "Hello world!"\n', b'\x7fELF' + b'\x00' * 1024, b''):
+            handle = rewrite_script(io.BytesIO(contents), interpreter='/usr/bin/python3', install_prefix='/opt')
+            assert handle.read() == contents
+
+    def test_member_reading(self):
+        """Test that :func:`~py2deb.package.PackageToConvert.read_member()` only rewrites the first line of scripts."""
+        package = PackageToConvert(self.create_isolated_converter(), None)
+        body = b'print("Hello world!")\r\n' * (CHUNK_SIZE // 8)
+        handle = io.BytesIO(b'#!/usr/bin/env python\n' + body)
+        head, contents = package.read_member(handle, '/usr/bin/python3')
+        assert head.startswith(b'#!/usr/bin/env python\n')
+        # The rest of the script hasn't been read yet.
+        assert handle.tell() == CHUNK_SIZE
+        assert contents.read() == b'#!/usr/bin/python3\n' + body
+        # Scripts for other interpreters are left alone.
+        head, contents = package.read_member(io.BytesIO(b'#!/bin/sh\necho 42\n'), '/usr/bin/python3')
+        assert contents.read() == b'#!/bin/sh\necho 42\n'
+
+    def test_repository_index(self):
+        """Test the persistent index of :class:`~py2deb.utils.PackageRepository`."""
+        with TemporaryDirectory() as directory:
+            touch(os.path.join(directory, 'python-foo_1.0_all.deb'))
+            touch(os.path.join(directory, 'python-bar_2.0_amd64.deb'))
+            repository = PackageRepository(directory)
+            assert [a.name for a in repository.archives] == ['python-bar', 'python-foo']
+            assert repository.get_package('python-foo', '1.0', 'all')
+            # A second repository object should reuse the index.
+            assert PackageRepository(directory).index.reconcile() is False
+            # Archives added by other means should be noticed.
+            os.unlink(os.path.join(directory, 'python-foo_1.0_all.deb'))
+            touch(os.path.join(directory, 'python-baz_3.0_all.deb'))
+            repository = PackageRepository(directory)
+            assert [a.name for a in repository.archives] == ['python-bar', 'python-baz']
+            # Archives added by py2deb should be indexed with their checksum.
+            with open(os.path.join(directory, 'python-qux_4.0_all.deb'), 'w') as handle:
+                handle.write('qux')
+            repository.add_archive(os.path.join(directory, 'python-qux_4.0_all.deb'))
+            assert repository.get_package('python-qux', '4.0', 'all')
+            assert repository.index.get_checksum('python-qux_4.0_all.deb') == hashlib.sha256(b'qux').hexdigest()
+            # Adding an archive to an up to date index keeps it up to date.
+            repository.index.reconcile()
+            directory_mtime = repository.get_directory_mtime()
+            time.sleep(0.01)
+            touch(os.path.join(directory, 'python-quux_5.0_all.deb'))
+            repository.add_archive(os.path.join(directory, 'python-quux_5.0_all.deb'), directory_mtime=directory_mtime)
+            assert repository.index.reconcile() is False
+            assert repository.get_package('python-quux', '5.0', 'all')
+            # The index isn't used in directories owned by other users.
+            if os.getuid() == 0:
+                os.chown(directory, 1, -1)
+                repository = PackageRepository(directory)
+                assert repository.index is None
+                assert [a.name for a in repository.archives] == [
+                    'python-bar', 'python-baz', 'python-quux', 'python-qux',
+                ]
+
+    def test_repository_lookup_table(self):
+        """Test the in memory lookup table of :class:`~py2deb.utils.PackageRepository`."""
+        with TemporaryDirectory() as directory:
+            touch(os.path.join(directory, 'python-foo_1.0_all.deb'))
+            touch(os.path.join(directory, 'python-bar_2.0_amd64.deb'))
+            repository = PackageRepository(directory)
+            assert repository.get_packages([
+                ('python-foo', '1.0', 'all'),
+                ('python-foo', '1.0', 'amd64'),
+                ('python-bar', '2.0', 'amd64'),
+            ]) == {
+                ('python-foo', '1.0', 'all'): parse_filename(os.path.join(directory, 'python-foo_1.0_all.deb')),
+                ('python-bar', '2.0', 'amd64'): parse_filename(os.path.join(directory, 'python-bar_2.0_amd64.deb')),
+            }
+            # Changes to the directory should be noticed without creating a new object.
+            touch(os.path.join(directory, 'python-baz_3.0_all.deb'))
+            assert repository.get_package('python-baz', '3.0', 'all')
+            os.unlink(os.path.join(directory, 'python-foo_1.0_all.deb'))
+            assert repository.get_package('python-foo', '1.0', 'all') is None
+            # Adding an archive shouldn't mask changes made by other means.
+            touch(os.path.join(directory, 'python-qux_4.0_all.deb'))
+            touch(os.path.join(directory, 'python-quux_5.0_all.deb'))
+            repository.add_archive(os.path.join(directory, 'python-qux_4.0_all.deb'))
+            assert repository.get_package('python-qux', '4.0', 'all')
+            assert repository.get_package('python-quux', '5.0', 'all')
+
     def test_conversion_of_simple_package(self):
         """
         Convert a simple Python package without any dependencies.
@@ -239,6 +428,488 @@ class PackageConverterTestCase(TestCase):
                 assert archive_entry.group == 'root'
                 assert archive_entry.permissions == '-rw-r--r--'
 
+    def test_parallel_conversion(self):
+        """
+        Convert a package and its dependencies using multiple worker processes.
+
+        Converts coloredlogs_ (which depends on humanfriendly_) serially and
+        concurrently and checks that the results are the same. The worker
+        processes are forked even when the default start method of the
+        :mod:`multiprocessing` module is ``spawn``.
+
+        .. _humanfriendly: https://pypi.org/project/humanfriendly
+        """
+        results = []
+        for jobs, start_method in ((1, None), (2, None), (2, 'spawn')):
+            if start_method and not hasattr(multiprocessing, 'set_start_method'):
+                continue
+            default_start_method = multiprocessing.get_start_method() if start_method else None
+            if start_method:
+                multiprocessing.set_start_method(start_method, force=True)
+            try:
+                with TemporaryDirectory() as directory:
+                    converter = self.create_isolated_converter()
+                    converter.set_repository(directory)
+                    converter.set_jobs(jobs)
+                    archives, relationships = converter.convert(['coloredlogs==5.0'])
+                    assert all(os.path.dirname(a) == directory for a in archives)
+                    results.append((sorted(os.path.basename(a) for a in archives), relationships))
+            finally:
+                if start_method:
+                    multiprocessing.set_start_method(default_start_method, force=True)
+        assert len(results[0][0]) == 2
+        assert all(result == results[0] for result in results)
+
+    def test_pipelined_conversion(self):
+        """
+        Convert a package and its dependencies with :attr:`~py2deb.converter.PackageConverter.pipeline_enabled`.
+
+        Converts coloredlogs_ (which depends on humanfriendly_) with and
+        without pipelining and checks that the results are the same. The
+        pipelined conversions are repeated to check that archives converted
+        in a previous run are reported as well.
+        """
+        results = []
+        for jobs, pipeline in ((1, False), (1, True), (2, True)):
+            with TemporaryDirectory() as directory:
+                for attempt in range(1 if not pipeline else 2):
+                    converter = self.create_isolated_converter()
+                    converter.set_repository(directory)
+                    converter.set_jobs(jobs)
+                    converter.set_pipeline_enabled(pipeline)
+                    archives, relationships = converter.convert(['coloredlogs==5.0'])
+                    # Archives converted in a previous run are reported as PackageFile objects.
+                    filenames = [getattr(a, 'filename', a) for a in archives]
+                    results.append((sorted(os.path.basename(f) for f in filenames), relationships))
+        assert len(results[0][0]) == 2
+        assert results[0][1] == ['%s (= 5.0)' % fix_name_prefix('python-coloredlogs')]
+        assert all(result == results[0] for result in results)
+
+    def test_background_cleanup(self):
+        """Convert a package with a custom scratch directory and background cleanup of build directories."""
+        with TemporaryDirectory() as repository_directory:
+            with TemporaryDirectory() as scratch_directory:
+                converter = self.create_isolated_converter()
+                converter.set_repository(repository_directory)
+                converter.set_scratch_directory(scratch_directory)
+                converter.set_background_cleanup(True)
+                archives, relationships = converter.convert(['coloredlogs==5.0'])
+                assert len(archives) == 2
+                # The build directories should have been removed at the end of the conversion.
+                assert not os.listdir(scratch_directory)
+
+    def test_build_directory_pool(self):
+        """Test reuse and cleanup of build directories by :class:`~py2deb.utils.BuildDirectoryPool`."""
+        with TemporaryDirectory() as scratch_directory:
+            pool = BuildDirectoryPool(directory=scratch_directory)
+            directory = pool.acquire()
+            touch(os.path.join(directory, 'some', 'file'))
+            pool.release(directory)
+            # Wait for the background thread to empty the directory.
+            timer = Timer()
+            while not pool.free_directories and timer.elapsed_time < 10:
+                time.sleep(0.1)
+            # The emptied directory should be reused.
+            assert pool.acquire() == directory
+            assert not os.listdir(directory)
+            pool.release(directory)
+            pool.close()
+            assert not os.listdir(scratch_directory)
+
+    def test_strip_object_files(self):
+        """Test concurrent stripping of object files using :func:`~py2deb.utils.strip_object_files()`."""
+        with TemporaryDirectory() as directory:
+            object_files = []
+            for i in range(4):
+                # Compile a small shared object with debugging symbols.
+                source_file = os.path.join(directory, 'module%i.c' % i)
+                object_file = os.path.join(directory, 'module%i.so' % i)
+                with open(source_file, 'w') as handle:
+                    handle.write('int function%i(void) { return %i; }\n' % (i, i))
+                execute('cc', '-g', '-shared', '-fPIC', '-o', object_file, source_file)
+                object_files.append(object_file)
+            # Files that aren't object files are reported but don't cause an exception.
+            bogus_file = os.path.join(directory, 'bogus.so')
+            touch(bogus_file)
+            sizes = [os.path.getsize(fn) for fn in object_files]
+            strip_object_files(object_files + [bogus_file], concurrency=2)
+            assert all(os.path.getsize(fn) < size for fn, size in zip(object_files, sizes))
+
+    def test_elf_inspection(self):
+        """Test the in process inspection of object files using :func:`~py2deb.elf.inspect_elf_file()`."""
+        with TemporaryDirectory() as directory:
+            source_file = os.path.join(directory, 'module.c')
+            object_file = os.path.join(directory, 'module.so')
+            with open(source_file, 'w') as handle:
+                handle.write('#include <stdio.h>\nvoid function(void) { puts("Hello world!"); }\n')
+            execute('cc', '-g', '-shared', '-fPIC', '-Wl,-soname,libmodule.so.1', '-o', object_file, source_file)
+            # Files are identified by their magic bytes, not by their filename extension.
+            bogus_file = os.path.join(directory, 'bogus.so')
+            with open(bogus_file, 'w') as handle:
+                handle.write('This is not an object file.\n')
+            assert is_elf_file(object_file)
+            assert not is_elf_file(bogus_file)
+            assert find_elf_files(directory) == [object_file]
+            self.assertRaises(ValueError, inspect_elf_file, bogus_file)
+            # Check the needed libraries and stripped status before and after stripping.
+            info = inspect_elf_file(object_file)
+            assert info.soname == 'libmodule.so.1'
+            assert 'libc.so.6' in info.needed
+            assert not info.stripped
+            strip_object_files([object_file])
+            info = inspect_elf_file(object_file)
+            assert 'libc.so.6' in info.needed
+            assert info.stripped
+
+    def test_debug_symbol_files(self):
+        """Test that :func:`~py2deb.utils.strip_object_files()` keeps debugging information in debug files."""
+        with TemporaryDirectory() as directory:
+            source_file = os.path.join(directory, 'module.c')
+            object_file = os.path.join(directory, 'module.so')
+            debug_directory = os.path.join(directory, 'debug')
+            with open(source_file, 'w') as handle:
+                handle.write('int function(void) { return 42; }\n')
+            execute('cc', '-g', '-shared', '-fPIC', '-Wl,--build-id', '-o', object_file, source_file)
+            build_id = inspect_elf_file(object_file).build_id
+            assert build_id
+            # Identical copies of an object file share a single debug file.
+            copy_file = os.path.join(directory, 'copy.so')
+            shutil.copy(object_file, copy_file)
+            debug_files = strip_object_files([object_file, copy_file], concurrency=2, debug_directory=debug_directory)
+            assert debug_files == [os.path.join(debug_directory, build_id[:2], build_id[2:] + '.debug')]
+            assert inspect_elf_file(object_file).stripped
+            assert inspect_elf_file(copy_file).stripped
+            # The stripped object file keeps its build ID.
+            assert inspect_elf_file(object_file).build_id == build_id
+            assert not inspect_elf_file(debug_files[0]).stripped
+            # Object files are stripped even when objcopy fails.
+            execute('cc', '-g', '-shared', '-fPIC', '-Wl,--build-id', '-o', object_file, source_file)
+            shutil.rmtree(debug_directory)
+            os.makedirs(debug_files[0])
+            assert strip_object_files([object_file], debug_directory=debug_directory) == []
+            assert inspect_elf_file(object_file).stripped
+
+    def test_dependency_cache(self):
+        """Test caching of system dependencies using :class:`~py2deb.cache.DependencyCache`."""
+        # Test merging of the relationships of multiple object files.
+        assert merge_relationships([
+            'libc6 (>= 2.14)', 'libc6 (>= 2.34)', 'libc6', 'zlib1g (>= 1:1.1.4)', 'zlib1g (>= 1:1.1.4)',
+        ]) == ['libc6 (>= 2.34)', 'zlib1g (>= 1:1.1.4)']
+        with TemporaryDirectory() as directory:
+            cache = DependencyCache(os.path.join(directory, 'dependencies.sqlite3'), max_entries=2)
+            # Test least recently used eviction.
+            cache.put('a' * 64, 'amd64', ['libc6 (>= 2.14)'])
+            cache.put('b' * 64, 'amd64', ['zlib1g'])
+            assert cache.get('a' * 64, 'amd64') == ['libc6 (>= 2.14)']
+            assert cache.get('a' * 64, 'i386') is None
+            cache.put('c' * 64, 'amd64', [])
+            assert cache.get('a' * 64, 'amd64') == ['libc6 (>= 2.14)']
+            assert cache.get('b' * 64, 'amd64') is None
+            assert cache.get('c' * 64, 'amd64') == []
+            # The cache is only used when it's configured.
+            converter = self.create_isolated_converter()
+            assert converter.dependency_cache is None
+            converter.set_dependency_cache(directory)
+            assert converter.dependency_cache.filename == os.path.join(directory, 'dependencies.sqlite3')
+            # Test that the cache is used for object files.
+            source_file = os.path.join(directory, 'module.c')
+            object_file = os.path.join(directory, 'module.so')
+            with open(source_file, 'w') as handle:
+                handle.write('#include <stdio.h>\nvoid function(void) { puts("Hello world!"); }\n')
+            execute('cc', '-shared', '-fPIC', '-o', object_file, source_file)
+            expected = find_system_dependencies([object_file], 'amd64')
+            assert find_system_dependencies([object_file], 'amd64', cache=cache) == expected
+            assert cache.get(hash_files(object_file), 'amd64') == expected
+            # A cache hit doesn't run dpkg-shlibdeps.
+            cache.put(hash_files(object_file), 'amd64', ['fake-package (>= 1.0)'])
+            assert find_system_dependencies([object_file], 'amd64', cache=cache) == ['fake-package (>= 1.0)']
+            # Object files that don't need shared libraries are only skipped
+            # when the cache is used (without a cache all object files are
+            # given to dpkg-shlibdeps, like deb-pkg-tools does).
+            static_file = os.path.join(directory, 'static.so')
+            execute('cc', '-shared', '-fPIC', '-nostdlib', '-o', static_file, source_file)
+            assert find_system_dependencies([static_file], 'amd64', cache=cache) == []
+            assert cache.get(hash_files(static_file), 'amd64') is None
+
+    def test_lintian_batch(self):
+        """Test running Lintian after the conversion using :func:`~py2deb.writer.run_lintian_batch()`."""
+        with TemporaryDirectory() as directory:
+            cache = LintianCache(os.path.join(directory, 'lintian'))
+            # Test the cache.
+            assert cache.get('a' * 64) is None
+            cache.put('a' * 64, u'W: example: some-tag\n')
+            assert cache.get('a' * 64) == u'W: example: some-tag\n'
+            # Build a trivial package to check.
+            package_directory = os.path.join(directory, 'package')
+            os.makedirs(os.path.join(package_directory, 'DEBIAN'))
+            with open(os.path.join(package_directory, 'DEBIAN', 'control'), 'w') as handle:
+                handle.write(dedent('''
+                    Package: py2deb-lintian-test
+                    Version: 1.0
+                    Architecture: all
+                    Maintainer: py2deb <py2deb@example.com>
+                    Description: Test package for Lintian batches.
+                ''').lstrip())
+            archive = build_package(package_directory, directory, check_package=False)
+            # Check the archive in a batch.
+            converter = self.create_isolated_converter()
+            converter.set_lintian_batch('yes')
+            converter.lintian_cache = LintianCache(os.path.join(directory, 'reports'))
+            assert converter.lintian_batch is True
+            converter.archives_to_check.extend([archive, archive])
+            converter.run_lintian_batch()
+            assert not converter.archives_to_check
+            if os.access('/usr/bin/lintian', os.X_OK):
+                # The archive is checked once and the report is cached.
+                reports = [fn for root, dirs, files in os.walk(converter.lintian_cache.directory) for fn in files]
+                assert len(reports) == 1
+
+    def test_compression_options(self):
+        """Test the global and package specific compression options."""
+        with TemporaryDirectory() as directory:
+            converter = self.create_isolated_converter()
+            converter.set_repository(directory)
+            converter.set_compression('gzip')
+            converter.set_compression_level(1)
+            converter.set_package_compression('coloredlogs', compression='xz', threads=0)
+            assert converter.get_compression_options('ColoredLogs') == dict(compression='xz', level=1, threads=0)
+            assert converter.get_compression_options('humanfriendly') == dict(compression='gzip', level=1, threads=None)
+            archives, relationships = converter.convert(['coloredlogs==5.0'])
+            members = {}
+            for archive in archives:
+                listing = execute('ar', 't', archive, capture=True)
+                members[parse_filename(archive).name] = [m for m in listing.split() if m.startswith('data.tar')]
+            assert members[fix_name_prefix('python-coloredlogs')] == ['data.tar.xz']
+            assert members[fix_name_prefix('python-humanfriendly')] == ['data.tar.gz']
+
+    def test_streaming_conversion(self):
+        """Test that :func:`~py2deb.converter.PackageConverter.convert_iter()` reports dependencies first."""
+        with TemporaryDirectory() as directory:
+            converter = self.create_isolated_converter()
+            converter.set_repository(directory)
+            results = list(converter.convert_iter(['coloredlogs==5.0']))
+            names = [parse_filename(archive).name for archive, relationship in results]
+            assert names == [fix_name_prefix('python-humanfriendly'), fix_name_prefix('python-coloredlogs')]
+            relationships = [relationship for archive, relationship in results]
+            assert relationships[1] == '%s (= 5.0)' % fix_name_prefix('python-coloredlogs')
+
+    def test_streaming_archive_writer(self):
+        """Compare packages converted with and without :attr:`~py2deb.converter.PackageConverter.streaming_enabled`."""
+        results = []
+        for streaming in (False, True):
+            with TemporaryDirectory() as directory:
+                converter = self.create_isolated_converter()
+                converter.set_repository(directory)
+                converter.set_streaming_enabled(streaming)
+                archives, relationships = converter.convert(['--no-deps', 'coloredlogs==5.0'])
+                assert len(archives) == 1
+                assert converter.packages_to_convert[0].streaming_supported == streaming
+                fields, contents = inspect_package(archives[0])
+                results.append((os.path.basename(archives[0]), fields['Depends'], sorted(contents)))
+                # The manifest of the archive matches its contents.
+                assert converter.packages_to_convert[0].manifest['pathnames'] == sorted(
+                    p for p, entry in contents.items() if not entry.permissions.startswith('d')
+                )
+        assert results[0] == results[1]
+
+    def test_reproducible_packages(self):
+        """Convert a package twice with :attr:`~py2deb.converter.PackageConverter.reproducible` enabled."""
+        with patched_environment({'SOURCE_DATE_EPOCH': '1500000000'}):
+            for streaming in (False, True):
+                checksums = []
+                for i in range(2):
+                    with TemporaryDirectory() as directory:
+                        converter = self.create_isolated_converter()
+                        assert converter.reproducible
+                        assert converter.source_date_epoch == 1500000000
+                        converter.set_repository(directory)
+                        converter.set_streaming_enabled(streaming)
+                        archives, relationships = converter.convert(['--no-deps', 'coloredlogs==5.0'])
+                        package = converter.packages_to_convert[0]
+                        assert package.debian_description == 'Python package coloredlogs converted by py2deb'
+                        fields, contents = inspect_package(archives[0])
+                        timestamp = time.strftime('%Y-%m-%d %H:%M', time.localtime(1500000000))
+                        assert all(entry.modified == timestamp for entry in contents.values())
+                        checksums.append(hash_files(archives[0]))
+                    # Make sure the second conversion happens at a different time.
+                    time.sleep(1)
+                assert checksums[0] == checksums[1]
+
+    def test_precompiled_bytecode(self):
+        """Convert a package with :attr:`~py2deb.converter.PackageConverter.precompile_enabled`."""
+        if not hasattr(py_compile, 'PycInvalidationMode'):
+            return self.skipTest("unchecked hash based bytecode files require Python 3.7+")
+        from importlib.util import cache_from_source
+        with TemporaryDirectory() as directory:
+            sources = []
+            for name, contents in (('good.py', 'x = 42\n'), ('bad.py', 'x = (\n')):
+                with open(os.path.join(directory, name), 'w') as handle:
+                    handle.write(contents)
+                sources.append(('/usr/lib/test/%s' % name, os.path.join(directory, name)))
+            # Modules with syntax errors are skipped.
+            results = compile_bytecode(sources, concurrency=2)
+            assert [pathname for pathname, filename in results] == [cache_from_source('/usr/lib/test/good.py')]
+            # The bytecode file is an unchecked hash based bytecode file.
+            with open(results[0][1], 'rb') as handle:
+                assert handle.read()[4:8] == b'\x01\x00\x00\x00'
+        with TemporaryDirectory() as directory:
+            converter = self.create_isolated_converter()
+            converter.set_repository(directory)
+            converter.set_precompile_enabled(True)
+            archives, relationships = converter.convert(['--no-deps', 'coloredlogs==5.0'])
+            package = converter.packages_to_convert[0]
+            assert package.streaming_supported and package.bytecode_included
+            fields, contents = inspect_package(archives[0])
+            modules = [p for p in contents if p.endswith('.py')]
+            assert modules and all(cache_from_source(p) in contents for p in modules)
+            # The post-installation script doesn't compile the modules.
+            postinst = execute('dpkg-deb', '--info', archives[0], 'postinst', capture=True)
+            assert 'bytecode_included=True' in postinst
+
+    def test_fast_launchers(self):
+        """Convert a package with :attr:`~py2deb.converter.PackageConverter.fast_launchers_enabled`."""
+        with TemporaryDirectory() as directory:
+            converter = self.create_isolated_converter()
+            converter.set_repository(directory)
+            converter.set_fast_launchers_enabled(True)
+            archives, relationships = converter.convert(['--no-deps', 'coloredlogs==5.0'])
+            package = converter.packages_to_convert[0]
+            assert 'coloredlogs' in package.console_scripts
+            extracted = os.path.join(directory, 'extracted')
+            execute('dpkg-deb', '--extract', archives[0], extracted)
+            with open(os.path.join(extracted, 'usr', 'bin', 'coloredlogs')) as handle:
+                launcher = handle.read()
+            assert launcher.startswith('#!/usr/bin/%s\n' % python_version())
+            assert 'from coloredlogs.cli import main' in launcher
+            assert 'pkg_resources' not in launcher
+
+    def test_zip_bundles(self):
+        """Convert a package with :attr:`~py2deb.converter.PackageConverter.zip_bundles_enabled`."""
+        if not hasattr(py_compile, 'PycInvalidationMode'):
+            return self.skipTest("zip bundles require Python 3.7+")
+        with TemporaryDirectory() as directory:
+            converter = self.create_isolated_converter()
+            converter.set_repository(directory)
+            converter.set_install_prefix('/usr/lib/py2deb/zipped')
+            converter.set_zip_bundles_enabled(True)
+            archives, relationships = converter.convert(['--no-deps', 'coloredlogs==5.0'])
+            package = converter.packages_to_convert[0]
+            assert package.zip_bundle_supported
+            fields, contents = inspect_package(archives[0])
+            bundle = '/usr/lib/py2deb/zipped/lib/%s.zip' % package.debian_name
+            assert bundle in contents
+            assert '/usr/lib/py2deb/zipped/lib/%s.pth' % package.debian_name in contents
+            # The Python modules are packed into the zip bundle, the metadata stays on disk.
+            assert not any(p.endswith('.py') for p in contents)
+            assert any('.egg-info/' in p for p in contents)
+            # The modules (and their bytecode files) can be imported from the zip bundle.
+            extracted = os.path.join(directory, 'extracted')
+            execute('dpkg-deb', '--extract', archives[0], extracted)
+            lib = os.path.join(extracted, 'usr/lib/py2deb/zipped/lib')
+            # The interpreter is started with -S so that a coloredlogs
+            # installed in site-packages can't shadow the zip bundle.
+            origin = execute(sys.executable, '-S', '-c', '; '.join([
+                'import importlib.util, site', 'site.addsitedir(%r)' % lib,
+                'print(importlib.util.find_spec("coloredlogs").origin)',
+            ]), capture=True)
+            assert origin == os.path.join(lib, '%s.zip' % package.debian_name, 'coloredlogs', '__init__.pyc')
+        # Executable scripts add the installation prefix as a site directory.
+        handle = rewrite_script(io.BytesIO(b'#!/usr/bin/python\nimport os\n'), install_prefix=lib,
+                                site_directory=True)
+        script = handle.read()
+        assert (".addsitedir(%r)" % lib).encode('UTF-8') in script
+        # The snippet puts the site directory first and doesn't leave any names behind.
+        namespace = {}
+        saved_path = list(sys.path)
+        try:
+            exec(compile(script, 'script', 'exec'), namespace)
+            assert sys.path[0] == lib
+        finally:
+            sys.path[:] = saved_path
+        assert sorted(namespace) == ['__builtins__', 'os']
+
+    def test_module_index(self):
+        """Convert a package with :attr:`~py2deb.converter.PackageConverter.module_index_enabled`."""
+        with TemporaryDirectory() as directory:
+            converter = self.create_isolated_converter()
+            converter.set_repository(directory)
+            converter.set_install_prefix('/usr/lib/py2deb/indexed')
+            converter.set_module_index_enabled(True)
+            archives, relationships = converter.convert(['--no-deps', 'coloredlogs==5.0'])
+            # The runtime package is generated along with the converted package.
+            assert len(archives) == 2
+            runtime_archive = find_package_archive(archives, converter.module_index_package)
+            fields, contents = inspect_package(runtime_archive)
+            assert fields['Architecture'] == 'all'
+            assert '/usr/lib/py2deb/indexed/lib/py2deb_finder.py' in contents
+            assert '/usr/lib/py2deb/indexed/lib/py2deb_finder.pth' in contents
+            package = converter.packages_to_convert[0]
+            assert converter.module_index_package in package.debian_dependencies
+            # Simulate the installation of both packages.
+            extracted = os.path.join(directory, 'extracted')
+            execute('dpkg-deb', '--extract', find_package_archive(archives, package.debian_name), extracted)
+            lib = os.path.join(extracted, 'usr/lib/py2deb/indexed/lib')
+            # A module that has the same name as a module in the standard library.
+            with open(os.path.join(lib, 'string.py'), 'w') as handle:
+                handle.write('raise ImportError("shadowed the standard library")\n')
+            installed_files = [os.path.join(root, filename)
+                               for root, dirs, files in os.walk(lib)
+                               for filename in files]
+            update_module_index(package.debian_name, lib, installed_files)
+            execute('dpkg-deb', '--extract', runtime_archive, extracted)
+            with open(os.path.join(lib, 'py2deb-modules.json')) as handle:
+                index = json.load(handle)
+            assert index['coloredlogs'] == dict(path=os.path.join(lib, 'coloredlogs', '__init__.py'),
+                                                package=package.debian_name)
+            # Imports of indexed modules are resolved by the finder (the
+            # interpreter is started with -S so that a coloredlogs installed
+            # in site-packages doesn't take precedence), modules found
+            # earlier on the module search path keep precedence.
+            if sys.version_info[:2] >= (3, 4):
+                finder = execute(sys.executable, '-S', '-c', '; '.join([
+                    'import importlib.util, site, sys', 'site.addsitedir(%r)' % lib,
+                    'import py2deb_finder',
+                    'print(py2deb_finder.ModuleIndexFinder in set(type(f) for f in sys.meta_path))',
+                    'print(importlib.util.find_spec("coloredlogs").origin)',
+                    'import string', 'print(string.__file__)',
+                ]), capture=True)
+                lines = finder.splitlines()
+                assert lines[:2] == ['True', os.path.join(lib, 'coloredlogs', '__init__.py')]
+                assert not lines[2].startswith(lib)
+            # The index is cleaned up when the package is removed.
+            cleanup_module_index(package.debian_name, lib)
+            assert not os.path.exists(os.path.join(lib, 'py2deb-modules.json'))
+
+    def test_build_cache(self):
+        """Convert a package using :attr:`~py2deb.converter.PackageConverter.build_cache`."""
+        with TemporaryDirectory() as cache_directory:
+            with TemporaryDirectory() as first_repository:
+                converter = self.create_isolated_converter()
+                converter.set_repository(first_repository)
+                converter.set_build_cache(cache_directory)
+                archives, relationships = converter.convert(['--no-deps', 'coloredlogs==5.0'])
+                assert len(archives) == 1
+                original_archive = archives[0]
+                original_fingerprint = converter.packages_to_convert[0].fingerprint
+                # Check that a cache hit doesn't depend on the repository.
+                with TemporaryDirectory() as second_repository:
+                    converter = self.create_isolated_converter()
+                    converter.set_repository(second_repository)
+                    converter.set_build_cache(cache_directory)
+                    archives, relationships = converter.convert(['--no-deps', 'coloredlogs==5.0'])
+                    # Previously converted archives are reported as PackageFile objects.
+                    assert os.path.dirname(archives[0].filename) == second_repository
+                    assert os.path.samefile(archives[0].filename, original_archive)
+                # Check that changing a conversion option invalidates the cache.
+                converter = self.create_isolated_converter()
+                converter.set_repository(first_repository)
+                converter.set_build_cache(cache_directory)
+                converter.set_conversion_command('coloredlogs', 'true')
+                archives, relationships = converter.convert(['--no-deps', 'coloredlogs==5.0'])
+                package = converter.packages_to_convert[0]
+                assert package.fingerprint != original_fingerprint
+                assert os.path.samefile(archives[0], converter.build_cache.get(package.fingerprint))
+
     def test_custom_conversion_command(self):
         """
         Convert a simple Python package that requires a custom conversion command.
@@ -285,6 +956,55 @@ class PackageConverterTestCase(TestCase):
                 ['--no-deps', 'Fabric==0.9.0', 'Paramiko==1.14.0'],
             )
 
+    def test_manifest_duplicate_files_check(self):
+        """Test the duplicate files check based on manifests (see :mod:`py2deb.manifests`)."""
+        with TemporaryDirectory() as directory:
+            archives = []
+            manifests = []
+            for name, relationships in (('a', ''), ('b', ''), ('c', 'v'), ('d', 'v')):
+                build_directory = os.path.join(directory, name)
+                touch(os.path.join(build_directory, 'usr', 'lib', 'common.py'))
+                touch(os.path.join(build_directory, 'usr', 'lib', '%s.py' % name))
+                touch(os.path.join(build_directory, 'DEBIAN', 'control'))
+                with open(os.path.join(build_directory, 'DEBIAN', 'control'), 'w') as handle:
+                    handle.write('Package: %s\n' % name)
+                    if relationships:
+                        handle.write('Conflicts: %s\nProvides: %s\n' % (relationships, relationships))
+                archives.append(os.path.join(directory, '%s_1.0_all.deb' % name))
+                manifests.append(create_manifest(build_directory))
+            assert manifests[0]['pathnames'] == ['/usr/lib/a.py', '/usr/lib/common.py']
+            assert manifests[2]['conflicts'] == ['v']
+            # Unrelated packages containing the same file should be reported.
+            self.assertRaises(DuplicateFilesFound, check_duplicate_files, archives[:2], manifests[:2])
+            # Packages marked as conflicting should not be reported.
+            check_duplicate_files(archives[2:], manifests[2:])
+
+    def test_manifest_digests(self):
+        """Test the digests recorded by :func:`~py2deb.manifests.create_manifest()`."""
+        with TemporaryDirectory() as directory:
+            touch(os.path.join(directory, 'DEBIAN', 'control'))
+            touch(os.path.join(directory, 'usr', 'lib', 'changed.py'))
+            with open(os.path.join(directory, 'usr', 'lib', 'module.py'), 'wb') as handle:
+                handle.write(b'print(42)\n')
+            # Recorded digests are reused, missing digests are calculated and
+            # digests of files that were removed are discarded.
+            digests = {
+                '/usr/lib/changed.py': get_digests(b'recorded'),
+                '/usr/lib/removed.py': get_digests(b'removed'),
+            }
+            manifest = create_manifest(directory, digests)
+            assert sorted(digests) == ['/usr/lib/changed.py', '/usr/lib/module.py']
+            assert digests['/usr/lib/changed.py'] == get_digests(b'recorded')
+            assert manifest['checksums'] == {
+                '/usr/lib/changed.py': hashlib.sha256(b'recorded').hexdigest(),
+                '/usr/lib/module.py': hashlib.sha256(b'print(42)\n').hexdigest(),
+            }
+            write_md5sums(directory, digests)
+            with open(os.path.join(directory, 'DEBIAN', 'md5sums')) as handle:
+                assert handle.read() == '%s  usr/lib/changed.py\n%s  usr/lib/module.py\n' % (
+                    hashlib.md5(b'recorded').hexdigest(), hashlib.md5(b'print(42)\n').hexdigest(),
+                )
+
     def test_conversion_of_package_with_dependencies(self):
         """
         Convert a non trivial Python package with several dependencies.
@@ -9,19 +9,40 @@
 """The :mod:`py2deb.utils` module contains miscellaneous code."""
 
 # Standard library modules.
+import collections
+import contextlib
+import functools
+import hashlib
+import io
 import logging
+import multiprocessing
 import os
 import platform
+import py_compile
 import re
 import shlex
 import shutil
+import sqlite3
 import sys
 import tempfile
+import threading
+import types
+from multiprocessing.pool import ThreadPool
 
 # External dependencies.
-from property_manager import PropertyManager, cached_property, required_property
+from property_manager import PropertyManager, cached_property, clear_property, mutable_property, required_property
+import deb_pkg_tools.package
+from deb_pkg_tools.cache import get_default_cache
 from deb_pkg_tools.package import find_package_archives
-from six import BytesIO
+from deb_pkg_tools.version import Version
+from executor import CommandNotFound, ExternalCommandFailed, execute
+from humanfriendly import Timer
+from humanfriendly.text import pluralize
+from six.moves import queue
+
+# Modules included in our package.
+from py2deb.elf import inspect_elf_file
+from py2deb.manifests import load_manifest
 
 # Initialize a logger.
 logger = logging.getLogger(__name__)
@@ -44,6 +65,157 @@ The following are examples of program names that match this pattern:
 - python3m
 """
 
+FUTURE_IMPORT_PATTERN = re.compile(br'^\s*from\s+__future__\s+import\s+')
+"""A compiled regular expression to match ``from __future__ import ...`` statements (in byte strings)."""
+
+STRING_LITERAL_PATTERN = re.compile(br'^[bBrRuU]{0,2}(\'\'\'|"""|\'|")')
+"""A compiled regular expression to match the start of a string literal (in byte strings)."""
+
+COMPRESSION_TYPES = ('gzip', 'none', 'xz', 'zstd')
+"""The compression types supported by :func:`coerce_compression()` (a tuple of strings)."""
+
+TRANSFORMATION_CACHE_SIZE = 10000
+"""
+The maximum number of entries in each cache of name and version transformations (an integer).
+
+Refer to :func:`memoize()` and :func:`.PackageConverter.transform_name()`.
+"""
+
+TRANSFORMATION_CACHES = []
+"""The :class:`LRUCache` objects created by :func:`memoize()` and used by :func:`tokenize_version()` (a list)."""
+
+
+class LRUCache(object):
+
+    """
+    Bounded cache that discards the least recently used entries.
+
+    Used to avoid recomputing the transformation of Python package names and
+    version numbers for the same inputs thousands of times (see
+    :func:`memoize()`). The number of hits and misses are counted so that the
+    effectiveness of the cache can be reported (see :func:`describe()`).
+
+    The caches in :data:`TRANSFORMATION_CACHES` belong to module level
+    functions, so their counters are shared by all converters in the process
+    and keep growing for the lifetime of the process. Use
+    :func:`snapshot_cache_statistics()` and :func:`report_cache_statistics()`
+    to report on the lookups made during a single conversion.
+    """
+
+    def __init__(self, name, size=TRANSFORMATION_CACHE_SIZE):
+        """
+        Initialize an :class:`LRUCache` object.
+
+        :param name: A name for the cache that's used in log messages (a string).
+        :param size: The maximum number of entries in the cache (an integer).
+        """
+        self.name = name
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        """Discard all entries (but not the hit and miss counters)."""
+        with self.lock:
+            self.entries.clear()
+
+    def describe(self, hits_before=0, misses_before=0):
+        """
+        Describe the effectiveness of the cache.
+
+        :param hits_before: The number of hits to subtract (an integer).
+        :param misses_before: The number of misses to subtract (an integer).
+        :returns: A string like ``normalize_package_name: 1234 hits, 56 misses, 56 entries``.
+        """
+        return "%s: %s, %s, %s" % (
+            self.name,
+            pluralize(self.hits - hits_before, "hit"),
+            pluralize(self.misses - misses_before, "miss", "misses"),
+            pluralize(len(self.entries), "entry", "entries"),
+        )
+
+    def lookup(self, key, compute):
+        """
+        Get a value from the cache, computing and storing it on a cache miss.
+
+        :param key: A hashable value.
+        :param compute: A callable that takes no arguments and returns the
+                        value to cache.
+        :returns: The cached or computed value.
+        """
+        with self.lock:
+            if key in self.entries:
+                value = self.entries.pop(key)
+                self.entries[key] = value
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = compute()
+        with self.lock:
+            self.entries[key] = value
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return value
+
+
+def memoize(function):
+    """
+    Cache the results of a pure function in an :class:`LRUCache`.
+
+    :param function: The function to decorate. Its return value should depend
+                     only on its arguments and should not be mutated by
+                     callers (because cached values are shared).
+    :returns: The decorated function. Its :class:`LRUCache` is available as
+              the ``cache`` attribute and is registered in
+              :data:`TRANSFORMATION_CACHES`.
+
+    Calls with unhashable arguments are passed straight through to the
+    function.
+    """
+    cache = LRUCache(function.__name__)
+    TRANSFORMATION_CACHES.append(cache)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kw):
+        key = (args, tuple(sorted(kw.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return function(*args, **kw)
+        return cache.lookup(key, lambda: function(*args, **kw))
+    wrapper.cache = cache
+    return wrapper
+
+
+def snapshot_cache_statistics(*caches):
+    """
+    Record the hit and miss counters of :data:`TRANSFORMATION_CACHES` (and any given caches).
+
+    :param caches: Additional :class:`LRUCache` objects to report on.
+    :returns: A list of tuples with three values each: An :class:`LRUCache`
+              object, its number of hits and its number of misses. This
+              value is meant to be passed to :func:`report_cache_statistics()`.
+    """
+    return [(cache, cache.hits, cache.misses) for cache in TRANSFORMATION_CACHES + list(caches)]
+
+
+def report_cache_statistics(snapshot):
+    """
+    Log the effectiveness of caches since a snapshot was taken, at debug level.
+
+    :param snapshot: The result of :func:`snapshot_cache_statistics()`.
+
+    Only the lookups made since the snapshot was taken are reported. Lookups
+    made by worker processes (see :attr:`.PackageConverter.jobs`) aren't
+    included because worker processes have their own copy of the counters,
+    while lookups made by other converters running concurrently in the same
+    process are included.
+    """
+    for cache, hits, misses in snapshot:
+        logger.debug("Cache statistics for %s.", cache.describe(hits, misses))
+
 
 class PackageRepository(PropertyManager):
 
@@ -67,8 +239,10 @@ class PackageRepository(PropertyManager):
         """
         A sorted list of package archives in :attr:`directory`.
 
-        The value of :attr:`archives` is computed using
-        :func:`deb_pkg_tools.package.find_package_archives()`.
+        The value of :attr:`archives` is computed using the persistent
+        :attr:`index` of the repository. When the index can't be used (for
+        example because the repository directory isn't writable) it's computed
+        using :func:`deb_pkg_tools.package.find_package_archives()` instead.
 
         An example:
 
@@ -101,12 +275,89 @@ class PackageRepository(PropertyManager):
                      filename='/tmp/py2deb-six_1.6.1_all.deb')]
 
         """
-        return find_package_archives(self.directory)
+        if self.index:
+            try:
+                return self.index.get_archives()
+            except (EnvironmentError, sqlite3.Error) as e:
+                logger.warning("Failed to use repository index, falling back to directory listing! (%s)", e)
+                self.index = None
+        return sorted(find_package_archives(self.directory))
 
     @required_property
     def directory(self):
         """The pathname of a directory containing ``*.deb`` archives (a string)."""
 
+    @mutable_property(cached=True)
+    def index(self):
+        """
+        The persistent index of the repository (a :class:`.RepositoryIndex` object or :data:`None`).
+
+        Set this to :data:`None` to disable the use of the index. The index
+        isn't used when the repository directory (or an existing index) isn't
+        owned by the current user (see :attr:`.RepositoryIndex.owned_by_current_user`).
+        """
+        # Imported here because py2deb.index depends on this module.
+        from py2deb.index import RepositoryIndex
+        index = RepositoryIndex(self.directory)
+        try:
+            if index.owned_by_current_user:
+                return index
+            logger.debug("Not using repository index because it's not owned by the current user: %s",
+                         self.directory)
+        except EnvironmentError as e:
+            logger.warning("Failed to check ownership of repository index! (%s)", e)
+        return None
+
+    def add_archive(self, pathname, checksum=None, manifest=None, directory_mtime=None):
+        """
+        Register an archive that was added to the repository.
+
+        :param pathname: The pathname of a ``*.deb`` archive inside
+                         :attr:`directory` (a string).
+        :param checksum: The SHA-256 digest of the archive (a string, optional).
+        :param manifest: The manifest of the archive (a dictionary, optional,
+                         refer to :mod:`py2deb.manifests`).
+        :param directory_mtime: The value of :func:`get_directory_mtime()`
+                                before the archive was moved into
+                                :attr:`directory` (a number, optional).
+
+        Updates the :attr:`index` incrementally (so that the next
+        :class:`PackageRepository` object doesn't need to scan the directory
+        for the new archive, refer to :func:`.RepositoryIndex.add_archive()`)
+        and discards :attr:`archives` and :attr:`lookup_table`. They're
+        recomputed from the index on next use, which also picks up any changes
+        made to the repository by other means in the meantime.
+        """
+        if self.index:
+            try:
+                self.index.add_archive(pathname, checksum, manifest, directory_mtime)
+            except (EnvironmentError, sqlite3.Error) as e:
+                logger.warning("Failed to update repository index! (%s)", e)
+        self.discard_snapshot()
+
+    def get_manifest(self, pathname):
+        """
+        Get the manifest of an archive in the repository.
+
+        :param pathname: The pathname of a ``*.deb`` archive inside
+                         :attr:`directory` (a string).
+        :returns: A manifest (a dictionary, refer to :mod:`py2deb.manifests`).
+
+        Manifests are taken from the :attr:`index` when possible. Otherwise
+        the archive is inspected and the resulting manifest is stored in the
+        index, so each archive is inspected at most once.
+        """
+        if self.index:
+            try:
+                manifest = self.index.get_manifest(pathname)
+                if manifest is None:
+                    manifest = load_manifest(pathname, cache=get_default_cache())
+                    self.index.add_archive(pathname, manifest=manifest)
+                return manifest
+            except (EnvironmentError, sqlite3.Error) as e:
+                logger.warning("Failed to use repository index for manifest! (%s)", e)
+        return load_manifest(pathname, cache=get_default_cache())
+
     def get_package(self, package, version, architecture):
         """
         Find a package in the repository.
@@ -123,9 +374,300 @@ class PackageRepository(PropertyManager):
         >>> repo.get_package('py2deb', '0.1', 'all')
         PackageFile(name='py2deb', version='0.1', architecture='all', filename='/tmp/py2deb_0.1_all.deb')
         """
-        for archive in self.archives:
-            if archive.name == package and archive.version == version and archive.architecture == architecture:
-                return archive
+        self.refresh()
+        return self.lookup_table.get((package, str(version), architecture))
+
+    def get_packages(self, packages):
+        """
+        Find multiple packages in the repository.
+
+        :param packages: An iterable of tuples with three strings each (the
+                         arguments to :func:`get_package()`).
+        :returns: A dictionary with the given tuples as keys and
+                  :class:`deb_pkg_tools.package.PackageFile` objects as
+                  values. Packages that don't exist in the repository are not
+                  included in the dictionary.
+
+        This answers the question "which of these packages already exist?"
+        while checking whether the directory changed only once (it's used by
+        :attr:`.PackageToConvert.existing_archive`).
+        """
+        self.refresh()
+        existing_packages = {}
+        for package, version, architecture in packages:
+            archive = self.lookup_table.get((package, str(version), architecture))
+            if archive is not None:
+                existing_packages[(package, version, architecture)] = archive
+        return existing_packages
+
+    @property
+    def have_snapshot(self):
+        """:data:`True` if :attr:`archives` and :attr:`lookup_table` have been computed, :data:`False` otherwise."""
+        return self.snapshot_mtime is not None
+
+    @cached_property
+    def lookup_table(self):
+        """
+        A dictionary that maps package names, versions and architectures to archives.
+
+        The keys of the dictionary are tuples with three strings each (the
+        name, version and architecture of a package) and the values are
+        :class:`deb_pkg_tools.package.PackageFile` objects taken from
+        :attr:`archives`. This is what makes :func:`get_package()` a
+        constant time operation regardless of the size of the repository.
+
+        Because :class:`~deb_pkg_tools.package.PackageFile` is a named tuple
+        (which defines empty ``__slots__``) the records don't carry the
+        overhead of an instance dictionary.
+
+        The last modified time of :attr:`directory` is recorded (see
+        :attr:`snapshot_mtime`) before the archives are listed, so that
+        changes made while the archives are being listed are noticed by
+        :func:`refresh()`.
+        """
+        mtime = self.get_directory_mtime()
+        clear_property(self, 'archives')
+        lookup_table = dict(((a.name, str(a.version), a.architecture), a) for a in self.archives)
+        self.snapshot_mtime = mtime
+        return lookup_table
+
+    @mutable_property
+    def snapshot_mtime(self):
+        """
+        The last modified time of :attr:`directory` when :attr:`lookup_table` was computed (a number or :data:`None`).
+
+        Used by :func:`refresh()` to notice when archives were added to or
+        removed from the repository by other means.
+        """
+        return None
+
+    def get_directory_mtime(self):
+        """
+        Get the last modified time of :attr:`directory`.
+
+        :returns: A number (or :data:`None` when the directory doesn't exist).
+        """
+        try:
+            return os.stat(self.directory).st_mtime
+        except EnvironmentError:
+            return None
+
+    def refresh(self):
+        """
+        Discard :attr:`archives` and :attr:`lookup_table` when the repository changed.
+
+        The last modified time of :attr:`directory` is compared to
+        :attr:`snapshot_mtime`, so this costs a single :func:`os.stat()` call
+        when nothing changed. When something did change the values are
+        recomputed lazily (on next access).
+        """
+        if self.have_snapshot and self.get_directory_mtime() != self.snapshot_mtime:
+            logger.debug("Repository directory changed, refreshing lookup table: %s", self.directory)
+            self.discard_snapshot()
+
+    def discard_snapshot(self):
+        """Discard :attr:`archives` and :attr:`lookup_table` (they're recomputed on next use)."""
+        clear_property(self, 'archives')
+        clear_property(self, 'lookup_table')
+        self.snapshot_mtime = None
+
+
+class BuildDirectoryPool(object):
+
+    """
+    Pool of reusable build directories that are emptied in the background.
+
+    Removing the build directory of a large package (think scipy or numpy)
+    with :func:`shutil.rmtree()` can take seconds, especially on slow disks.
+    The pool hands out empty directories (see :func:`acquire()`) and when a
+    directory is given back (see :func:`release()`) a background thread
+    empties it, after which it can be handed out again. :func:`close()` waits
+    for the background thread and removes the directories.
+    """
+
+    def __init__(self, directory=None, prefix='py2deb-build-'):
+        """
+        Initialize a :class:`BuildDirectoryPool` object.
+
+        :param directory: The directory in which build directories are created
+                          (a string, defaults to the system wide temporary
+                          files directory).
+        :param prefix: The prefix for the names of build directories (a string).
+        """
+        self.directory = directory
+        self.prefix = prefix
+        self.free_directories = []
+        self.lock = threading.Lock()
+        self.pending_directories = queue.Queue()
+        self.thread = None
+
+    def acquire(self):
+        """
+        Get an empty build directory.
+
+        :returns: The pathname of an empty directory (a string).
+        """
+        with self.lock:
+            if self.free_directories:
+                directory = self.free_directories.pop()
+                logger.debug("Reusing build directory: %s", directory)
+                return directory
+        directory = tempfile.mkdtemp(prefix=self.prefix, dir=self.directory)
+        logger.debug("Created build directory: %s", directory)
+        return directory
+
+    def release(self, directory):
+        """
+        Give back a build directory so that it's emptied in the background.
+
+        :param directory: The pathname of a directory returned by :func:`acquire()`.
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.empty_directories)
+                self.thread.daemon = True
+                self.thread.start()
+        self.pending_directories.put(directory)
+
+    def empty_directories(self):
+        """Empty the directories passed to :func:`release()` (runs in a background thread)."""
+        while True:
+            directory = self.pending_directories.get()
+            if directory is None:
+                break
+            try:
+                empty_directory(directory)
+            except EnvironmentError as e:
+                logger.warning("Failed to empty build directory %s! (%s)", directory, e)
+                shutil.rmtree(directory, ignore_errors=True)
+            else:
+                with self.lock:
+                    self.free_directories.append(directory)
+
+    def close(self):
+        """Wait for the directories released so far to be emptied and remove all build directories."""
+        with self.lock:
+            thread = self.thread
+            self.thread = None
+        if thread is not None:
+            self.pending_directories.put(None)
+            thread.join()
+        with self.lock:
+            directories = self.free_directories
+            self.free_directories = []
+        for directory in directories:
+            logger.debug("Removing build directory: %s", directory)
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+class PathRewriter(object):
+
+    """
+    Rewrite the pathnames of files in binary distributions using a table of rules.
+
+    Wheels like botocore contain tens of thousands of files in a few hundred
+    directories. Instead of applying every rule to every pathname, the rules
+    are applied once to each directory prefix (the part of a pathname up to
+    and including the last slash) and the result is remembered, so that
+    rewriting a pathname in a known directory is a dictionary lookup.
+
+    Because only directory prefixes are rewritten, rules are expected to
+    match complete directory names that end in a slash (the base name of a
+    pathname is never passed to the rules).
+    """
+
+    def __init__(self, rules=()):
+        """
+        Initialize a :class:`PathRewriter` object.
+
+        :param rules: An iterable of tuples with two values each: A regular
+                      expression pattern (a string or compiled pattern) and a
+                      replacement (a string or callable, refer to
+                      :func:`re.sub()`). The rules are applied in the given
+                      order.
+        """
+        self.rules = []
+        self.prefixes = {}
+        for pattern, replacement in rules:
+            self.add_rule(pattern, replacement)
+
+    def add_rule(self, pattern, replacement):
+        """
+        Add a rule to the end of the table.
+
+        :param pattern: A regular expression pattern (a string or compiled pattern).
+        :param replacement: A string or callable (refer to :func:`re.sub()`).
+        :raises: :exc:`~exceptions.ValueError` when the pattern is not a
+                 valid regular expression.
+        """
+        try:
+            self.rules.append((re.compile(pattern), replacement))
+        except re.error as e:
+            raise ValueError("Invalid path rewrite pattern %r! (%s)" % (pattern, e))
+        self.prefixes.clear()
+
+    def rewrite(self, pathname):
+        """
+        Rewrite a pathname.
+
+        :param pathname: The pathname of a file or directory (a string).
+        :returns: The rewritten pathname (a string).
+        """
+        directory, separator, filename = pathname.rpartition('/')
+        if not separator:
+            return pathname
+        prefix = directory + separator
+        try:
+            return self.prefixes[prefix] + filename
+        except KeyError:
+            rewritten_prefix = prefix
+            for pattern, replacement in self.rules:
+                rewritten_prefix = pattern.sub(replacement, rewritten_prefix)
+            self.prefixes[prefix] = rewritten_prefix
+            return rewritten_prefix + filename
+
+
+class ChainedFile(io.RawIOBase):
+
+    """
+    Read only file-like object that returns some byte strings followed by the rest of a file.
+
+    Used by :func:`rewrite_script()` to replace the header of an executable
+    script and by :func:`.PackageToConvert.read_member()` to put back the
+    start of a file that was read to classify the file, without copying the
+    remainder of the file in memory.
+    """
+
+    def __init__(self, chunks, handle):
+        """
+        Initialize a :class:`ChainedFile` object.
+
+        :param chunks: A list of byte strings to return before the contents of `handle`.
+        :param handle: A file-like object that's read after `chunks` is exhausted.
+        """
+        self.chunks = collections.deque(c for c in chunks if c)
+        self.handle = handle
+
+    def readable(self):
+        """Enable reading (refer to :class:`io.RawIOBase`)."""
+        return True
+
+    def readall(self):
+        """Read the remaining contents at once (a byte string)."""
+        chunks, self.chunks = list(self.chunks), collections.deque()
+        return b''.join(chunks) + self.handle.read()
+
+    def readinto(self, buffer):
+        """Read the next chunk into a writable buffer (refer to :class:`io.RawIOBase`)."""
+        if self.chunks:
+            data = self.chunks.popleft()
+            if len(data) > len(buffer):
+                self.chunks.appendleft(data[len(buffer):])
+                data = data[:len(buffer)]
+        else:
+            data = self.handle.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
 
 
 class TemporaryDirectory(object):
@@ -163,6 +705,45 @@ class TemporaryDirectory(object):
         del self.temporary_directory
 
 
+def coerce_compression(value):
+    """
+    Validate a compression type for ``*.deb`` archives.
+
+    :param value: One of the strings in :data:`COMPRESSION_TYPES` (case
+                  insensitive) or :data:`None`.
+    :returns: A lowercased string or :data:`None`.
+    :raises: :exc:`~exceptions.ValueError` when the compression type isn't supported.
+    """
+    if value is None:
+        return None
+    value = value.lower()
+    if value not in COMPRESSION_TYPES:
+        msg = "Unsupported compression type! (%r, expected one of %s)"
+        raise ValueError(msg % (value, ', '.join(COMPRESSION_TYPES)))
+    return value
+
+
+def coerce_count(value, description):
+    """
+    Validate an optional non-negative integer.
+
+    :param value: A non-negative integer, a string containing one or :data:`None`.
+    :param description: What the value represents (a string, used in the error message).
+    :returns: An integer or :data:`None`.
+    :raises: :exc:`~exceptions.ValueError` when the value isn't a non-negative integer.
+    """
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+    if number < 0:
+        msg = "The %s should be a non-negative integer! (%r)"
+        raise ValueError(msg % (description, value))
+    return number
+
+
 def compact_repeating_words(words):
     """
     Remove adjacent repeating words.
@@ -197,6 +778,119 @@ def compact_repeating_words(words):
         last_word = word
 
 
+def compile_bytecode(sources, concurrency=None):
+    """
+    Compile Python modules to "unchecked hash" based bytecode files (concurrently).
+
+    :param sources: An iterable of tuples with two values each: The absolute
+                    pathname of a ``*.py`` file on the target system (a
+                    string) and the pathname of a copy of the file on the
+                    build host (a string).
+    :param concurrency: The maximum number of worker processes (a positive
+                        integer, defaults to the number of processors).
+    :returns: A list of tuples with two values each: The absolute pathname of
+              a bytecode file on the target system (a string) and the
+              pathname of the bytecode file on the build host (a string).
+
+    The ``*.py`` files are compiled by :func:`compile_bytecode_file()` (the
+    bytecode files are created next to the copies, in ``__pycache__``
+    directories) so the bytecode files use the cache tag of the running
+    interpreter. Because compilation holds the global interpreter lock a pool
+    of worker processes is used instead of threads, except in the (daemonic)
+    worker processes of :func:`.PackageConverter.build_packages()`, which
+    aren't allowed to create child processes. Modules that can't be compiled
+    are skipped (like the post-installation script does).
+    """
+    from importlib.util import cache_from_source
+    tasks = [(filename, pathname) for pathname, filename in sources]
+    if not tasks:
+        return []
+    concurrency = min(len(tasks), concurrency or multiprocessing.cpu_count())
+    if multiprocessing.current_process().daemon:
+        concurrency = 1
+    timer = Timer()
+    if concurrency > 1:
+        pool = multiprocessing.Pool(concurrency)
+        try:
+            results = pool.map(compile_bytecode_file, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [compile_bytecode_file(task) for task in tasks]
+    bytecode_files = [(cache_from_source(pathname), bytecode_file)
+                      for (filename, pathname), bytecode_file in zip(tasks, results)
+                      if bytecode_file]
+    logger.debug("Compiled %s using %s in %s.",
+                 pluralize(len(bytecode_files), "bytecode file"),
+                 pluralize(concurrency, "process", "processes"), timer)
+    return bytecode_files
+
+
+def compile_bytecode_file(task):
+    """
+    Compile a Python module to an "unchecked hash" based bytecode file.
+
+    :param task: A tuple with two strings: The pathname of a ``*.py`` file
+                 and the absolute pathname of the file on the target system
+                 (which is embedded in the bytecode, e.g. for tracebacks).
+    :returns: The pathname of the bytecode file (a string) or :data:`None`
+              when the module can't be compiled (a warning is logged).
+
+    Unchecked hash based bytecode files (see `PEP 552`_) remain valid
+    regardless of the last modified time of the ``*.py`` file, which makes
+    them suitable for inclusion in packages. This requires Python 3.7.
+
+    .. _PEP 552: https://www.python.org/dev/peps/pep-0552/
+    """
+    filename, pathname = task
+    try:
+        return py_compile.compile(filename, dfile=pathname, doraise=True,
+                                  invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+    except py_compile.PyCompileError as e:
+        logger.warning("Failed to compile %s to bytecode! (%s)", pathname, e.msg.strip())
+
+
+def describe_callable(value):
+    """
+    Generate a stable description of a callable (used to fingerprint conversion options).
+
+    :param value: A callable object or :data:`None`.
+    :returns: A string with the module name and name of the callable and (for
+              Python functions) a digest of the function's code (so that the
+              description changes when the code of the function changes).
+    """
+    if value is None:
+        return ''
+    description = '%s:%s' % (getattr(value, '__module__', None), getattr(value, '__name__', type(value).__name__))
+    code = getattr(value, '__code__', None)
+    if code is not None:
+        digest = hashlib.sha256()
+        hash_code_object(code, digest)
+        description += ' (%s)' % digest.hexdigest()
+    return description
+
+
+def hash_code_object(code, digest):
+    """
+    Update a digest based on a Python code object.
+
+    :param code: A code object.
+    :param digest: A :mod:`hashlib` object.
+
+    Nested code objects (e.g. for nested functions) are hashed recursively
+    because their :func:`repr()` contains a memory address.
+    """
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode('UTF-8'))
+    for value in code.co_consts:
+        if isinstance(value, types.CodeType):
+            hash_code_object(value, digest)
+        else:
+            digest.update(repr(value).encode('UTF-8'))
+
+
+@memoize
 def convert_package_name(python_package_name, name_prefix=None, extras=()):
     """
     Convert a Python package name to a Debian package name.
@@ -262,48 +956,33 @@ def detect_python_script(handle):
     return PYTHON_EXECUTABLE_PATTERN.match(program) is not None
 
 
-def embed_install_prefix(handle, install_prefix):
+def embed_install_prefix(handle, install_prefix, site_directory=False):
     """
     Embed Python snippet that adds custom installation prefix to module search path.
 
     :param handle: A file-like object containing an executable Python script.
     :param install_prefix: The pathname of the custom installation prefix (a string).
+    :param site_directory: :data:`True` to add the installation prefix as a
+                           site directory (refer to :func:`rewrite_script()`).
     :returns: A file-like object containing the modified Python script.
+
+    This is a shortcut for :func:`rewrite_script()`.
     """
-    # Make sure the first line of the file contains something that looks like a
-    # Python hashbang so we don't try to embed Python code in files like shell
-    # scripts :-).
-    if detect_python_script(handle):
-        lines = handle.readlines()
-        # We need to choose where to inject our line into the Python script.
-        # This is trickier than it might seem at first, because of conflicting
-        # concerns:
-        #
-        # 1) We want our line to be the first one to be executed so that any
-        #    later imports respect the custom installation prefix.
-        #
-        # 2) Our line cannot be the very first line because we would break the
-        #    hashbang of the script, without which it won't be executable.
-        #
-        # 3) Python has the somewhat obscure `from __future__ import ...'
-        #    statement which must precede all other statements.
-        #
-        # Our first step is to skip all comments, taking care of point two.
-        insertion_point = 0
-        while insertion_point < len(lines) and lines[insertion_point].startswith(b'#'):
-            insertion_point += 1
-        # The next step is to bump the insertion point if we find any `from
-        # __future__ import ...' statements.
-        for i, line in enumerate(lines):
-            if re.match(b'^\\s*from\\s+__future__\\s+import\\s+', line):
-                insertion_point = i + 1
-        lines.insert(insertion_point, ('import sys; sys.path.insert(0, %r)\n' % install_prefix).encode('UTF-8'))
-        # Turn the modified contents back into a file-like object.
-        handle = BytesIO(b''.join(lines))
-    else:
-        # Reset the file pointer of handle, so its contents can be read again later.
-        handle.seek(0)
-    return handle
+    return rewrite_script(handle, install_prefix=install_prefix, site_directory=site_directory)
+
+
+def empty_directory(directory):
+    """
+    Remove the contents of a directory (but not the directory itself).
+
+    :param directory: The pathname of a directory (a string).
+    """
+    for name in os.listdir(directory):
+        pathname = os.path.join(directory, name)
+        if os.path.isdir(pathname) and not os.path.islink(pathname):
+            shutil.rmtree(pathname)
+        else:
+            os.unlink(pathname)
 
 
 def extract_shebang_command(handle):
@@ -343,6 +1022,290 @@ def extract_shebang_program(command):
     return os.path.basename(tokens[0]) if tokens else ''
 
 
+def find_script_insertion_point(handle, lines):
+    """
+    Read the header of a Python script up to the point where a statement can be inserted.
+
+    :param handle: A file-like object positioned after the lines that were
+                   already read.
+    :param lines: A list with the lines that were already read (byte
+                  strings). Lines read from `handle` are appended to it.
+    :returns: The index in `lines` where a statement can be inserted (an integer).
+
+    We need to choose where to inject our line into the Python script. This
+    is trickier than it might seem at first, because of conflicting concerns:
+
+    1) We want our line to be the first one to be executed so that any later
+       imports respect the custom installation prefix.
+
+    2) Our line cannot be the very first line because we would break the
+       hashbang of the script, without which it won't be executable.
+
+    3) Python has the somewhat obscure `from __future__ import ...` statement
+       which must precede all other statements.
+
+    Because ``from __future__ import ...`` statements can only be preceded by
+    comments, blank lines and the module docstring, only those lines are
+    read (up to and including the first line that isn't one of those),
+    the rest of the script is never read.
+    """
+    delimiter = None
+    in_future_import = False
+    insertion_point = None
+    while True:
+        line = handle.readline()
+        if not line:
+            break
+        lines.append(line)
+        stripped = line.strip()
+        if delimiter:
+            # Skip the remainder of a multi line string.
+            if delimiter in stripped:
+                delimiter = None
+        elif in_future_import:
+            # Skip the remainder of a parenthesized import statement.
+            if b')' in stripped:
+                in_future_import = False
+                insertion_point = len(lines)
+        elif FUTURE_IMPORT_PATTERN.match(line):
+            if b'(' in line and b')' not in line:
+                in_future_import = True
+            else:
+                insertion_point = len(lines)
+        elif not stripped or stripped.startswith(b'#'):
+            continue
+        else:
+            match = STRING_LITERAL_PATTERN.match(stripped)
+            if not match:
+                break
+            quotes = match.group(1)
+            if len(quotes) == 3 and quotes not in stripped[match.end():]:
+                delimiter = quotes
+    if insertion_point is None:
+        # Skip all leading comments, taking care of point two.
+        insertion_point = 0
+        while insertion_point < len(lines) and lines[insertion_point].startswith(b'#'):
+            insertion_point += 1
+    return insertion_point
+
+
+def find_debug_files(object_files, debug_directory):
+    """
+    Find the debug files for the debugging information of object files.
+
+    :param object_files: A list of strings with filenames of object files.
+    :param debug_directory: The pathname of the directory where the debug
+                            files are stored (a string).
+    :returns: A dictionary with filenames of object files and the
+              corresponding debug files (strings). Object files without a
+              build ID are omitted and of the object files that share a build
+              ID (identical copies) only the first is included, so that each
+              debug file is created once.
+    """
+    debug_file_map = {}
+    build_ids = set()
+    for filename in object_files:
+        try:
+            build_id = inspect_elf_file(filename).build_id
+        except (EnvironmentError, ValueError):
+            build_id = None
+        if not build_id:
+            logger.debug("Not keeping debugging information of %s because it doesn't have a build ID.", filename)
+        elif build_id not in build_ids:
+            build_ids.add(build_id)
+            debug_file_map[filename] = os.path.join(debug_directory, build_id[:2], build_id[2:] + '.debug')
+    return debug_file_map
+
+
+def find_system_dependencies(object_files, architecture, cache=None, concurrency=None):
+    """
+    Find dependencies on system packages (using a cache).
+
+    :param object_files: An iterable of strings with filenames of object files.
+    :param architecture: The Debian architecture of the package (a string).
+    :param cache: A :class:`.DependencyCache` object or :data:`None`.
+    :param concurrency: The maximum number of object files to analyze
+                        concurrently (a positive integer, defaults to the
+                        number of processors).
+    :returns: A sorted list of strings in the format of the entries on the
+              ``Depends:`` line of a binary package control file.
+
+    Without a cache this is the same as :func:`deb_pkg_tools.package.find_system_dependencies()`.
+    With a cache the object files are identified by their SHA-256 digest and
+    only object files that aren't cached are analyzed (one by one, so that
+    the results can be cached per object file). Object files that don't
+    need any shared libraries (according to :func:`needs_shared_libraries()`)
+    aren't analyzed or cached at all. The results are combined using
+    :func:`merge_relationships()`.
+    """
+    object_files = list(object_files)
+    if not cache:
+        return deb_pkg_tools.package.find_system_dependencies(object_files)
+    timer = Timer()
+    relationships = []
+    missing = []
+    try:
+        linked_files = [fn for fn in object_files if needs_shared_libraries(fn)]
+        checksums = dict((filename, hash_files(filename)) for filename in linked_files)
+        for filename in linked_files:
+            cached = cache.get(checksums[filename], architecture)
+            if cached is None:
+                missing.append(filename)
+            else:
+                relationships.extend(cached)
+
+        def analyze(filename):
+            result = deb_pkg_tools.package.find_system_dependencies([filename])
+            cache.put(checksums[filename], architecture, result)
+            return result
+
+        if missing:
+            pool = ThreadPool(min(len(missing), concurrency or multiprocessing.cpu_count()))
+            try:
+                for result in pool.map(analyze, missing):
+                    relationships.extend(result)
+            finally:
+                pool.close()
+                pool.join()
+    except (EnvironmentError, sqlite3.Error) as e:
+        logger.warning("Failed to use dependency cache, analyzing all object files! (%s)", e)
+        return deb_pkg_tools.package.find_system_dependencies(object_files)
+    logger.debug("Found system dependencies of %s (%i cached, %i without shared libraries) in %s.",
+                 pluralize(len(object_files), "object file"),
+                 len(linked_files) - len(missing),
+                 len(object_files) - len(linked_files), timer)
+    return merge_relationships(relationships)
+
+
+def hash_directory(directory, exclude=()):
+    """
+    Calculate the SHA-256 digest of the files in a directory tree.
+
+    :param directory: The pathname of a directory (a string).
+    :param exclude: An iterable of directory names to skip (strings).
+    :returns: A hexadecimal digest (a string).
+
+    The relative pathnames, permissions and contents of the files are
+    included in the digest, the directory tree is walked in sorted order.
+    """
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if d not in exclude)
+        for filename in sorted(files):
+            pathname = os.path.join(root, filename)
+            relpath = os.path.relpath(pathname, directory)
+            digest.update(('%s\0%o\0' % (relpath, os.lstat(pathname).st_mode)).encode('UTF-8'))
+            if os.path.isfile(pathname) and not os.path.islink(pathname):
+                hash_file_contents(pathname, digest)
+    return digest.hexdigest()
+
+
+def hash_file_contents(filename, digest):
+    """
+    Update a digest with the contents of a file.
+
+    :param filename: The pathname of the file (a string).
+    :param digest: A :mod:`hashlib` object.
+    """
+    with open(filename, 'rb') as handle:
+        for block in iter(lambda: handle.read(1024 * 64), b''):
+            digest.update(block)
+
+
+def hash_files(*filenames):
+    """
+    Calculate the SHA-256 digest of the contents of one or more files.
+
+    :param filenames: The pathnames of the files (strings).
+    :returns: A hexadecimal digest (a string).
+    """
+    digest = hashlib.sha256()
+    for filename in filenames:
+        hash_file_contents(filename, digest)
+    return digest.hexdigest()
+
+
+def is_stripped(filename):
+    """
+    Check whether an object file has already been stripped.
+
+    :param filename: The pathname of an object file (a string).
+    :returns: :data:`True` if the object file doesn't contain a symbol table
+              or debugging information, :data:`False` otherwise (also when
+              the file can't be parsed, so that :man:`strip` gets a chance to
+              report the problem).
+    """
+    try:
+        return inspect_elf_file(filename).stripped
+    except (EnvironmentError, ValueError):
+        return False
+
+
+def link_or_copy(source, target):
+    """
+    Hard link or copy a file to a new location, atomically replacing any existing file.
+
+    :param source: The pathname of an existing file (a string).
+    :param target: The pathname of the new file (a string).
+    :returns: The value of `target`.
+
+    A hard link is created when possible, a copy is made when the source and
+    target are on different file systems.
+    """
+    if os.path.exists(target) and os.path.samefile(source, target):
+        return target
+    temporary_file = '%s.tmp-%i' % (target, os.getpid())
+    try:
+        os.link(source, temporary_file)
+    except OSError:
+        shutil.copy(source, temporary_file)
+    os.rename(temporary_file, target)
+    return target
+
+
+def merge_relationships(relationships):
+    """
+    Merge the system dependencies of multiple object files.
+
+    :param relationships: An iterable of strings with Debian package relationships.
+    :returns: A sorted list of unique relationships.
+
+    When multiple minimum versions (``>=``) of the same package are given only
+    the highest one is kept (like :man:`dpkg-shlibdeps` does when it analyzes
+    multiple object files at once). Unversioned relationships on packages
+    that also have a minimum version are redundant and are removed as well.
+    """
+    minimum_versions = {}
+    merged = set()
+    for relationship in relationships:
+        match = re.match(r'^(\S+) \(>= (\S+)\)$', relationship)
+        if match:
+            name, version = match.groups()
+            if name not in minimum_versions or Version(version) > Version(minimum_versions[name]):
+                minimum_versions[name] = version
+        else:
+            merged.add(relationship)
+    merged.difference_update(minimum_versions)
+    merged.update('%s (>= %s)' % (name, version) for name, version in minimum_versions.items())
+    return sorted(merged)
+
+
+def needs_shared_libraries(filename):
+    """
+    Check whether an object file needs shared libraries.
+
+    :param filename: The pathname of an object file (a string).
+    :returns: :data:`False` if the dynamic section of the object file doesn't
+              contain any ``DT_NEEDED`` entries, :data:`True` otherwise (also
+              when the file can't be parsed or the needed libraries are unknown).
+    """
+    try:
+        return inspect_elf_file(filename).needed != []
+    except (EnvironmentError, ValueError):
+        return True
+
+
+@memoize
 def normalize_package_name(python_package_name):
     """
     Normalize Python package name to be used as Debian package name.
@@ -364,6 +1327,7 @@ def normalize_package_name(python_package_name):
     return re.sub('[^a-z0-9]+', '-', python_package_name.lower()).strip('-')
 
 
+@memoize
 def normalize_package_version(python_package_version, prerelease_workaround=True):
     """
     Normalize Python package version to be used as Debian package version.
@@ -428,6 +1392,29 @@ def package_names_match(a, b):
     return normalize_package_name(a) == normalize_package_name(b)
 
 
+@contextlib.contextmanager
+def patched_environment(variables):
+    """
+    Temporarily set environment variables (a context manager).
+
+    :param variables: A dictionary with the names and values of the
+                      environment variables to set (strings).
+
+    Variables that didn't exist before are removed again afterwards, the
+    original values of other variables are restored.
+    """
+    original_values = dict((name, os.environ.get(name)) for name in variables)
+    os.environ.update(variables)
+    try:
+        yield
+    finally:
+        for name, value in original_values.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
 def python_version():
     """
     Find the version of Python we're running.
@@ -449,11 +1436,175 @@ def python_version():
     return python_version
 
 
+def strip_object_files(object_files, concurrency=None, debug_directory=None):
+    """
+    Use :man:`strip` to make object files smaller (concurrently).
+
+    :param object_files: An iterable of strings with filenames of object files.
+    :param concurrency: The maximum number of :man:`strip` processes to run
+                        concurrently (a positive integer, defaults to the
+                        number of processors).
+    :param debug_directory: The pathname of a directory where the debugging
+                            information removed from the object files should
+                            be kept (a string, optional).
+    :returns: A sorted list of strings with the filenames of the generated
+              debug files (empty when `debug_directory` isn't given).
+
+    This is a concurrent version of :func:`deb_pkg_tools.package.strip_object_files()`
+    with the same error handling: When the :man:`strip` program is not
+    installed a `debug` message is logged and no more object files are
+    stripped, when the :man:`strip` program fails a `warning` message is
+    logged. No exceptions are raised. The time spent stripping each object
+    file is logged at debug level.
+
+    Object files that don't contain a symbol table or debugging information
+    (according to :func:`.inspect_elf_file()`) are skipped because there's
+    nothing to strip.
+
+    When `debug_directory` is given the debugging information of each object
+    file is copied to a separate debug file (using :man:`objcopy`) before the
+    object file is stripped. The debug files use the layout expected by
+    debuggers like :man:`gdb`: ``<debug_directory>/xx/yyyy.debug`` where
+    ``xxyyyy`` is the build ID of the object file (see :func:`.inspect_elf_file()`).
+    Object files without a build ID are stripped without keeping their
+    debugging information and object files that share a build ID (identical
+    copies) share a single debug file. Failures of :man:`objcopy` are handled
+    in the same way as failures of :man:`strip` (without keeping the
+    debugging information), they never prevent an object file from being
+    stripped.
+    """
+    object_files = [fn for fn in object_files if not is_stripped(fn)]
+    debug_files = []
+    if not object_files:
+        return debug_files
+    concurrency = min(len(object_files), concurrency or multiprocessing.cpu_count())
+    debug_file_map = find_debug_files(object_files, debug_directory) if debug_directory else {}
+    objcopy_missing = threading.Event()
+    strip_missing = threading.Event()
+    timer = Timer()
+
+    def keep_debug_info(filename, debug_file):
+        if not objcopy_missing.is_set():
+            try:
+                os.makedirs(os.path.dirname(debug_file))
+            except OSError:
+                # Object files are stripped concurrently.
+                if not os.path.isdir(os.path.dirname(debug_file)):
+                    raise
+            try:
+                execute('objcopy', '--only-keep-debug', '--compress-debug-sections',
+                        filename, debug_file, logger=logger, silent=True)
+                debug_files.append(debug_file)
+            except CommandNotFound:
+                # Don't bother trying to keep any more debugging information.
+                if not objcopy_missing.is_set():
+                    objcopy_missing.set()
+                    logger.debug("Not keeping debugging information because 'objcopy' program isn't installed.")
+            except ExternalCommandFailed as e:
+                logger.warning("Failed to keep debugging information of object file: %s", e)
+                if os.path.isfile(debug_file):
+                    os.unlink(debug_file)
+
+    def strip(filename):
+        if not strip_missing.is_set():
+            file_timer = Timer()
+            if filename in debug_file_map:
+                keep_debug_info(filename, debug_file_map[filename])
+            try:
+                execute('strip', '--strip-unneeded', filename, logger=logger, silent=True)
+                logger.debug("Stripped %s in %s.", filename, file_timer)
+            except CommandNotFound:
+                # Don't bother trying to strip any more object files.
+                if not strip_missing.is_set():
+                    strip_missing.set()
+                    logger.debug("Not stripping object files because 'strip' program isn't installed.")
+            except ExternalCommandFailed as e:
+                logger.warning("Failed to strip object file: %s", e)
+
+    if concurrency > 1:
+        pool = ThreadPool(concurrency)
+        try:
+            pool.map(strip, object_files)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for filename in object_files:
+            strip(filename)
+    logger.debug("Stripped %s using %s in %s.",
+                 pluralize(len(object_files), "object file"),
+                 pluralize(concurrency, "process", "processes"), timer)
+    return sorted(debug_files)
+
+
+def rewrite_script(handle, interpreter=None, install_prefix=None, site_directory=False):
+    """
+    Update the shebang_ and/or embed a custom installation prefix in an executable Python script.
+
+    :param handle: A file-like object (assumed to contain an executable).
+    :param interpreter: The absolute pathname of the Python interpreter that
+                        should be referenced by the script (a string, optional).
+    :param install_prefix: The pathname of a custom installation prefix that
+                           should be added to the module search path (a
+                           string, optional).
+    :param site_directory: :data:`True` to add the installation prefix using
+                           :func:`site.addsitedir()`, so that the ``*.pth``
+                           files in the installation prefix are processed
+                           (e.g. those that reference zip bundles),
+                           :data:`False` otherwise. The new entries are moved
+                           to the start of the module search path, without
+                           leaving any names behind in the script.
+    :returns: A file-like object (a :class:`ChainedFile` wrapped in an
+              :class:`io.BufferedReader`).
+
+    The shebang_ is sniffed once (see :func:`extract_shebang_program()`) and
+    files that aren't executable Python scripts are passed through
+    unchanged. Only the header of the script is read here (the first line
+    and, to embed the installation prefix, the lines found by
+    :func:`find_script_insertion_point()`), the rest of `handle` is chained
+    through without copying, so the given `handle` doesn't need to be
+    seekable. The rest of the file is copied in chunks by the caller (see
+    :func:`.PackageToConvert.read_member()`).
+    """
+    magic = handle.read(2)
+    if magic != b'#!':
+        return io.BufferedReader(ChainedFile([magic], handle))
+    lines = [magic + handle.readline()]
+    try:
+        program = extract_shebang_program(lines[0][2:].decode('UTF-8').strip())
+    except UnicodeDecodeError:
+        program = ''
+    if PYTHON_EXECUTABLE_PATTERN.match(program):
+        if install_prefix:
+            insertion_point = find_script_insertion_point(handle, lines)
+            if site_directory:
+                # The snippet doesn't define any names in the script's namespace.
+                snippet = ("(lambda sys, path: (__import__('site').addsitedir(%r), sys.path.__setitem__("
+                           "slice(None), [p for p in sys.path if p not in path] + path)))"
+                           "(__import__('sys'), list(__import__('sys').path))\n")
+            else:
+                snippet = 'import sys; sys.path.insert(0, %r)\n'
+            lines.insert(insertion_point, (snippet % install_prefix).encode('UTF-8'))
+        if interpreter:
+            lines[0] = b'#!' + interpreter.encode('ascii') + b'\n'
+    return io.BufferedReader(ChainedFile(lines, handle))
+
+
 def tokenize_version(version_number):
     """
     Tokenize a string containing a version number.
 
     :param version_number: The string to tokenize.
     :returns: A list of strings.
+
+    The tokens are cached (in the :class:`LRUCache` available as the
+    ``cache`` attribute of this function) as a tuple, so each caller gets
+    its own list.
     """
-    return [t for t in integer_pattern.split(version_number) if t]
+    return list(tokenize_version.cache.lookup(version_number, lambda: tuple(
+        t for t in integer_pattern.split(version_number) if t
+    )))
+
+
+tokenize_version.cache = LRUCache('tokenize_version')
+TRANSFORMATION_CACHES.append(tokenize_version.cache)
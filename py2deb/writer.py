@@ -0,0 +1,652 @@
+# py2deb: Python to Debian package converter.
+#
+# Author: Peter Odding <peter.odding@paylogic.com>
+# Last Change: August 6, 2020
+# URL: https://py2deb.readthedocs.io
+
+"""
+The :mod:`py2deb.writer` module implements in process creation of ``*.deb`` archives.
+
+By default py2deb unpacks the files of a package into a build directory and
+runs ``dpkg-deb --build`` (using :func:`build_archive()`) which reads the
+directory tree again to create the ``data.tar`` member of the archive. The
+:class:`ArchiveWriter` class instead streams the files of a package straight
+into ``data.tar`` while computing the ``md5sums`` control file and the
+``Installed-Size`` field on the fly. Only files that need to be
+modified on disk (object files that are stripped) are written to the build
+directory.
+
+The format of the generated archives is described in :man:`deb`: An
+:man:`ar` archive containing the members ``debian-binary``, ``control.tar``
+and ``data.tar`` (the last two optionally compressed).
+"""
+
+# Standard library modules.
+import collections
+import fnmatch
+import functools
+import gzip
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import re
+import tarfile
+import tempfile
+import time
+from multiprocessing.pool import ThreadPool
+
+try:
+    # Python 3.3 and later.
+    import lzma
+except ImportError:
+    # Python 2.7.
+    lzma = None
+
+# External dependencies.
+from deb_pkg_tools.control import merge_control_fields
+from deb_pkg_tools.package import (
+    ALLOW_CHOWN,
+    ALLOW_FAKEROOT_OR_SUDO,
+    ALLOW_RESET_SETGID,
+    DIRECTORIES_TO_REMOVE,
+    FILES_TO_REMOVE,
+    ROOT_GROUP,
+    ROOT_USER,
+    clean_package_tree,
+    determine_package_archive,
+    update_conffiles,
+    update_installed_size,
+)
+from deb_pkg_tools.version import Version
+from executor import execute
+from humanfriendly import Timer, format_path, format_size
+from humanfriendly.text import pluralize
+from property_manager import PropertyManager, lazy_property, mutable_property, required_property
+
+# Modules included in our package.
+from py2deb.utils import hash_files
+
+# Initialize a logger.
+logger = logging.getLogger(__name__)
+
+COMPRESSION_EXTENSIONS = dict(gzip='.gz', none='')
+"""
+Mapping of compression types supported by :class:`ArchiveWriter` to filename extensions (a dictionary).
+
+The ``xz`` compression type is supported when the :mod:`lzma` module is
+available (it isn't on Python 2.7). The ``zstd`` compression type isn't
+supported because the Python standard library doesn't include a zstd
+compressor.
+"""
+
+if lzma is not None:
+    COMPRESSION_EXTENSIONS['xz'] = '.xz'
+
+DEFAULT_COMPRESSION = 'xz' if lzma is not None else 'gzip'
+"""The compression type used when none is configured (a string, ``xz`` matches ``dpkg-deb``)."""
+
+CHUNK_SIZE = 1024 * 1024
+"""The size of the chunks in which the contents of files are copied (an integer, 1 MiB)."""
+
+THREADS_MAX_VERSION = '1.21.9'
+"""The first version of dpkg whose ``dpkg-deb`` supports the ``--threads-max`` option (a string)."""
+
+
+class ArchiveWriter(PropertyManager):
+
+    """
+    Streaming writer for ``*.deb`` archives.
+
+    Files are added to the data archive using :func:`add_file()` and the
+    ``*.deb`` archive is created by :func:`create_archive()`. All files and
+    directories in the archive are owned by ``root``, the permission bits are
+    sanitized in the same way as :func:`deb_pkg_tools.package.build_package()`
+    does and files and directories that :func:`deb_pkg_tools.package.clean_package_tree()`
+    would remove are skipped.
+
+    For reproducible builds set :attr:`timestamp` to a fixed value and enable
+    :attr:`sort_members`, then identical input results in identical archives.
+    """
+
+    def __init__(self, directory, **options):
+        """
+        Initialize an :class:`ArchiveWriter` object.
+
+        :param directory: The pathname of a directory where temporary files
+                          can be stored (a string).
+        :param options: Any keyword arguments are used to set the values of
+                        the :attr:`compression`, :attr:`compression_level`,
+                        :attr:`sort_members` and :attr:`timestamp` properties.
+        """
+        super(ArchiveWriter, self).__init__(directory=directory, **options)
+
+    @lazy_property
+    def checksums(self):
+        """A dictionary with the absolute pathnames of the files in the archive and their MD5 digests."""
+        return collections.OrderedDict()
+
+    @mutable_property
+    def compression(self):
+        """The compression type of the ``control.tar`` and ``data.tar`` members (a string)."""
+        return DEFAULT_COMPRESSION
+
+    @mutable_property
+    def compression_level(self):
+        """The compression level (an integer or :data:`None` to use the default level)."""
+        return None
+
+    @lazy_property
+    def data_archive(self):
+        """The :class:`tarfile.TarFile` object used to write ``data.tar``."""
+        return tarfile.open(fileobj=self.data_stream, mode='w', format=tarfile.GNU_FORMAT)
+
+    @lazy_property
+    def data_file(self):
+        """The file object of the temporary file that contains ``data.tar``."""
+        return open(self.data_filename, 'wb')
+
+    @lazy_property
+    def data_filename(self):
+        """The pathname of the temporary file that contains ``data.tar`` (a string)."""
+        return os.path.join(self.directory, 'data.tar%s' % COMPRESSION_EXTENSIONS[self.compression])
+
+    @lazy_property
+    def data_stream(self):
+        """The (compressed) stream that :attr:`data_archive` writes to (a file object)."""
+        return open_compressed_stream(self.data_file, self.compression, self.compression_level)
+
+    @lazy_property
+    def directories(self):
+        """The set of absolute pathnames of the directories in the archive."""
+        return set()
+
+    @required_property
+    def directory(self):
+        """The pathname of the directory where temporary files are stored (a string)."""
+
+    @property
+    def installed_size(self):
+        """
+        The estimated disk space needed to install the package in kilobytes (an integer).
+
+        Every file is rounded up to a whole kilobyte and every directory is
+        counted as one kilobyte (like :man:`dpkg-gencontrol` does).
+        """
+        return sum((size + 1023) // 1024 for size in self.sizes.values()) + len(self.directories)
+
+    @lazy_property
+    def pending_members(self):
+        """
+        The members that :func:`close()` adds to the data archive when :attr:`sort_members` is enabled.
+
+        A list of tuples with two values each: A :class:`tarfile.TarInfo`
+        object and the offset of the contents of the member in
+        :attr:`spool_file` (an integer or :data:`None` for directories).
+        """
+        return []
+
+    @lazy_property
+    def sha256sums(self):
+        """A dictionary with the absolute pathnames of the files in the archive and their SHA-256 digests."""
+        return {}
+
+    @lazy_property
+    def sizes(self):
+        """A dictionary with the absolute pathnames of the files in the archive and their sizes."""
+        return {}
+
+    @mutable_property
+    def sort_members(self):
+        """
+        :data:`True` to sort the members of ``data.tar`` by pathname, :data:`False` otherwise (the default).
+
+        By default members are written in the order in which they're added.
+        When this is :data:`True` the contents of files are spooled to a
+        temporary file (see :attr:`spool_file`) and the members are written in
+        sorted order by :func:`close()`, like ``dpkg-deb --build`` does.
+        """
+        return False
+
+    @lazy_property
+    def spool_file(self):
+        """A temporary file that holds the contents of :attr:`pending_members` (a file object)."""
+        return tempfile.TemporaryFile(dir=self.directory)
+
+    @mutable_property(cached=True)
+    def timestamp(self):
+        """The last modified time of all members (an integer, defaults to the current time)."""
+        return int(time.time())
+
+    def add_file(self, pathname, contents, mode, force=False):
+        """
+        Add a file to the data archive.
+
+        :param pathname: The absolute pathname of the file on the target system (a string).
+        :param contents: The contents of the file (a byte string or a readable
+                         binary file object, which is copied in chunks of
+                         :data:`CHUNK_SIZE` bytes).
+        :param mode: The permission bits of the file (an integer).
+        :param force: :data:`True` to add the file even if it's excluded
+                      (e.g. bytecode files generated by py2deb), :data:`False`
+                      otherwise.
+        :returns: :data:`True` if the file was added, :data:`False` if it was
+                  skipped (see :func:`is_excluded()`).
+
+        Because the header of a member (which includes its size) precedes its
+        contents, a file object whose contents aren't spooled to
+        :attr:`spool_file` is copied to a temporary file first (which stays
+        in memory up to :data:`CHUNK_SIZE` bytes), so the size of the files
+        doesn't need to be known in advance.
+        """
+        if self.is_excluded(pathname) and not force:
+            logger.debug("Skipping excluded file: %s", pathname)
+            return False
+        self.add_directories(os.path.dirname(pathname))
+        if pathname.startswith('/etc/sudoers.d/'):
+            mode = 0o440
+        info = self.create_member(pathname, tarfile.REGTYPE, mode & ~0o022)
+        digests = hashlib.md5(), hashlib.sha256()
+        if self.sort_members:
+            offset = self.spool_file.tell()
+            info.size = copy_chunks(contents, self.spool_file, digests)
+            self.pending_members.append((info, offset))
+        elif isinstance(contents, bytes):
+            info.size = copy_chunks(contents, None, digests)
+            self.data_archive.addfile(info, io.BytesIO(contents))
+        else:
+            with tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE, dir=self.directory) as spool:
+                info.size = copy_chunks(contents, spool, digests)
+                spool.seek(0)
+                self.data_archive.addfile(info, spool)
+        self.checksums[pathname], self.sha256sums[pathname] = (d.hexdigest() for d in digests)
+        self.sizes[pathname] = info.size
+        return True
+
+    def add_directories(self, pathname):
+        """
+        Add a directory and its parent directories to the data archive.
+
+        :param pathname: The absolute pathname of a directory (a string).
+
+        Directories that were previously added are skipped.
+        """
+        if pathname not in self.directories:
+            if pathname != '/':
+                self.add_directories(os.path.dirname(pathname))
+            info = self.create_member(pathname, tarfile.DIRTYPE, 0o755)
+            if self.sort_members:
+                self.pending_members.append((info, None))
+            else:
+                self.data_archive.addfile(info)
+            self.directories.add(pathname)
+
+    def create_member(self, pathname, member_type, mode):
+        """
+        Create a :class:`tarfile.TarInfo` object for a member owned by ``root``.
+
+        :param pathname: The absolute pathname of the member (a string).
+        :param member_type: The type of the member (one of the constants in :mod:`tarfile`).
+        :param mode: The permission bits of the member (an integer).
+        :returns: A :class:`tarfile.TarInfo` object.
+        """
+        info = tarfile.TarInfo('.' + pathname if pathname != '/' else '.')
+        info.type = member_type
+        info.mode = mode
+        info.mtime = self.timestamp
+        info.uid = info.gid = 0
+        info.uname = info.gname = 'root'
+        return info
+
+    def create_archive(self, control_fields, maintainer_scripts, directory):
+        """
+        Create the ``*.deb`` archive.
+
+        :param control_fields: The control fields of the package (a
+                               :class:`deb_pkg_tools.deb822.Deb822` object).
+                               The ``Installed-Size`` field is added (using
+                               :func:`~deb_pkg_tools.control.merge_control_fields()`
+                               like :func:`~deb_pkg_tools.control.patch_control_file()`
+                               does, so the fields are normalized in the same way).
+        :param maintainer_scripts: A dictionary with the names and contents
+                                   (strings) of maintainer scripts.
+        :param directory: The pathname of the directory where the archive
+                          should be created (a string).
+        :returns: The pathname of the generated ``*.deb`` archive (a string).
+        """
+        timer = Timer()
+        control_fields = merge_control_fields(control_fields, {'Installed-Size': str(self.installed_size)})
+        filename = '%s_%s_%s.deb' % (control_fields['Package'], control_fields['Version'],
+                                     control_fields['Architecture'])
+        pathname = os.path.join(directory, filename)
+        logger.info("Building package %s (streaming) ..", pathname)
+        self.close()
+        control_archive = self.create_control_archive(control_fields, maintainer_scripts)
+        extension = COMPRESSION_EXTENSIONS[self.compression]
+        with open(pathname, 'wb') as handle:
+            handle.write(b'!<arch>\n')
+            self.write_member(handle, 'debian-binary', io.BytesIO(b'2.0\n'), 4)
+            self.write_member(handle, 'control.tar' + extension, io.BytesIO(control_archive), len(control_archive))
+            with open(self.data_filename, 'rb') as data_file:
+                self.write_member(handle, 'data.tar' + extension, data_file, os.path.getsize(self.data_filename))
+        os.unlink(self.data_filename)
+        logger.debug("Built %s (%s) in %s.", pathname, format_size(os.path.getsize(pathname)), timer)
+        return pathname
+
+    def create_control_archive(self, control_fields, maintainer_scripts):
+        """
+        Create the ``control.tar`` member of the archive.
+
+        :param control_fields: The control fields of the package (a
+                               :class:`deb_pkg_tools.deb822.Deb822` object).
+        :param maintainer_scripts: A dictionary with the names and contents
+                                   (strings) of maintainer scripts.
+        :returns: The compressed ``control.tar`` archive (a byte string).
+
+        Besides the ``control`` file and the maintainer scripts the archive
+        contains an ``md5sums`` file (like the archives built from a build
+        directory, see :func:`.write_md5sums()`) and, when the package
+        contains files in ``/etc``, a ``conffiles`` file that marks them as
+        configuration files (like :func:`deb_pkg_tools.package.update_conffiles()`
+        does for :func:`build_archive()`).
+        """
+        control_file = io.BytesIO()
+        control_fields.dump(control_file)
+        files = [('control', control_file.getvalue(), 0o644)]
+        files.append(('md5sums', ''.join(
+            '%s  %s\n' % (checksum, pathname.lstrip('/'))
+            for pathname, checksum in sorted(self.checksums.items())
+        ).encode('UTF-8'), 0o644))
+        conffiles = [pathname for pathname in sorted(self.checksums) if pathname.startswith('/etc/')]
+        if conffiles:
+            files.append(('conffiles', ''.join('%s\n' % p for p in conffiles).encode('UTF-8'), 0o644))
+        for name, contents in sorted(maintainer_scripts.items()):
+            files.append((name, contents.encode('UTF-8'), 0o755))
+        raw_file = io.BytesIO()
+        stream = open_compressed_stream(raw_file, self.compression, self.compression_level)
+        archive = tarfile.open(fileobj=stream, mode='w', format=tarfile.GNU_FORMAT)
+        archive.addfile(self.create_member('/', tarfile.DIRTYPE, 0o755))
+        for name, contents, mode in files:
+            info = self.create_member('/' + name, tarfile.REGTYPE, mode)
+            info.size = len(contents)
+            archive.addfile(info, io.BytesIO(contents))
+        archive.close()
+        if stream is not raw_file:
+            stream.close()
+        return raw_file.getvalue()
+
+    def close(self):
+        """Finish writing ``data.tar`` (this is called by :func:`create_archive()`)."""
+        if self.sort_members:
+            for info, offset in sorted(self.pending_members, key=lambda member: member[0].name):
+                if offset is None:
+                    self.data_archive.addfile(info)
+                else:
+                    self.spool_file.seek(offset)
+                    self.data_archive.addfile(info, self.spool_file)
+            self.spool_file.close()
+        self.data_archive.close()
+        if self.data_stream is not self.data_file:
+            self.data_stream.close()
+        self.data_file.close()
+
+    def is_excluded(self, pathname):
+        """
+        Check whether a file should be excluded from the archive.
+
+        :param pathname: The absolute pathname of a file (a string).
+        :returns: :data:`True` if the file or one of its parent directories
+                  matches the patterns used by
+                  :func:`deb_pkg_tools.package.clean_package_tree()`,
+                  :data:`False` otherwise.
+        """
+        components = pathname.strip('/').split('/')
+        if any(fnmatch.fnmatch(components[-1], p) for p in FILES_TO_REMOVE):
+            return True
+        return any(fnmatch.fnmatch(name, p) for name in components[:-1] for p in DIRECTORIES_TO_REMOVE)
+
+    def write_member(self, handle, name, member, size):
+        """
+        Write a member of the :man:`ar` archive.
+
+        :param handle: The file object of the ``*.deb`` archive.
+        :param name: The name of the member (a string).
+        :param member: A file object with the contents of the member.
+        :param size: The size of the member in bytes (an integer).
+        """
+        header = '%-16s%-12i%-6i%-6i%-8o%-10i`\n' % (name, self.timestamp, 0, 0, 0o100644, size)
+        handle.write(header.encode('ascii'))
+        while True:
+            chunk = member.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            handle.write(chunk)
+        if size % 2 == 1:
+            handle.write(b'\n')
+
+
+def copy_chunks(source, target, digests=()):
+    """
+    Copy the contents of a file in chunks while calculating digests.
+
+    :param source: A byte string or a readable binary file object (which is
+                   read in chunks of :data:`CHUNK_SIZE` bytes until the end
+                   of the file).
+    :param target: A writable binary file object or :data:`None` (to only
+                   calculate the digests).
+    :param digests: An iterable of :mod:`hashlib` objects that are updated
+                    with the contents of `source`.
+    :returns: The number of bytes copied (an integer).
+    """
+    if isinstance(source, bytes):
+        chunks = [source]
+    else:
+        chunks = iter(functools.partial(source.read, CHUNK_SIZE), b'')
+    size = 0
+    for chunk in chunks:
+        for digest in digests:
+            digest.update(chunk)
+        if target is not None:
+            target.write(chunk)
+        size += len(chunk)
+    return size
+
+
+def open_compressed_stream(handle, compression, level=None):
+    """
+    Wrap a file object in a compressor.
+
+    :param handle: A writable (binary) file object.
+    :param compression: One of the keys of :data:`COMPRESSION_EXTENSIONS`.
+    :param level: The compression level (an integer or :data:`None`).
+    :returns: A writable file object. When `compression` is ``none`` this is
+              `handle` itself, otherwise the caller is responsible for
+              closing the returned object (which doesn't close `handle`).
+    """
+    if compression == 'gzip':
+        return gzip.GzipFile(filename='', mode='wb', fileobj=handle, mtime=0,
+                             compresslevel=9 if level is None else level)
+    elif compression == 'xz':
+        return lzma.LZMAFile(handle, mode='wb', format=lzma.FORMAT_XZ,
+                             preset=6 if level is None else level)
+    return handle
+
+
+def build_archive(directory, repository=None, compression=None, level=None, threads=None,
+                  source_date_epoch=None, check_package=True):
+    """
+    Create a Debian package from a build directory using ``dpkg-deb --build``.
+
+    :param directory: The pathname of a directory tree suitable for packaging
+                      with ``dpkg-deb --build`` (modified in place).
+    :param repository: The pathname of the directory where the generated
+                       ``*.deb`` archive should be stored. By default a
+                       temporary directory is created, in this case the
+                       caller is responsible for cleaning up the directory.
+    :param compression: The compression type (a string or :data:`None`).
+    :param level: The compression level (an integer or :data:`None`).
+    :param threads: The maximum number of compressor threads (an integer or :data:`None`).
+    :param source_date_epoch: The timestamp of a reproducible build (a number
+                              or :data:`None`).
+    :param check_package: If :data:`True` (the default) the archive is checked
+                          using :func:`run_lintian()`.
+    :returns: The pathname of the generated ``*.deb`` archive.
+    :raises: :exc:`executor.ExternalCommandFailed` if any of the external
+             commands invoked by this function fail.
+
+    This prepares the directory tree the same way as
+    :func:`deb_pkg_tools.package.build_package()` (which doesn't support
+    compression options) and passes the compression options to ``dpkg-deb``
+    as command line options, which (unlike the ``$DPKG_DEB_*`` environment
+    variables) are also understood by older versions of dpkg. Options that
+    aren't set are omitted so that ``dpkg-deb`` uses its own defaults.
+
+    The timestamp is passed to ``dpkg-deb`` as ``$SOURCE_DATE_EPOCH`` in the
+    environment of the external command (instead of modifying
+    :data:`os.environ`) so that concurrent builds don't interfere.
+    """
+    if not repository:
+        repository = tempfile.mkdtemp(prefix='py2deb-build-')
+    package_file = os.path.join(repository, determine_package_archive(directory))
+    logger.debug("Preparing to build package: %s", format_path(package_file))
+    clean_package_tree(directory)
+    update_conffiles(directory)
+    update_installed_size(directory)
+    os.chmod(directory, 0o755)
+    if ALLOW_CHOWN:
+        execute('chown', '-R', '%s:%s' % (ROOT_USER, ROOT_GROUP), directory,
+                fakeroot=ALLOW_FAKEROOT_OR_SUDO, logger=logger)
+    for script_name in ('preinst', 'postinst', 'prerm', 'postrm'):
+        script_path = os.path.join(directory, 'DEBIAN', script_name)
+        if os.path.isfile(script_path):
+            os.chmod(script_path, 0o755)
+    execute('chmod', '-R', 'go-w', directory,
+            fakeroot=ALLOW_FAKEROOT_OR_SUDO, logger=logger)
+    if ALLOW_RESET_SETGID:
+        execute('find -type d -print0 | xargs -0 chmod g-s', directory=directory,
+                fakeroot=ALLOW_FAKEROOT_OR_SUDO, logger=logger)
+    sudoers_directory = os.path.join(directory, 'etc', 'sudoers.d')
+    if os.path.isdir(sudoers_directory):
+        for filename in os.listdir(sudoers_directory):
+            os.chmod(os.path.join(sudoers_directory, filename), 0o440)
+    command = ['dpkg-deb']
+    if compression is not None:
+        command.append('-Z%s' % compression)
+    if level is not None and compression != 'none':
+        command.append('-z%i' % level)
+    if threads is not None:
+        if get_dpkg_deb_version() >= Version(THREADS_MAX_VERSION):
+            command.append('--threads-max=%i' % threads)
+        else:
+            logger.warning("Ignoring compression threads (dpkg-deb %s doesn't support --threads-max, %s is required).",
+                           get_dpkg_deb_version(), THREADS_MAX_VERSION)
+    command.extend(['--build', directory, package_file])
+    environment = {}
+    if source_date_epoch is not None:
+        environment['SOURCE_DATE_EPOCH'] = str(int(source_date_epoch))
+    logger.info("Building package in %s ..", format_path(directory))
+    execute(*command, environment=environment, fakeroot=ALLOW_FAKEROOT_OR_SUDO, logger=logger)
+    if check_package:
+        run_lintian(package_file)
+    return package_file
+
+
+def get_dpkg_deb_version():
+    """
+    Find the version of ``dpkg-deb``.
+
+    :returns: A :class:`~deb_pkg_tools.version.Version` object (the result
+              is cached because it doesn't change while py2deb is running).
+    """
+    if get_dpkg_deb_version.result is None:
+        output = execute('dpkg-deb', '--version', capture=True, logger=logger)
+        match = re.search(r'version (\S+)', output)
+        get_dpkg_deb_version.result = Version(match.group(1) if match else '0')
+    return get_dpkg_deb_version.result
+
+
+get_dpkg_deb_version.result = None
+
+
+def run_lintian(archive):
+    """
+    Check a package archive for issues using Lintian_.
+
+    :param archive: The pathname of a ``*.deb`` archive (a string).
+
+    This is the same check that :func:`deb_pkg_tools.package.build_package()`
+    performs: The result is purely informational.
+    """
+    if not os.access('/usr/bin/lintian', os.X_OK):
+        logger.warning("Lintian is not installed, skipping sanity check.")
+    else:
+        logger.info("Checking package for issues using Lintian ..")
+        lintian_command = ['lintian']
+        if os.getuid() == 0:
+            lintian_command.append('--allow-root')
+        lintian_command.append('--color=auto')
+        lintian_command.append(archive)
+        execute(*lintian_command, logger=logger, check=False)
+
+
+def run_lintian_batch(archives, ignore=(), cache=None, concurrency=None):
+    """
+    Check package archives for issues using Lintian_ (concurrently).
+
+    :param archives: An iterable of strings with pathnames of ``*.deb`` archives.
+    :param ignore: An iterable of strings with Lintian tags to suppress.
+    :param cache: A :class:`.LintianCache` object or :data:`None`.
+    :param concurrency: The maximum number of Lintian processes to run
+                        concurrently (a positive integer, defaults to the
+                        number of processors).
+
+    This is an out-of-band alternative to :func:`run_lintian()` that checks
+    archives after all of them have been built. The output of each Lintian
+    process is captured and logged when the process finishes (so that the
+    reports of concurrent checks aren't interleaved). When a cache is given
+    reports are cached under the SHA-256 digest of the archive, the Lintian
+    version and the suppressed tags, so checking an unchanged archive again
+    is free. Like :func:`run_lintian()` the result is purely informational.
+    """
+    archives = sorted(set(archives))
+    if not archives:
+        return
+    if not os.access('/usr/bin/lintian', os.X_OK):
+        logger.warning("Lintian is not installed, skipping sanity check.")
+        return
+    timer = Timer()
+    lintian_command = ['lintian']
+    if os.getuid() == 0:
+        lintian_command.append('--allow-root')
+    if ignore:
+        lintian_command.append('--suppress-tags=%s' % ','.join(sorted(ignore)))
+    lintian_version = execute('lintian', '--version', capture=True, check=False, logger=logger) or ''
+    cache_hits = []
+    logger.info("Checking %s for issues using Lintian ..", pluralize(len(archives), "package"))
+
+    def check(archive):
+        key = hashlib.sha256(b'\0'.join(
+            value.encode('UTF-8') for value in [hash_files(archive), lintian_version] + lintian_command
+        )).hexdigest()
+        report = cache.get(key) if cache else None
+        if report is None:
+            report = execute(*(lintian_command + [archive]), capture=True, check=False,
+                             merge_streams=True, logger=logger) or ''
+            if cache:
+                cache.put(key, report)
+        else:
+            cache_hits.append(archive)
+        if report.strip():
+            logger.info("Lintian reported issues in %s:\n%s", os.path.basename(archive), report.rstrip())
+        else:
+            logger.info("Lintian didn't report any issues in %s.", os.path.basename(archive))
+
+    pool = ThreadPool(min(len(archives), concurrency or multiprocessing.cpu_count()))
+    try:
+        pool.map(check, archives)
+    finally:
+        pool.close()
+        pool.join()
+    logger.info("Checked %s using Lintian (%i cached) in %s.",
+                pluralize(len(archives), "package"), len(cache_hits), timer)